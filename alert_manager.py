@@ -1,26 +1,51 @@
 import os
+import queue
+import threading
 import time
 
 import cv2
 
+from metrics import JPEG_ENCODE
+
 
 class AlertManager:
     """
     Xử lý phần cảnh báo:
     - Vẽ banner đỏ trên khung hình.
-    - Lưu ảnh khi phát hiện người, nhưng giãn cách thời gian cho đỡ spam.
+    - Chụp ảnh khi phát hiện người, nhưng giãn cách thời gian cho đỡ spam.
+      Ảnh được encode JPEG 1 lần trong RAM (để gửi Telegram luôn),
+      việc ghi ra đĩa tuỳ save_mode.
     """
 
-    def __init__(self, output_dir: str = "alerts", min_interval: float = 3.0):
+    def __init__(
+        self,
+        output_dir: str = "alerts",
+        min_interval: float = 3.0,
+        save_mode: str = "async",
+        jpeg_quality: int = 95,
+    ):
         """
         output_dir: thư mục lưu ảnh cảnh báo.
         min_interval: tối thiểu bao nhiêu giây mới lưu 1 ảnh.
+        save_mode: "async" (thread nền ghi đĩa), "sync" (ghi ngay), "never" (không ghi,
+                   hợp với thiết bị thẻ SD).
         """
+        if save_mode not in ("async", "sync", "never"):
+            raise ValueError(f"save_mode không hợp lệ: {save_mode}")
+
         self.output_dir = output_dir
         self.min_interval = min_interval
+        self.save_mode = save_mode
+        self.jpeg_quality = jpeg_quality
         self._last_save_time = 0.0
+        self._seq = 0
 
-        os.makedirs(self.output_dir, exist_ok=True)
+        self._write_queue = None
+        if save_mode != "never":
+            os.makedirs(self.output_dir, exist_ok=True)
+        if save_mode == "async":
+            self._write_queue = queue.Queue(maxsize=16)
+            threading.Thread(target=self._write_loop, daemon=True).start()
 
     @staticmethod
     def draw_banner(frame, text: str = "INTRUDER DETECTED"):
@@ -40,14 +65,74 @@ class AlertManager:
             lineType=cv2.LINE_AA,
         )
 
-    def maybe_save_frame(self, frame):
-        """Lưu frame nếu đã qua đủ min_interval giây."""
+    def encode(self, frame) -> bytes | None:
+        with JPEG_ENCODE.labels("alert").time():
+            ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        return buffer.tobytes() if ok else None
+
+    def maybe_capture(self, frame):
+        """
+        Nếu đã qua đủ min_interval giây: encode frame thành JPEG (bytes) và ghi đĩa theo save_mode.
+        Trả về (jpeg_bytes, path) – path là None khi save_mode="never"; chưa tới lượt -> None.
+        """
         now = time.time()
         if now - self._last_save_time < self.min_interval:
             return None
+        captured = self.capture(frame, now)
+        if captured is not None:
+            self._last_save_time = now
+        return captured
+
+    def capture(self, frame, now: float | None = None):
+        """
+        Như maybe_capture nhưng không xét min_interval (AlertPolicy đã quyết định giãn cách).
+        Trả về (jpeg_bytes, path) hoặc None nếu encode lỗi.
+        """
+        now = time.time() if now is None else now
+        jpeg = self.encode(frame)
+        if jpeg is None:
+            return None
+
+        if self.save_mode == "never":
+            return jpeg, None
+
+        filename = self._filename(now)
+        if self.save_mode == "sync":
+            self._write(filename, jpeg)
+        else:
+            try:
+                self._write_queue.put_nowait((filename, jpeg))
+            except queue.Full:
+                print("[AlertManager] Hàng đợi ghi đĩa đầy, bỏ qua:", filename)
+                return jpeg, None
+        return jpeg, filename
+
+    def _filename(self, now: float) -> str:
+        """
+        alerts/<ngày>/alert_<giờ>_<ms>.jpg – có mili giây + số thứ tự nên 2 ảnh
+        cùng 1 giây không đè nhau, chia thư mục theo ngày cho khỏi 1 thư mục quá nhiều file.
+        """
+        day = time.strftime("%Y%m%d", time.localtime(now))
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(now)) + f"_{int(now * 1000) % 1000:03d}"
+        self._seq += 1
+        # thư mục ngày được tạo lúc ghi (_write), async thì ở thread ghi đĩa chứ không ở pipeline
+        return os.path.join(self.output_dir, day, f"alert_{stamp}_{self._seq:04d}.jpg")
+
+    def maybe_save_frame(self, frame):
+        """Lưu frame nếu đã qua đủ min_interval giây, trả về đường dẫn file (hoặc None)."""
+        captured = self.maybe_capture(frame)
+        return captured[1] if captured is not None else None
+
+    @staticmethod
+    def _write(filename, data: bytes):
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename, "wb") as f:
+                f.write(data)
+        except OSError as e:
+            print("[AlertManager] Lỗi ghi ảnh:", filename, e)
 
-        timestamp = time.strftime("%Y%m%d_%H%M%S")
-        filename = os.path.join(self.output_dir, f"alert_{timestamp}.jpg")
-        cv2.imwrite(filename, frame)
-        self._last_save_time = now
-        return filename
+    def _write_loop(self):
+        while True:
+            filename, data = self._write_queue.get()
+            self._write(filename, data)
@@ -0,0 +1,165 @@
+import time
+
+from metrics import Counter
+
+ALERTS_SUPPRESSED = Counter(
+    "alerts_suppressed_total", "Cảnh báo bị AlertPolicy bỏ (không encode / ghi đĩa / gửi)", ["camera", "reason"]
+)
+
+# Thứ tự leo thang cho mỗi người (track): ảnh -> clip -> gom digest
+LEVELS = ("photo", "clip", "digest")
+
+# Cấu hình mặc định, ghi đè bằng khoá "alert_policy" của từng camera trong cameras.json
+DEFAULT_POLICY = {
+    "camera_cooldown": 8.0,       # 2 lần cảnh báo của cùng camera cách nhau tối thiểu (giây)
+    "clip_after": 30.0,           # người lạ còn ở đó sau bấy nhiêu giây -> ghi tiếp clip (clip đầu ghi từ lúc "photo")
+    "repeat_interval": 60.0,      # sau đó cứ bấy nhiêu giây gom 1 ảnh vào digest
+    "identity_cooldown": 300.0,   # cùng 1 tên (track mới của người cũ) không báo lại trong bấy nhiêu giây
+    "forget_after": 30.0,         # track biến mất bấy nhiêu giây thì quên state
+    "suppress_known": True,       # có người quen trong khung -> không báo người "chỉ thấy body"
+    "quiet_hours": [],            # vd ["23:00-06:00"]: vẫn lưu ảnh / sự kiện / clip nhưng không gửi Telegram
+}
+
+
+def parse_quiet_hours(spans):
+    """["23:00-06:00", ...] -> [(phút bắt đầu, phút kết thúc), ...] tính từ 0h."""
+    out = []
+    for span in spans or ():
+        try:
+            start, end = span.split("-")
+            sh, sm = (int(v) for v in start.strip().split(":"))
+            eh, em = (int(v) for v in end.strip().split(":"))
+        except ValueError:
+            raise ValueError(f"quiet_hours không hợp lệ: {span!r} (dạng HH:MM-HH:MM)") from None
+        out.append((sh * 60 + sm, eh * 60 + em))
+    return out
+
+
+class AlertPolicy:
+    """
+    Quyết định khi nào 1 cảnh báo thật sự được phát ra, thay cho min_interval chung của AlertManager:
+    - dedup theo track (mỗi người chỉ 1 ảnh cho mỗi mức, kể cả khi "body" sau đó thấy rõ mặt lạ),
+      theo tên (track mới của cùng 1 người) và theo camera (camera_cooldown);
+    - leo thang: lần đầu thấy -> "photo" (gửi ngay), còn ở đó sau clip_after giây -> "clip",
+      sau đó mỗi repeat_interval giây -> "digest" (gom album);
+    - quiet_hours: không gửi, chỉ lưu; suppress_known: có người quen thì bỏ cảnh báo "body".
+    Chỉ là tính toán trên vài dict, không đụng tới frame -> gọi ở stage "alert" của IntruderProcessor.
+    """
+
+    def __init__(
+        self,
+        camera_cooldown: float = 8.0,
+        clip_after: float = 30.0,
+        repeat_interval: float = 60.0,
+        identity_cooldown: float = 300.0,
+        forget_after: float = 30.0,
+        suppress_known: bool = True,
+        quiet_hours=(),
+        name: str = "",
+    ):
+        self.camera_cooldown = camera_cooldown
+        self.clip_after = clip_after
+        self.repeat_interval = repeat_interval
+        self.identity_cooldown = identity_cooldown
+        self.forget_after = forget_after
+        self.suppress_known = suppress_known
+        self.quiet_hours = parse_quiet_hours(quiet_hours)
+        self.name = name
+
+        self._subjects = {}      # key -> {"kind", "first", "seen", "last", "level"}
+        self._identities = {}    # tên -> lần cuối báo
+        self._last_alert = 0.0
+
+    @classmethod
+    def from_config(cls, config=None, name: str = ""):
+        """config: dict ghi đè DEFAULT_POLICY (khoá lạ -> lỗi để bắt lỗi gõ sai trong cameras.json)."""
+        merged = {**DEFAULT_POLICY, **(config or {})}
+        unknown = set(merged) - set(DEFAULT_POLICY)
+        if unknown:
+            raise ValueError(f"Khoá alert_policy không hợp lệ: {', '.join(sorted(unknown))}")
+        return cls(**merged, name=name)
+
+    def is_quiet(self, now: float) -> bool:
+        if not self.quiet_hours:
+            return False
+        t = time.localtime(now)
+        minute = t.tm_hour * 60 + t.tm_min
+        for start, end in self.quiet_hours:
+            if start <= end:
+                if start <= minute < end:
+                    return True
+            elif minute >= start or minute < end:   # qua nửa đêm
+                return True
+        return False
+
+    def _suppress(self, reason: str, n: int = 1):
+        ALERTS_SUPPRESSED.labels(self.name, reason).inc(n)
+
+    def _due_level(self, state, now: float):
+        """Mức cần phát cho 1 người ở thời điểm now, None = đã báo đủ."""
+        level = state["level"]
+        if level is None:
+            return "photo"
+        if level == "photo":
+            return "clip" if now - state["first"] >= self.clip_after else None
+        return "digest" if now - state["last"] >= self.repeat_interval else None
+
+    def evaluate(self, candidates, now: float | None = None):
+        """
+        candidates: list dict {"key", "kind" ("unknown" / "body" / "known"), "track_id", "name", "box", "confidence"}
+        cho các người đang thấy ở frame này ("name" chỉ có với người quen). Trả về None hoặc 1 quyết định:
+        {"level", "kind", "subjects": [candidate...], "notify": bool}.
+        """
+        now = time.time() if now is None else now
+
+        # quên các track đã rời khung đủ lâu
+        for key in [k for k, s in self._subjects.items() if now - s["seen"] > self.forget_after]:
+            del self._subjects[key]
+
+        if self.suppress_known and any(c["kind"] == "known" for c in candidates):
+            body = [c for c in candidates if c["kind"] == "body"]
+            if body:
+                self._suppress("known", len(body))
+            candidates = [c for c in candidates if c["kind"] == "unknown"]
+
+        due = []
+        for c in candidates:
+            state = self._subjects.get(c["key"])
+            if state is not None and state["kind"] == "body" and c["kind"] == "unknown":
+                # "body" giờ đã thấy mặt lạ: cùng 1 người, giữ mức đã báo (không gửi ảnh lần 2)
+                state["kind"] = "unknown"
+            if state is None:
+                state = {"kind": c["kind"], "first": now, "seen": now, "last": 0.0, "level": None}
+                self._subjects[c["key"]] = state
+                name = c.get("name")
+                if name and name in self._identities and now - self._identities[name] < self.identity_cooldown:
+                    state["level"] = "photo"      # tên này vừa báo, coi như đã gửi ảnh
+                    state["last"] = now
+                    self._suppress("identity")
+            state["seen"] = now
+            level = self._due_level(state, now)
+            if level is not None:
+                due.append((c, state, level))
+
+        if not due:
+            return None
+        if now - self._last_alert < self.camera_cooldown:
+            # chưa cập nhật state -> frame sau hết cooldown vẫn còn "due"
+            self._suppress("cooldown")
+            return None
+
+        # người mới (photo) quan trọng hơn clip, clip hơn digest
+        level = min((lvl for _, _, lvl in due), key=LEVELS.index)
+        for c, state, lvl in due:
+            state["level"] = lvl
+            state["last"] = now
+            if c.get("name"):
+                self._identities[c["name"]] = now
+        self._last_alert = now
+
+        subjects = [c for c, _, _ in due]
+        kind = "unknown" if any(c["kind"] == "unknown" for c in subjects) else subjects[0]["kind"]
+        notify = not self.is_quiet(now)
+        if not notify:
+            self._suppress("quiet")
+        return {"level": level, "kind": kind, "subjects": subjects, "notify": notify}
@@ -0,0 +1,268 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qsl
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from broadcaster import AdaptiveQuality, encode_variant, parse_stream_args
+from metrics import CONTENT_TYPE, REGISTRY
+
+# Chế độ server bất đồng bộ (ASGI) cho dashboard + MJPEG:
+# mỗi người xem là 1 coroutine thay vì 1 thread như Flask dev server.
+# Chạy: python asgi_app.py   (cần `pip install uvicorn`)
+
+BOUNDARY = b"frame"
+
+
+class AsyncFanout:
+    """
+    Cầu nối FrameBroadcaster (thread) -> asyncio:
+    1 thread duy nhất đọc broadcaster.subscribe() rồi báo cho event loop,
+    các coroutine client chờ trên asyncio.Event, không chiếm thread nào.
+    """
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+        self.latest = None
+        self.seq = 0
+        self.last_frame_time = 0.0
+        self.clients = 0
+
+        self._loop = None
+        self._event = None
+        self._thread = None
+
+    @property
+    def started(self) -> bool:
+        return self._thread is not None
+
+    def start(self, loop):
+        if self._thread is not None:
+            return
+        self._loop = loop
+        self._event = asyncio.Event()
+        self._thread = threading.Thread(target=self._bridge, daemon=True)
+        self._thread.start()
+
+    def _bridge(self):
+        while True:
+            # không gửi lại frame cũ: last_frame_time phải phản ánh frame thật
+            for item in self.broadcaster.subscribe(resend=False):
+                self._loop.call_soon_threadsafe(self._publish, item)
+            # producer dừng -> thử lại
+            time.sleep(0.5)
+
+    def _publish(self, item):
+        self.latest = item
+        self.seq += 1
+        self.last_frame_time = time.time()
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    async def wait_next(self, last_seq: int, timeout: float = 5.0):
+        """Chờ frame có seq mới hơn last_seq. Trả về (seq, item) hoặc None nếu quá timeout."""
+        if self.seq == last_seq:
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.seq, self.latest
+
+
+class ASGIApp:
+    """
+    App ASGI viết tay (không cần framework), các route:
+    /              dashboard (templates/index.html, dùng lại của Flask)
+    /video_feed[/<camera_id>]   MJPEG, query giống bản Flask: size, q, fps
+    /api/status    JSON trạng thái hệ thống (từng camera)
+    /metrics       metrics dạng text Prometheus
+    /healthz       200 nếu mọi camera đang xem có frame chưa quá cũ, ngược lại 503
+    broadcasters: {camera_id: FrameBroadcaster}, camera đầu tiên là mặc định.
+    """
+
+    def __init__(self, broadcasters: dict, templates_dir: str = "templates", stale_after: float = 5.0):
+        self.fanouts = {cid: AsyncFanout(b) for cid, b in broadcasters.items()}
+        self.default_id = next(iter(self.fanouts))
+        self.stale_after = stale_after
+        self.started_at = time.time()
+        self.templates = Environment(
+            loader=FileSystemLoader(templates_dir),
+            autoescape=select_autoescape(["html"]),
+        )
+        self.routes = {
+            "/": self.index,
+            "/video_feed": self.video_feed,
+            "/api/status": self.status,
+            "/healthz": self.healthz,
+            "/metrics": self.metrics,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        path = scope["path"]
+        camera_id = None
+        if path.startswith("/video_feed/"):
+            path, camera_id = "/video_feed", path[len("/video_feed/"):]
+        handler = self.routes.get(path)
+        if camera_id is not None and camera_id not in self.fanouts:
+            handler = None
+        if handler is None or scope["method"] not in ("GET", "HEAD"):
+            await self._send_body(send, 404, b"Not Found", "text/plain; charset=utf-8")
+            return
+        if camera_id is not None:
+            scope = {**scope, "camera_id": camera_id}
+        await handler(scope, receive, send)
+
+    @staticmethod
+    async def _lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _send_body(send, status: int, body: bytes, content_type: str):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", content_type.encode()),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _send_json(self, send, data, status: int = 200):
+        body = json.dumps(data, ensure_ascii=False).encode()
+        await self._send_body(send, status, body, "application/json")
+
+    # ======== ROUTES ========
+    async def index(self, scope, receive, send):
+        client = scope.get("client") or (None, None)
+        request = {"remote_addr": client[0]}
+        html = self.templates.get_template("index.html").render(
+            url_for=lambda endpoint: "/" + endpoint,
+            request=request,
+        )
+        await self._send_body(send, 200, html.encode(), "text/html; charset=utf-8")
+
+    async def status(self, scope, receive, send):
+        cameras = {}
+        for cid, fanout in self.fanouts.items():
+            item = fanout.latest or {}
+            cameras[cid] = {
+                "viewers": fanout.clients,
+                "frames": fanout.seq,
+                "status_text": item.get("status_text"),
+                "intruder_tracks": item.get("intruder_tracks", []),
+                "last_frame_age": self._frame_age(fanout),
+            }
+        await self._send_json(send, {
+            "cameras": cameras,
+            "uptime": round(time.time() - self.started_at, 1),
+        })
+
+    async def metrics(self, scope, receive, send):
+        await self._send_body(send, 200, REGISTRY.render().encode(), CONTENT_TYPE)
+
+    async def healthz(self, scope, receive, send):
+        # chỉ xét camera đã chạy (đã có người xem); chưa camera nào chạy -> chưa healthy
+        ages = {cid: self._frame_age(f) for cid, f in self.fanouts.items() if f.started}
+        ok = bool(ages) and all(a is not None and a <= self.stale_after for a in ages.values())
+        await self._send_json(send, {"ok": ok, "last_frame_age": ages}, status=200 if ok else 503)
+
+    @staticmethod
+    def _frame_age(fanout):
+        if not fanout.last_frame_time:
+            return None
+        return round(time.time() - fanout.last_frame_time, 3)
+
+    async def video_feed(self, scope, receive, send):
+        args = dict(parse_qsl(scope.get("query_string", b"").decode()))
+        width, quality, max_fps = parse_stream_args(args)
+        rate = AdaptiveQuality(quality=quality, max_fps=max_fps)
+        loop = asyncio.get_running_loop()
+        fanout = self.fanouts[scope.get("camera_id") or self.default_id]
+        fanout.start(loop)
+
+        # client đóng tab -> http.disconnect
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    return
+
+        watcher = asyncio.create_task(watch_disconnect())
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"multipart/x-mixed-replace; boundary=" + BOUNDARY),
+                (b"cache-control", b"no-cache"),
+            ],
+        })
+
+        fanout.clients += 1
+        last_seq = fanout.seq
+        try:
+            while not disconnected.is_set():
+                got = await fanout.wait_next(last_seq)
+                if got is None:
+                    continue
+                last_seq, item = got
+
+                # encode (có cache) chạy trong thread pool để không chặn event loop
+                jpeg = await loop.run_in_executor(None, encode_variant, item, width, rate.quality)
+                if jpeg is None:
+                    continue
+
+                start = time.monotonic()
+                await send({
+                    "type": "http.response.body",
+                    "body": b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\n\r\n" + jpeg + b"\r\n",
+                    "more_body": True,
+                })
+                # send chờ khi buffer socket đầy -> đo được backpressure
+                sent = time.monotonic()
+                rate.record(sent - start)
+                delay = start + rate.interval - sent
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        except OSError:
+            pass
+        finally:
+            fanout.clients -= 1
+            watcher.cancel()
+
+
+def create_app(broadcasters, templates_dir: str | None = None):
+    """broadcasters: 1 FrameBroadcaster hoặc dict {camera_id: FrameBroadcaster}."""
+    if not isinstance(broadcasters, dict):
+        broadcasters = {"cam0": broadcasters}
+    if templates_dir is None:
+        templates_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+    return ASGIApp(broadcasters, templates_dir=templates_dir)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # dùng lại toàn bộ phần khởi tạo (camera, model, pipeline, Telegram) của web_app
+    from web_app import runner
+
+    app = create_app({cid: unit.broadcaster for cid, unit in runner.units.items()})
+    uvicorn.run(app, host="0.0.0.0", port=5000, log_level="warning")
@@ -0,0 +1,69 @@
+import sys
+import time
+
+import numpy as np
+
+from face_gallery import FaceGallery, normalize_rows
+
+DIM = 128
+N_QUERIES = 256
+NOISE = 0.35
+SIZES = (1_000, 10_000, 100_000)
+NPROBES = (1, 4, 8, 16, 32)
+
+
+def make_gallery(n_identities: int, rng):
+    """Gallery giả: mỗi người 1 embedding ngẫu nhiên trên mặt cầu đơn vị."""
+    gallery = FaceGallery(dim=DIM)
+    gallery.embeddings = normalize_rows(rng.normal(size=(n_identities, DIM)))
+    gallery.labels = np.arange(n_identities, dtype=np.int32)
+    gallery.id_to_name = {i: f"person_{i}" for i in range(n_identities)}
+    return gallery
+
+
+def make_queries(gallery: FaceGallery, rng):
+    """Query = embedding của 1 người + nhiễu (giống ảnh mới của cùng người đó)."""
+    truth = rng.integers(0, len(gallery), N_QUERIES)
+    noise = rng.normal(scale=NOISE / np.sqrt(DIM), size=(N_QUERIES, DIM))
+    return normalize_rows(gallery.embeddings[truth] + noise), truth
+
+
+def timed_search(search, queries):
+    """Trả về (labels, ms / query), lấy trung vị của 5 lần chạy."""
+    runs = []
+    labels = None
+    for _ in range(5):
+        t0 = time.perf_counter()
+        labels, _ = search(queries)
+        runs.append(time.perf_counter() - t0)
+    return labels, 1000.0 * float(np.median(runs)) / len(queries)
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or SIZES
+    rng = np.random.default_rng(0)
+
+    print(f"dim={DIM}, queries={N_QUERIES}, noise={NOISE}")
+    print(f"{'N':>8} {'mode':>12} {'ms/query':>10} {'recall@1':>9} {'build s':>8}")
+
+    for n in sizes:
+        gallery = make_gallery(n, rng)
+        queries, truth = make_queries(gallery, rng)
+
+        labels, ms = timed_search(gallery.search, queries)
+        print(f"{n:>8} {'exact':>12} {ms:>10.4f} {np.mean(labels == truth):>9.3f} {'-':>8}")
+
+        t0 = time.perf_counter()
+        index = gallery.build_index()
+        build_s = time.perf_counter() - t0
+
+        for nprobe in NPROBES:
+            if nprobe > index.nlist:
+                break
+            labels, ms = timed_search(lambda q: index.search(q, nprobe=nprobe), queries)
+            mode = f"ivf p={nprobe}"
+            print(f"{n:>8} {mode:>12} {ms:>10.4f} {np.mean(labels == truth):>9.3f} {build_s:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from alert_manager import AlertManager
+from broadcaster import encode_variant
+from detector import TiledDetector, personDetector
+from face_recognizer import FaceRecognizer
+from intruder_processor import IntruderProcessor, camera_frames
+from motion import MotionGate
+from replay_source import ReplaySource
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+# Benchmark toàn pipeline, không cần webcam (chạy được trên CI chỉ có CPU):
+#   python bench_pipeline.py                          -> frame giả, cố định seed
+#   python bench_pipeline.py --source video.mp4 --json out.json
+#   python bench_pipeline.py --baseline out.json      -> exit 1 nếu chậm hơn baseline quá --tolerance
+# 2 kịch bản:
+#   web: web_app.process_frame (các stage chạy tuần tự) + encode JPEG cho stream
+#   cli: vòng lặp main_face_intruder_telgram (StagePipeline nhiều thread)
+
+SCENARIOS = ("web", "cli")
+
+
+def synthetic_frames(n: int, width: int, height: int, seed: int = 0):
+    """Frame giả cố định theo seed: nền nhiễu + vài khối hình người di chuyển."""
+    rng = np.random.default_rng(seed)
+    background = rng.integers(0, 60, (height, width, 3), dtype=np.uint8)
+    blobs = rng.uniform(0, 1, (3, 4))   # x, y, vận tốc x, màu
+    frames = []
+    for i in range(n):
+        frame = background.copy()
+        for x0, y0, vx, c in blobs:
+            x = int((x0 * width + i * (vx * 8 + 2)) % (width - 120))
+            y = int(y0 * (height - 320))
+            color = (int(80 + c * 150), 120, int(220 - c * 150))
+            cv2.rectangle(frame, (x + 30, y + 60), (x + 90, y + 300), color, -1)   # thân
+            cv2.circle(frame, (x + 60, y + 35), 30, (170, 190, 220), -1)           # đầu
+        frames.append(frame)
+    return frames
+
+
+def make_face_recognizer(model_path: str, labels_path: str):
+    """Dùng model thật nếu có, không thì train nhanh 1 LBPH giả để đo được đường chạy."""
+    if os.path.exists(model_path) and os.path.exists(labels_path):
+        return FaceRecognizer(model_path=model_path, labels_path=labels_path, threshold=80.0)
+
+    print("[bench] Chưa có model LBPH, dùng model giả (2 người, ảnh ngẫu nhiên).")
+    tmp_dir = tempfile.mkdtemp(prefix="bench_lbph_")
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 255, (20, 200, 200), dtype=np.uint8)
+    labels = np.repeat(np.arange(2, dtype=np.int32), 10)
+    recognizer = cv2.face.LBPHFaceRecognizer_create(radius=1, neighbors=8, grid_x=8, grid_y=8)
+    recognizer.train(images, labels)
+    model_path = os.path.join(tmp_dir, "face_lbph.xml")
+    labels_path = os.path.join(tmp_dir, "face_labels.json")
+    recognizer.save(model_path)
+    with open(labels_path, "w", encoding="utf-8") as f:
+        json.dump({"0": "person_a", "1": "person_b"}, f)
+    return FaceRecognizer(model_path=model_path, labels_path=labels_path, threshold=80.0)
+
+
+class StageTimer:
+    """Ghi thời gian từng lần chạy của mỗi stage (giây), bỏ warmup lần đầu."""
+
+    def __init__(self, warmup: int = 0):
+        self.warmup = warmup
+        self.samples = {}
+        self._seen = {}
+
+    def add(self, name: str, seconds: float):
+        n = self._seen.get(name, 0)
+        self._seen[name] = n + 1
+        if n >= self.warmup:
+            self.samples.setdefault(name, []).append(seconds)
+
+    def wrap(self, name: str, fn):
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - t0)
+        return timed
+
+    def summary(self):
+        out = {}
+        for name, values in self.samples.items():
+            ms = np.array(values) * 1000.0
+            out[name] = {
+                "n": len(ms),
+                "p50": round(float(np.percentile(ms, 50)), 3),
+                "p90": round(float(np.percentile(ms, 90)), 3),
+                "p99": round(float(np.percentile(ms, 99)), 3),
+                "max": round(float(ms.max()), 3),
+            }
+        return out
+
+
+def peak_rss_mb():
+    """Đỉnh RSS của cả process (ru_maxrss không reset được) -> mỗi kịch bản chạy ở process riêng."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả KB, macOS trả byte
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def make_processor(args, detector, face_recognizer):
+    if args.tiles > 0:
+        detector = TiledDetector(detector, tile_size=320, max_tiles=args.tiles)
+    return IntruderProcessor(
+        detector,
+        face_recognizer,
+        AlertManager(min_interval=args.alert_interval, save_mode="never"),
+        motion_gate=MotionGate() if args.motion else None,
+        detect_every=1,
+        max_width=800,
+    )
+
+
+def make_source(args, frames):
+    if args.source:
+        return ReplaySource(args.source, speed=0, width=args.width, height=args.height)
+    return ReplaySource(frames, speed=0)
+
+
+def run_web(args, detector, face_recognizer, frames):
+    """Giống web_app: process_frame (tuần tự) rồi encode 800px cho stream."""
+    processor = make_processor(args, detector, face_recognizer)
+    timer = StageTimer(warmup=args.warmup)
+    source = make_source(args, frames)
+
+    stages = [
+        ("detect", processor.detect),
+        ("recognize", processor.recognize),
+        ("draw", processor.annotate),
+        ("alert", processor.alert),
+        ("resize", processor.finish),
+    ]
+    count = 0
+    t_start = None
+    while args.frames <= 0 or count < args.frames + args.warmup:
+        ok, frame, ts, frame_id = source.read_with_meta()
+        if not ok:
+            break
+        if count == args.warmup:
+            t_start = time.perf_counter()
+
+        t_frame = time.perf_counter()
+        item = {"frame": frame, "timestamp": ts, "frame_id": frame_id}
+        for name, fn in stages:
+            t0 = time.perf_counter()
+            item = fn(item)
+            timer.add(name, time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        encode_variant(item, 800, 80)
+        timer.add("encode", time.perf_counter() - t0)
+        timer.add("total", time.perf_counter() - t_frame)
+        count += 1
+
+    source.release()
+    return timer, count - args.warmup, t_start
+
+
+def run_cli(args, detector, face_recognizer, frames):
+    """Giống main_face_intruder_telgram: StagePipeline nhiều thread, đo FPS đầu ra."""
+    processor = make_processor(args, detector, face_recognizer)
+    timer = StageTimer(warmup=args.warmup)
+    # build_pipeline lấy processor.detect... lúc tạo Stage -> bọc trước khi build
+    processor.detect = timer.wrap("detect", processor.detect)
+    processor.recognize = timer.wrap("recognize", processor.recognize)
+    processor.annotate = timer.wrap("draw", processor.annotate)
+    processor.alert = timer.wrap("alert", processor.alert)
+    processor.finish = timer.wrap("resize", processor.finish)
+    pipeline = processor.build_pipeline(workers=args.workers)
+
+    source = make_source(args, frames)
+    count = 0
+    # warmup = 0 -> không có frame nào "hết warmup", tính giờ từ trước frame đầu
+    t_start = time.perf_counter() if args.warmup <= 0 else None
+    results = pipeline.run(camera_frames(source, stop_on_fail=True))
+    try:
+        for _ in results:
+            count += 1
+            if count == args.warmup:
+                t_start = time.perf_counter()
+            if args.frames > 0 and count >= args.frames + args.warmup:
+                break
+    finally:
+        results.close()
+        source.release()
+    return timer, count - args.warmup, t_start
+
+
+def run_scenario(name, args, detector, face_recognizer, frames):
+    runner = run_web if name == "web" else run_cli
+    timer, n, t_start = runner(args, detector, face_recognizer, frames)
+    elapsed = time.perf_counter() - t_start if t_start is not None else 0.0
+    return {
+        "frames": n,
+        "fps": round(n / elapsed, 2) if elapsed > 0 else 0.0,
+        "stages_ms": timer.summary(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_scenario_isolated(name, argv):
+    """
+    Chạy 1 kịch bản ở process con (cùng tham số dòng lệnh) để peak_rss_mb chỉ tính kịch bản đó,
+    không lẫn đỉnh RAM của kịch bản chạy trước. argparse lấy giá trị cuối nên chỉ cần nối thêm.
+    """
+    fd, path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        cmd = [sys.executable, os.path.abspath(__file__), *argv,
+               "--scenarios", name, "--json", path, "--baseline", "", "--child"]
+        subprocess.run(cmd, check=True)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["scenarios"][name]
+    finally:
+        os.remove(path)
+
+
+def print_report(report):
+    for name, res in report["scenarios"].items():
+        print(f"\n== {name}: {res['frames']} frame, {res['fps']} FPS, peak RSS {res['peak_rss_mb']} MB ==")
+        print(f"{'stage':>10} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}  (ms)")
+        for stage, st in res["stages_ms"].items():
+            print(f"{stage:>10} {st['p50']:>8.2f} {st['p90']:>8.2f} {st['p99']:>8.2f} {st['max']:>8.2f}")
+
+
+def compare(report, baseline, tolerance: float):
+    """Trả về list các chỉ số chậm hơn baseline quá tolerance (tỉ lệ)."""
+    problems = []
+    for name, res in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        if base["fps"] > 0 and res["fps"] < base["fps"] * (1 - tolerance):
+            problems.append(f"{name}.fps {res['fps']} < {base['fps']}")
+        for stage, st in res["stages_ms"].items():
+            b = base["stages_ms"].get(stage)
+            if b and st["p50"] > b["p50"] * (1 + tolerance):
+                problems.append(f"{name}.{stage}.p50 {st['p50']}ms > {b['p50']}ms")
+    return problems
+
+
+def run_in_process(args, names, report):
+    cv2.setRNGSeed(args.seed)
+    frames = None
+    if not args.source:
+        n = args.frames + args.warmup if args.frames > 0 else 300
+        frames = synthetic_frames(n, args.width, args.height, seed=args.seed)
+
+    detector = personDetector(
+        model_path=args.model, conf_threshold=0.5, img_size=args.img_size, device=args.device
+    )
+    face_recognizer = make_face_recognizer("Models/face_lbph.xml", "Models/face_labels.json")
+
+    for name in names:
+        report["scenarios"][name] = run_scenario(name, args, detector, face_recognizer, frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline phát hiện người + nhận diện mặt")
+    parser.add_argument("--source", help="video / thư mục ảnh (mặc định: frame giả cố định seed)")
+    parser.add_argument("--frames", type=int, default=200, help="số frame đo (0 = hết file)")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--img-size", type=int, default=320)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--tiles", type=int, default=0,
+                        help="số tile 320px mỗi frame (TiledDetector), 0 = tắt")
+    parser.add_argument("--workers", type=int, default=None, help="số core cho kịch bản cli")
+    parser.add_argument("--motion", action="store_true", help="bật MotionGate (mặc định tắt để đo ổn định)")
+    parser.add_argument("--alert-interval", type=float, default=3.0)
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    parser.add_argument("--baseline", help="file JSON kết quả cũ để so sánh")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--same-process", action="store_true",
+                        help="chạy mọi kịch bản trong 1 process (peak RSS khi đó là của cả process)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.scenarios.split(",")]
+    for name in names:
+        if name not in SCENARIOS:
+            raise SystemExit(f"Kịch bản không hợp lệ: {name}")
+
+    report = {
+        "source": args.source or f"synthetic(seed={args.seed})",
+        "size": [args.width, args.height],
+        "scenarios": {},
+    }
+    if len(names) > 1 and not args.same_process:
+        for name in names:
+            report["scenarios"][name] = run_scenario_isolated(name, sys.argv[1:])
+    else:
+        run_in_process(args, names, report)
+
+    if args.child:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f)
+        return
+
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nĐã ghi {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline, args.tolerance)
+        if problems:
+            print("\nChậm hơn baseline:")
+            for p in problems:
+                print("  -", p)
+            sys.exit(1)
+        print("\nKhông có regression so với baseline.")
+
+
+if __name__ == "__main__":
+    main()
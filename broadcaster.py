@@ -0,0 +1,222 @@
+import threading
+
+import cv2
+
+from metrics import JPEG_ENCODE
+
+
+class FrameBroadcaster:
+    """
+    1 thread producer chạy pipeline (mỗi frame chỉ xử lý 1 lần), N client đọc chung frame mới nhất.
+    JPEG encode qua encode_variant(): mỗi biến thể / mức chất lượng encode 1 lần, chỉ khi có người xem.
+    - Client chậm không chặn producer: khi quay lại chỉ lấy frame mới nhất, các frame ở giữa bị bỏ.
+    - Chi phí CPU không phụ thuộc số người xem.
+    """
+
+    def __init__(self, source_factory):
+        """
+        source_factory: hàm không tham số trả về iterator các item đã xử lý
+        (vd lambda: pipeline.run(camera_frames(camera))). Gọi khi có người xem đầu tiên.
+        """
+        self.source_factory = source_factory
+
+        self._cond = threading.Condition()
+        self._latest = None
+        self._seq = 0
+        self._subscribers = 0
+        self._thread = None
+        self._running = False
+
+        # số liệu
+        self.frames_published = 0
+
+    # ======== PRODUCER ========
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._produce, daemon=True)
+            self._thread.start()
+
+    def _produce(self):
+        source = self.source_factory()
+        try:
+            for item in source:
+                with self._cond:
+                    if not self._running:
+                        break
+                    self._latest = item
+                    self._seq += 1
+                    self.frames_published += 1
+                    self._cond.notify_all()
+        finally:
+            close = getattr(source, "close", None)
+            if close is not None:
+                close()
+            with self._cond:
+                self._running = False
+                self._thread = None
+                self._cond.notify_all()
+
+    def stop(self, timeout: float = 10.0):
+        """Dừng producer và chờ thread của nó kết thúc (source đã được close) trong tối đa timeout giây."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    # ======== SUBSCRIBER ========
+    @property
+    def subscribers(self) -> int:
+        return self._subscribers
+
+    def latest(self):
+        with self._cond:
+            return self._latest
+
+    def subscribe(self, timeout: float = 5.0, resend: bool = True):
+        """
+        Generator trả về item mới nhất mỗi khi có frame mới; chỉ kết thúc khi producer dừng.
+        Camera tạm đứng (reconnect...) quá timeout giây: resend=True -> gửi lại frame cuối để
+        kết nối MJPEG không bị trình duyệt / proxy cắt; resend=False -> cứ chờ tiếp.
+        """
+        self.start()
+        with self._cond:
+            self._subscribers += 1
+            last_seq = self._seq
+        try:
+            while True:
+                with self._cond:
+                    got = self._cond.wait_for(
+                        lambda: self._seq != last_seq or not self._running, timeout=timeout
+                    )
+                    if got and self._seq == last_seq:
+                        return   # producer dừng
+                    if not got and (not resend or self._latest is None):
+                        continue
+                    last_seq = self._seq
+                    item = self._latest
+                yield item
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+
+# ======== BIẾN THỂ STREAM ========
+# tên -> chiều rộng tối đa (None = giữ nguyên độ phân giải camera)
+STREAM_VARIANTS = {"full": None, "medium": 800, "thumb": 320}
+QUALITY_LEVELS = (90, 80, 70, 55, 40, 30)
+
+
+def _to_number(value, cast, default):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_stream_args(args: dict):
+    """
+    Đọc query của /video_feed (dict str -> str), trả về (width, quality, max_fps):
+    size=full|medium|thumb hoặc số px chiều rộng, q=10..95 (bỏ trống = tự chỉnh), fps=1..30.
+    """
+    size = args.get("size", "medium")
+    if size in STREAM_VARIANTS:
+        width = STREAM_VARIANTS[size]
+    else:
+        width = min(max(_to_number(size, int, 800), 160), 1920)
+
+    quality = _to_number(args.get("q"), int, None)
+    if quality is not None:
+        quality = min(max(quality, 10), 95)
+
+    max_fps = min(max(_to_number(args.get("fps"), float, 15.0), 1.0), 30.0)
+    return width, quality, max_fps
+
+
+def encode_variant(item, width: int | None, quality: int) -> bytes | None:
+    """
+    JPEG của item ở chiều rộng width, chất lượng quality.
+    Chỉ encode khi có client cần, kết quả cache trong item -> nhiều client cùng
+    biến thể / mức chất lượng dùng chung 1 lần encode.
+    """
+    cache = item.setdefault("jpeg_variants", {})
+    lock = item.setdefault("variant_lock", threading.Lock())
+    key = (width, quality)
+    with lock:
+        if key in cache:
+            return cache[key]
+
+        frame = item["frame"]
+        # ảnh nhỏ thì resize từ output (đã thu nhỏ sẵn) cho nhanh
+        if width is not None and "output" in item and item["output"].shape[1] >= width:
+            frame = item["output"]
+        h, w = frame.shape[:2]
+        if width is not None and w > width:
+            frame = cv2.resize(frame, (width, int(h * width / w)), interpolation=cv2.INTER_AREA)
+
+        with JPEG_ENCODE.labels("stream").time():
+            ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        cache[key] = buffer.tobytes() if ok else None
+        return cache[key]
+
+
+class AdaptiveQuality:
+    """
+    Chỉnh chất lượng JPEG và fps cho 1 client theo thời gian gửi thực tế (backpressure):
+    gửi 1 frame lâu hơn budget -> giảm chất lượng / giãn frame, mạng thông thoáng -> tăng lại.
+    """
+
+    COOLDOWN = 5   # số frame chờ sau mỗi lần đổi mức, để EWMA kịp phản ánh mức mới
+
+    def __init__(self, quality: int | None = None, max_fps: float = 15.0, min_fps: float = 2.0):
+        """quality: cố định chất lượng JPEG; None -> tự chỉnh theo QUALITY_LEVELS."""
+        self.adapt = quality is None
+        self.level = 1
+        self.fixed_quality = quality
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.send_time = 0.0      # EWMA thời gian gửi 1 frame (giây)
+        self._good = 0
+        self._cooldown = 0
+
+    @property
+    def quality(self) -> int:
+        if self.fixed_quality is not None:
+            return self.fixed_quality
+        return QUALITY_LEVELS[self.level]
+
+    @property
+    def interval(self) -> float:
+        """Khoảng cách tối thiểu giữa 2 frame gửi cho client này."""
+        base = 1.0 / self.max_fps
+        if not self.adapt:
+            return base
+        # không đẩy nhanh hơn tốc độ mạng nhận được
+        return min(max(base, self.send_time * 1.25), 1.0 / self.min_fps)
+
+    def record(self, seconds: float):
+        """Ghi nhận thời gian gửi xong 1 frame."""
+        self.send_time = seconds if self.send_time == 0 else 0.7 * self.send_time + 0.3 * seconds
+        if not self.adapt:
+            return
+        if self._cooldown > 0:
+            self._cooldown -= 1
+            return
+
+        budget = 1.0 / self.max_fps
+        if self.send_time > budget and self.level < len(QUALITY_LEVELS) - 1:
+            self.level += 1
+            self._good = 0
+            self._cooldown = self.COOLDOWN
+        elif self.send_time < budget * 0.3:
+            self._good += 1
+            # tăng chậm hơn giảm để khỏi dao động
+            if self._good >= 20 and self.level > 0:
+                self.level -= 1
+                self._good = 0
+        else:
+            self._good = 0
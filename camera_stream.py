@@ -1,20 +1,194 @@
+import threading
+import time
+from collections import deque
+
 import cv2
 
+from metrics import CAMERA_DROPPED, CAMERA_FRAMES, CAMERA_READ
+
 
 class camera_Stream:
-    def __init__(self, device_index: int = 0, width: int = 1280, height: int = 720):
-        self.cap = cv2.VideoCapture(device_index)
+    """
+    Đọc camera ở thread nền, đẩy frame vào ring buffer có giới hạn.
+    - mode="latest": read() luôn trả frame mới nhất, bỏ các frame cũ -> độ trễ thấp
+      dù YOLO/LBPH chạy chậm.
+    - mode="every": read() trả lần lượt từng frame; buffer đầy thì bỏ frame cũ nhất.
+    - threaded=False: đọc đồng bộ như bản cũ.
+    - Đọc lỗi max_failures lần liên tiếp (mất kết nối RTSP, hết file...): đóng và mở lại
+      capture, giữa các lần mở lại chờ lùi dần tới reconnect_max giây -> không quay vòng 100% CPU.
+    """
+
+    def __init__(
+        self,
+        device_index: int = 0,
+        width: int = 1280,
+        height: int = 720,
+        threaded: bool = True,
+        buffer_size: int = 4,
+        mode: str = "latest",
+        max_failures: int = 50,
+        name: str | None = None,
+        reconnect_max: float = 5.0,
+    ):
+        if mode not in ("latest", "every"):
+            raise ValueError(f"mode không hợp lệ: {mode}")
+
+        self.device_index = device_index
+        self.width = width
+        self.height = height
+        self.cap = self._open()
 
         if not self.cap.isOpened():
             raise RuntimeError(f"Không mở được camera index {device_index}")
 
+        self.threaded = threaded
+        self.mode = mode
+        self.max_failures = max_failures
+        self.reconnect_max = reconnect_max
+        self.reconnects = 0
+
+        # bộ đếm
+        self.frames_grabbed = 0
+        self.frames_dropped = 0
+        self._frame_id = 0
+
+        # metrics theo tên camera (mặc định là device_index)
+        label = name or str(device_index)
+        self._m_read = CAMERA_READ.labels(label)
+        self._m_frames = CAMERA_FRAMES.labels(label)
+        self._m_dropped = CAMERA_DROPPED.labels(label)
+
+        self._buffer = deque(maxlen=max(1, buffer_size))
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+        if self.threaded:
+            self.start()
+
+    def start(self):
+        """Chạy thread grab frame (gọi lại được sau khi stop)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._grab_loop, daemon=True)
+        self._thread.start()
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.device_index)
         # THỬ FULL HD NHẸ: 1280x720
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        return cap
+
+    def _reopen(self):
+        """Đóng capture cũ, mở lại cùng nguồn (camera rút ra cắm lại, RTSP rớt mạng)."""
+        self.cap.release()
+        self.cap = self._open()
+        self.reconnects += 1
+        print(f"[camera_Stream] Mở lại camera {self.device_index} (lần {self.reconnects}):",
+              "OK" if self.cap.isOpened() else "chưa được")
+
+    def _grab_loop(self):
+        failures = 0
+        delay = 0.5
+        while self._running:
+            t0 = time.perf_counter()
+            ok, frame = self.cap.read()
+            self._m_read.observe(time.perf_counter() - t0)
+            if not ok:
+                failures += 1
+                if failures < self.max_failures:
+                    time.sleep(0.01)
+                    continue
+                # lỗi liên tục: chờ (lùi dần) rồi mở lại, camera hỏng không ăn hết 1 core
+                time.sleep(delay)
+                delay = min(delay * 2, self.reconnect_max)
+                if self._running:
+                    self._reopen()
+                failures = 0
+                continue
+
+            delay = 0.5
+
+            failures = 0
+            ts = time.time()
+            with self._cond:
+                self._frame_id += 1
+                self.frames_grabbed += 1
+                if len(self._buffer) == self._buffer.maxlen:
+                    # ring đầy -> frame cũ nhất bị đè
+                    self.frames_dropped += 1
+                    self._m_dropped.inc()
+                self._buffer.append((frame, ts, self._frame_id))
+                self._m_frames.inc()
+                self._cond.notify_all()
+
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def read_with_meta(self, timeout: float | None = None):
+        """
+        Trả về (ok, frame, timestamp, frame_id).
+        timestamp là time.time() lúc frame được grab, dùng để đo độ trễ.
+        Chờ tới khi có frame như cap.read(): camera chậm ra frame đầu / đang reconnect thì vẫn chờ,
+        ok=False chỉ khi thread đọc đã dừng (stop / release). timeout (giây): chờ tối đa bấy nhiêu,
+        hết giờ cũng trả ok=False -> bên gọi tự kiểm tra running để phân biệt.
+        """
+        if not self.threaded:
+            ok, frame = self.cap.read()
+            if not ok:
+                return False, None, 0.0, -1
+            self._frame_id += 1
+            self.frames_grabbed += 1
+            return True, frame, time.time(), self._frame_id
+
+        with self._cond:
+            self._cond.wait_for(lambda: self._buffer or not self._running, timeout)
+            if not self._buffer:
+                return False, None, 0.0, -1
+
+            if self.mode == "latest":
+                frame, ts, frame_id = self._buffer.pop()
+                self.frames_dropped += len(self._buffer)
+                if self._buffer:
+                    self._m_dropped.inc(len(self._buffer))
+                self._buffer.clear()
+            else:
+                frame, ts, frame_id = self._buffer.popleft()
+
+        return True, frame, ts, frame_id
+
+    def read(self, timeout: float | None = None):
+        ok, frame, _, _ = self.read_with_meta(timeout)
+        return ok, frame
+
+    @property
+    def running(self) -> bool:
+        """Còn đọc được frame không (False sau khi stop / release)."""
+        if not self.threaded:
+            return self.cap is not None and self.cap.isOpened()
+        return self._running
+
+    def stats(self):
+        """Số liệu để debug / đo: frame đã grab, đã bỏ, đang chờ trong buffer."""
+        with self._cond:
+            return {
+                "grabbed": self.frames_grabbed,
+                "dropped": self.frames_dropped,
+                "buffered": len(self._buffer),
+            }
 
-    def read(self):
-        return self.cap.read()
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()   # đánh thức read() đang chờ
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
 
     def release(self):
+        self.stop()
         if self.cap is not None:
             self.cap.release()
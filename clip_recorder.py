@@ -0,0 +1,217 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from metrics import Counter, Gauge
+
+CLIPS_WRITTEN = Counter("clips_written_total", "Số clip sự kiện đã ghi", ["camera"])
+CLIP_FRAMES_DROPPED = Counter("clip_frames_dropped_total", "Frame không kịp đưa vào ring buffer clip", ["camera"])
+CLIP_RING_BYTES = Gauge("clip_ring_bytes", "Dung lượng JPEG đang giữ trong ring buffer clip", ["camera"])
+
+
+class ClipRecorder:
+    """
+    Ghi clip trước + sau sự kiện:
+    - push(frame): frame được thu nhỏ + nén JPEG ở thread riêng rồi giữ trong ring buffer
+      (giới hạn theo giây VÀ theo byte) -> RAM cố định, không giữ mảng BGR 1280x720.
+      max_bytes là trần chung cho ring + clip đang gom + clip chờ / đang ghi.
+    - trigger(): lấy pre_seconds giây trong ring + gom tiếp post_seconds giây,
+      xong thì thread ghi decode lại và ghi video bằng cv2.VideoWriter.
+    Vòng lặp xử lý frame chỉ put_nowait 1 tham chiếu frame, không bao giờ chờ encode.
+    """
+
+    def __init__(
+        self,
+        output_dir: str = "alerts/clips",
+        pre_seconds: float = 5.0,
+        post_seconds: float = 5.0,
+        fps: float = 10.0,
+        max_width: int = 800,
+        jpeg_quality: int = 70,
+        max_bytes: int = 16 * 1024 * 1024,
+        max_clip_seconds: float = 60.0,
+        name: str = "",
+    ):
+        """
+        fps: số frame / giây giữ lại cho clip (frame dày hơn bị bỏ bớt).
+        max_bytes: trần tổng dung lượng JPEG giữ trong RAM (ring + mọi clip chưa ghi xong);
+                   clip chiếm chỗ trước, ring bị cắt bớt frame cũ cho vừa.
+        max_clip_seconds: sự kiện kéo dài (trigger liên tục) thì clip dài tối đa bấy nhiêu giây.
+        """
+        self.output_dir = output_dir
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.fps = fps
+        self.max_width = max_width
+        self.jpeg_quality = jpeg_quality
+        self.max_bytes = max_bytes
+        self.max_clip_seconds = max_clip_seconds
+        self.name = name
+
+        self._ring = deque()         # (ts, jpeg bytes)
+        self._ring_bytes = 0
+        self._clip = None            # clip đang gom: {"path", "frames", "bytes", "start", "until"}
+        self._clip_bytes = 0         # byte của clip đang gom + chờ ghi + đang ghi
+        self._lock = threading.Lock()
+        self._last_ts = 0.0
+
+        # tối đa 2 frame thô chờ encode -> phần RAM cho frame thô cũng cố định
+        self._in_queue = queue.Queue(maxsize=2)
+        self._write_queue = queue.Queue(maxsize=2)
+
+        self._m_dropped = CLIP_FRAMES_DROPPED.labels(name)
+        self._m_written = CLIPS_WRITTEN.labels(name)
+        CLIP_RING_BYTES.labels(name).set_function(lambda: self._ring_bytes)
+
+        os.makedirs(output_dir, exist_ok=True)
+        threading.Thread(target=self._encode_loop, daemon=True).start()
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    # ======== PHÍA VÒNG LẶP FRAME ========
+    def push(self, frame, ts: float | None = None):
+        """Đưa 1 frame (đã vẽ) vào recorder. Không chặn; recorder bận thì bỏ frame."""
+        ts = time.time() if ts is None else ts
+        if ts - self._last_ts < 1.0 / self.fps:
+            return
+        self._last_ts = ts
+        try:
+            self._in_queue.put_nowait((ts, frame))
+        except queue.Full:
+            self._m_dropped.inc()
+
+    def trigger(self, ts: float | None = None) -> str:
+        """
+        Báo có sự kiện. Trả về đường dẫn file clip sẽ được ghi.
+        Đang gom clip thì chỉ kéo dài thêm phần sau sự kiện (tới max_clip_seconds).
+        """
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            if self._clip is not None:
+                limit = self._clip["start"] + self.max_clip_seconds
+                self._clip["until"] = min(ts + self.post_seconds, limit)
+                return self._clip["path"]
+
+            pre = [(t, jpg) for t, jpg in self._ring if t >= ts - self.pre_seconds]
+            stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(ts)) + f"_{int(ts * 1000) % 1000:03d}"
+            prefix = f"{self.name}_" if self.name else ""
+            path = os.path.join(self.output_dir, f"clip_{prefix}{stamp}.mp4")
+            self._clip = {
+                "path": path,
+                "frames": pre,
+                "bytes": sum(len(j) for _, j in pre),
+                "start": pre[0][0] if pre else ts,
+                "until": ts + self.post_seconds,
+            }
+            self._clip_bytes += self._clip["bytes"]
+            return path
+
+    # ======== THREAD NỀN ========
+    def _encode_loop(self):
+        while True:
+            ts, frame = self._in_queue.get()
+            h, w = frame.shape[:2]
+            if w > self.max_width:
+                frame = cv2.resize(frame, (self.max_width, int(h * self.max_width / w)),
+                                   interpolation=cv2.INTER_AREA)
+            ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if ok:
+                self._append(ts, buffer.tobytes())
+
+    def _append(self, ts, jpeg):
+        finished = None
+        with self._lock:
+            clip = self._clip
+            if clip is not None:
+                fits = self._clip_bytes + len(jpeg) <= self.max_bytes
+                if ts <= clip["until"] and fits:
+                    clip["frames"].append((ts, jpeg))
+                    clip["bytes"] += len(jpeg)
+                    self._clip_bytes += len(jpeg)
+                if ts > clip["until"] or not fits:
+                    finished, self._clip = clip, None
+
+            self._ring.append((ts, jpeg))
+            self._ring_bytes += len(jpeg)
+            # bỏ frame quá cũ, hoặc ring + clip chưa ghi vượt trần dung lượng
+            while self._ring and (
+                self._ring[0][0] < ts - self.pre_seconds
+                or self._ring_bytes + self._clip_bytes > self.max_bytes
+            ):
+                self._ring_bytes -= len(self._ring.popleft()[1])
+
+        if finished is not None:
+            self._enqueue(finished)
+
+    def _enqueue(self, clip, timeout: float | None = None):
+        try:
+            if timeout is None:
+                self._write_queue.put_nowait(clip)
+            else:
+                self._write_queue.put(clip, timeout=timeout)
+        except queue.Full:
+            print("[ClipRecorder] Đang ghi clip khác, bỏ:", clip["path"])
+            self._release_bytes(clip)
+
+    def _release_bytes(self, clip):
+        with self._lock:
+            self._clip_bytes -= clip["bytes"]
+
+    def _write_loop(self):
+        while True:
+            clip = self._write_queue.get()
+            try:
+                self._write_clip(clip)
+            except (cv2.error, OSError) as e:
+                print("[ClipRecorder] Lỗi ghi clip:", clip["path"], e)
+            finally:
+                self._release_bytes(clip)
+                self._write_queue.task_done()
+
+    def _write_clip(self, clip):
+        frames = clip["frames"]
+        if not frames:
+            return
+        writer = None
+        size = None
+        tmp_path = clip["path"] + ".tmp.mp4"
+        # fps theo nhịp frame thật sự vào ring (pipeline chậm hơn camera thì < self.fps),
+        # để clip phát đúng tốc độ thật
+        span = frames[-1][0] - frames[0][0]
+        fps = (len(frames) - 1) / span if len(frames) > 1 and span > 0 else self.fps
+        fps = min(max(fps, 1.0), self.fps)
+        try:
+            for _, jpeg in frames:
+                frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if frame is None:
+                    continue
+                if writer is None:
+                    size = (frame.shape[1], frame.shape[0])
+                    writer = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+                    if not writer.isOpened():
+                        raise OSError("VideoWriter không mở được file")
+                elif (frame.shape[1], frame.shape[0]) != size:
+                    frame = cv2.resize(frame, size)
+                writer.write(frame)
+        finally:
+            if writer is not None:
+                writer.release()
+        if writer is not None:
+            os.replace(tmp_path, clip["path"])
+            self._m_written.inc()
+            print(f"[ClipRecorder] Đã ghi clip ({len(frames)} frame): {clip['path']}")
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Ghi nốt clip đang gom (dùng lúc tắt chương trình)."""
+        with self._lock:
+            clip, self._clip = self._clip, None
+        if clip is not None:
+            self._enqueue(clip, timeout=timeout)
+        deadline = time.monotonic() + timeout
+        while self._write_queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not self._write_queue.unfinished_tasks
@@ -1,5 +1,110 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
 from ultralytics import YOLO
 import cv2
+import numpy as np
+
+from metrics import YOLO_BATCH, YOLO_DETECT, YOLO_TILES
+
+# Kết quả detect: structured array, mỗi dòng 1 người.
+# track_id = -1 khi chưa có tracker gán id.
+DET_DTYPE = np.dtype(
+    [
+        ("xyxy", np.int32, (4,)),
+        ("conf", np.float32),
+        ("track_id", np.int32),
+    ]
+)
+
+
+def empty_detections(n: int = 0):
+    """Tạo mảng detections rỗng (hoặc n dòng 0) với track_id = -1."""
+    dets = np.zeros(n, dtype=DET_DTYPE)
+    dets["track_id"] = -1
+    return dets
+
+
+def tile_grid(width: int, height: int, tile_size: int = 320, overlap: float = 0.25):
+    """
+    Chia frame thành các ô vuông tile_size chồng nhau overlap (tỉ lệ), ô cuối sát mép phải / dưới.
+    Trả về mảng (T, 4) xyxy, sắp theo hàng.
+    """
+    def starts(length):
+        size = min(tile_size, length)
+        stride = max(1, int(size * (1 - overlap)))
+        pos = list(range(0, max(1, length - size + 1), stride))
+        if pos[-1] + size < length:
+            pos.append(length - size)
+        return pos, size
+
+    xs, tw = starts(width)
+    ys, th = starts(height)
+    return np.array([(x, y, x + tw, y + th) for y in ys for x in xs], dtype=np.int32)
+
+
+def nms(detections, iou_threshold: float = 0.5, ios_threshold: float = 0.8):
+    """
+    NMS không phân lớp cho mảng DET_DTYPE (giữ conf cao trước).
+    Ngoài IoU còn bỏ box nằm gần trọn trong box khác (intersection / diện tích box nhỏ >= ios_threshold):
+    người bị cắt ở mép tile cho ra box cụt, IoU với box đầy đủ thấp nhưng nằm gọn trong nó.
+    """
+    if len(detections) <= 1:
+        return detections
+    order = np.argsort(-detections["conf"], kind="stable")
+    boxes = detections["xyxy"][order].astype(np.float32)
+
+    x1 = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+    y1 = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+    x2 = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+    y2 = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    iou = inter / np.maximum(area[:, None] + area[None, :] - inter, 1e-6)
+    ios = inter / np.maximum(np.minimum(area[:, None], area[None, :]), 1e-6)
+    overlap = (iou >= iou_threshold) | (ios >= ios_threshold)
+
+    keep = np.ones(len(boxes), dtype=bool)
+    for i in range(len(boxes)):
+        if keep[i]:
+            keep[i + 1:] &= ~overlap[i, i + 1:]
+    return detections[order[keep]]
+
+
+def detect_tiled(detector, frame, tiles, full_frame: bool = True):
+    """
+    Chạy detector trên các ô tiles (xyxy) của frame trong 1 lần detect_batch,
+    đổi toạ độ về frame gốc rồi NMS gộp lại.
+    full_frame=True: thêm 1 lượt cả frame (bắt người to / đứng gần, cắt ngang nhiều tile).
+    detector: personDetector hoặc DetectBatcher (cần detect_batch).
+    """
+    crops = [frame] if full_frame else []
+    crops += [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in np.asarray(tiles).tolist()]
+    if not crops:
+        return empty_detections()
+    YOLO_TILES.observe(len(crops))
+
+    results = detector.detect_batch(crops)
+    merged = list(results[:1]) if full_frame else []
+    fh, fw = frame.shape[:2]
+    for (x1, y1, x2, y2), dets in zip(np.asarray(tiles).tolist(), results[1 if full_frame else 0:]):
+        if len(dets) == 0:
+            continue
+        dets = dets.copy()
+        if full_frame:
+            # box chạm mép trong của tile = người bị cắt ngang; người to đã có ở lượt cả frame,
+            # người nhỏ nằm trọn trong ô kề bên nhờ phần chồng nhau
+            b = dets["xyxy"]
+            cut = (((b[:, 0] <= 1) & (x1 > 0)) | ((b[:, 1] <= 1) & (y1 > 0)) |
+                   ((b[:, 2] >= x2 - x1 - 1) & (x2 < fw)) | ((b[:, 3] >= y2 - y1 - 1) & (y2 < fh)))
+            dets = dets[~cut]
+        dets["xyxy"] += np.array([x1, y1, x1, y1], dtype=np.int32)
+        merged.append(dets)
+    if not merged:
+        return empty_detections()
+    return nms(np.concatenate(merged))
 
 
 class personDetector:
@@ -8,48 +113,283 @@ class personDetector:
     img_size để 320 cho nhẹ, đủ cho bài này.
     """
 
-    def __init__(self, model_path="yolov8n.pt", conf_threshold=0.5, img_size=320):
+    def __init__(self, model_path="yolov8n.pt", conf_threshold=0.5, img_size=320, device="cpu"):
         self.model = YOLO(model_path)
         self.conf_threshold = conf_threshold
         self.img_size = img_size
+        self.device = device
 
     def detect(self, frame):
         """
-        Trả về list bbox người: [(x1, y1, x2, y2, conf), ...]
+        Trả về mảng DET_DTYPE: dets["xyxy"] (N, 4), dets["conf"] (N,), dets["track_id"] (N,)
+        """
+        return self.detect_batch([frame])[0]
+
+    def detect_tiled(self, frame, tiles, full_frame: bool = True):
+        """Detect trên các ô tiles (xyxy) + cả frame, gộp bằng NMS (xem detect_tiled)."""
+        return detect_tiled(self, frame, tiles, full_frame=full_frame)
+
+    def detect_batch(self, frames):
+        """
+        Detect nhiều frame trong 1 lần forward.
+        Trả về list mảng DET_DTYPE, đúng thứ tự frames.
         """
+        if not frames:
+            return []
+
+        YOLO_BATCH.observe(len(frames))
+        t0 = time.perf_counter()
         results = self.model(
-            frame,
+            list(frames),
             imgsz=self.img_size,
             conf=self.conf_threshold,
             classes=[0],       # chỉ class person
             verbose=False,
-            device="cpu",
+            device=self.device,
         )
+        dets = [self._extract(r) for r in results]
+        YOLO_DETECT.observe(time.perf_counter() - t0)
+        return dets
 
-        dets = []
-        r0 = results[0]
-        if r0.boxes is None:
-            return dets
+    @staticmethod
+    def _extract(r0):
+        boxes = r0.boxes
+        if boxes is None or len(boxes) == 0:
+            return empty_detections()
 
-        for box in r0.boxes:
-            x1, y1, x2, y2 = box.xyxy[0].tolist()
-            conf = float(box.conf[0])
-            dets.append((int(x1), int(y1), int(x2), int(y2), conf))
+        # 1 lần chuyển tensor -> numpy cho cả frame
+        # cột: x1, y1, x2, y2, [track_id], conf, cls
+        data = boxes.data.cpu().numpy()
 
+        dets = empty_detections(len(data))
+        dets["xyxy"] = data[:, :4]
+        if data.shape[1] == 7:
+            dets["track_id"] = data[:, 4]
+            dets["conf"] = data[:, 5]
+        else:
+            dets["conf"] = data[:, 4]
         return dets
 
     def draw_detections(self, frame, detections):
         """
         Vẽ khung người cho debug.
         """
-        for (x1, y1, x2, y2, conf) in detections:
+        boxes = detections["xyxy"].tolist()
+        confs = detections["conf"].tolist()
+        track_ids = detections["track_id"].tolist()
+
+        for (x1, y1, x2, y2), conf, track_id in zip(boxes, confs, track_ids):
+            label = f"Person {conf:.2f}" if track_id < 0 else f"Person #{track_id} {conf:.2f}"
             cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
             cv2.putText(
                 frame,
-                f"Person {conf:.2f}",
+                label,
                 (x1, y1 - 5),
                 cv2.FONT_HERSHEY_SIMPLEX,
                 0.6,
                 (0, 255, 0),
                 2,
             )
+
+
+class DetectBatcher:
+    """
+    Gom frame từ nhiều camera thành micro-batch cho personDetector.
+    - max_batch: tối đa bao nhiêu frame trong 1 lần forward.
+    - max_delay: frame đầu tiên của batch chờ tối đa bấy nhiêu giây,
+      nên độ trễ thêm vào không vượt quá max_delay + thời gian 1 batch.
+    Có detect()/draw_detections() giống personDetector nên dùng thay thế được luôn.
+    """
+
+    def __init__(self, detector: personDetector, max_batch: int = 4, max_delay: float = 0.02):
+        self.detector = detector
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max(0.0, max_delay)
+
+        self.batches_run = 0
+        self.frames_run = 0
+
+        self._queue = queue.Queue()
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, frame) -> Future:
+        """Đưa 1 frame vào hàng chờ, trả về Future chứa mảng DET_DTYPE."""
+        fut = Future()
+        if not self._running:
+            fut.set_exception(RuntimeError("DetectBatcher đã đóng"))
+            return fut
+        self._queue.put((frame, fut))
+        return fut
+
+    def detect(self, frame, timeout: float | None = None):
+        return self.submit(frame).result(timeout=timeout)
+
+    def detect_batch(self, frames, timeout: float | None = None):
+        """Đưa cả loạt frame (vd các tile của 1 frame) vào hàng chờ, đợi đủ kết quả."""
+        futures = [self.submit(frame) for frame in frames]
+        return [fut.result(timeout=timeout) for fut in futures]
+
+    def draw_detections(self, frame, detections):
+        self.detector.draw_detections(frame, detections)
+
+    def _loop(self):
+        while self._running:
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if first is None:
+                break
+
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    self._running = False
+                    break
+                batch.append(entry)
+
+            self._run_batch(batch)
+
+        # trả lỗi cho các frame còn kẹt trong hàng chờ
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not None:
+                entry[1].set_exception(RuntimeError("DetectBatcher đã đóng"))
+
+    def _run_batch(self, batch):
+        frames = [frame for frame, _ in batch]
+        try:
+            results = self.detector.detect_batch(frames)
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+
+        self.batches_run += 1
+        self.frames_run += len(batch)
+        for (_, fut), dets in zip(batch, results):
+            fut.set_result(dets)
+
+    def close(self):
+        self._running = False
+        self._queue.put(None)
+        self._thread.join(timeout=2.0)
+
+
+class TiledDetector:
+    """
+    Detect người ở xa (vài chục pixel) mà vẫn giữ img_size=320:
+    mỗi frame chạy 1 lượt cả frame ở 320 + tối đa max_tiles ô tile_size x tile_size
+    (mỗi ô cũng ở 320 -> gần như độ phân giải gốc), gộp bằng NMS.
+    Chi phí mỗi frame cố định = (1 + max_tiles) lượt forward 320, chọn ô theo thứ tự ưu tiên:
+      1. ô có chuyển động (regions, vd MotionGate.motion_boxes), nhiều chuyển động trước;
+      2. ô đang chứa người nhỏ đã thấy ở lần trước (giữ track người ở xa);
+      3. các ô còn lại lần lượt xoay vòng (luôn có ít nhất 1 ô) -> toàn bộ frame được quét sau vài frame.
+    Có detect()/draw_detections() như personDetector; state xoay vòng riêng từng camera
+    nên mỗi camera 1 TiledDetector, cùng bọc 1 personDetector / DetectBatcher.
+    """
+
+    def __init__(self, detector, tile_size: int = 320, overlap: float = 0.25, max_tiles: int = 4,
+                 full_frame: bool = True, small_ratio: float = 0.25, hold_frames: int = 30):
+        """
+        max_tiles: ngân sách số ô mỗi frame (0 = chỉ chạy cả frame như thường).
+        small_ratio: người cao dưới tỉ lệ này của chiều cao frame coi là "ở xa" -> ưu tiên ô chứa họ.
+        hold_frames: ô vừa thấy người ở xa được ưu tiên thêm bấy nhiêu lần detect.
+        """
+        self.detector = detector
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.max_tiles = max(0, max_tiles)
+        self.full_frame = full_frame
+        self.small_ratio = small_ratio
+        self.hold_frames = hold_frames
+
+        self._size = None
+        self._tiles = None
+        self._cursor = 0
+        self._last_run = None     # số frame lần cuối mỗi ô được chạy
+        self._last_small = None   # số frame lần cuối mỗi ô có người ở xa
+        self._frame = 0
+
+    def schedule(self, width: int, height: int, regions=None):
+        """Chọn các ô sẽ chạy ở frame này (mảng (K, 4) xyxy, K <= max_tiles)."""
+        if self._size != (width, height):
+            self._size = (width, height)
+            self._tiles = tile_grid(width, height, self.tile_size, self.overlap)
+            self._cursor = 0
+            self._last_run = np.zeros(len(self._tiles), dtype=np.int64)
+            self._last_small = np.full(len(self._tiles), -self.hold_frames - 1, dtype=np.int64)
+        self._frame += 1
+        tiles = self._tiles
+        # 1 ô đã phủ cả frame -> lượt cả frame là đủ
+        if self.max_tiles == 0 or len(tiles) <= 1:
+            return tiles[:0]
+
+        score = np.zeros(len(tiles), dtype=np.float32)
+        if regions is not None and len(regions):
+            r = np.asarray(regions, dtype=np.float32).reshape(-1, 4)
+            ix = np.clip(np.minimum(tiles[:, None, 2], r[None, :, 2]) - np.maximum(tiles[:, None, 0], r[None, :, 0]), 0, None)
+            iy = np.clip(np.minimum(tiles[:, None, 3], r[None, :, 3]) - np.maximum(tiles[:, None, 1], r[None, :, 1]), 0, None)
+            score += (ix * iy).sum(axis=1)
+
+        score += (self._frame - self._last_small <= self.hold_frames) * float(self.tile_size ** 2)
+
+        # chừa ít nhất 1 ô cho quét xoay vòng, không thì người ở xa chỗ khác không bao giờ được thấy
+        n_priority = self.max_tiles - 1 if self.max_tiles > 1 else self.max_tiles
+        # nhiều ô ưu tiên hơn ngân sách -> ô lâu chưa chạy nhất trước, rồi tới điểm cao
+        age = self._frame - self._last_run
+        order = np.lexsort((-score, -age))
+        chosen = [int(i) for i in order if score[i] > 0][:n_priority]
+        # còn ngân sách -> quét xoay vòng các ô khác
+        n = len(tiles)
+        for _ in range(n):
+            if len(chosen) >= self.max_tiles:
+                break
+            i = self._cursor
+            self._cursor = (self._cursor + 1) % n
+            if i not in chosen:
+                chosen.append(i)
+        chosen = sorted(chosen)
+        self._last_run[chosen] = self._frame
+        return tiles[chosen]
+
+    def detect(self, frame, regions=None):
+        h, w = frame.shape[:2]
+        tiles = self.schedule(w, h, regions)
+        if len(tiles) == 0:
+            dets = self.detector.detect(frame)
+        else:
+            dets = detect_tiled(self.detector, frame, tiles, full_frame=self.full_frame)
+            self._mark_small(dets, h)
+        return dets
+
+    def _mark_small(self, dets, height):
+        """Ghi nhớ các ô đang có người ở xa để các frame sau ưu tiên chạy lại."""
+        b = dets["xyxy"]
+        small = b[(b[:, 3] - b[:, 1]) < self.small_ratio * height]
+        if len(small) == 0:
+            return
+        cx = (small[:, 0] + small[:, 2]) / 2
+        cy = (small[:, 1] + small[:, 3]) / 2
+        # mỗi người chỉ đánh dấu 1 ô: ô có tâm gần người nhất (người nằm trọn trong ô đó nhất)
+        tiles = self._tiles
+        tx = (tiles[:, 0] + tiles[:, 2]) / 2
+        ty = (tiles[:, 1] + tiles[:, 3]) / 2
+        nearest = np.argmin((tx[:, None] - cx) ** 2 + (ty[:, None] - cy) ** 2, axis=0)
+        self._last_small[nearest] = self._frame
+
+    def draw_detections(self, frame, detections):
+        self.detector.draw_detections(frame, detections)
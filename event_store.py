@@ -0,0 +1,227 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from metrics import Counter
+
+EVENTS_WRITTEN = Counter("events_written_total", "Số sự kiện đã ghi vào EventStore")
+EVENTS_DROPPED = Counter("events_dropped_total", "Số sự kiện bị bỏ vì hàng đợi ghi đầy")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts          REAL    NOT NULL,
+    camera      TEXT    NOT NULL DEFAULT '',
+    kind        TEXT    NOT NULL DEFAULT '',
+    track_ids   TEXT    NOT NULL DEFAULT '[]',
+    names       TEXT    NOT NULL DEFAULT '[]',
+    confidences TEXT    NOT NULL DEFAULT '[]',
+    boxes       TEXT    NOT NULL DEFAULT '[]',
+    image_path  TEXT,
+    clip_path   TEXT,
+    message     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS idx_events_camera_ts ON events (camera, ts);
+CREATE INDEX IF NOT EXISTS idx_events_kind_ts ON events (kind, ts);
+
+-- 1 dòng cho mỗi (sự kiện, tên) để tìm theo danh tính bằng index
+CREATE TABLE IF NOT EXISTS event_identities (
+    event_id INTEGER NOT NULL REFERENCES events (id),
+    name     TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_identities_name ON event_identities (name, event_id);
+"""
+
+_JSON_FIELDS = ("track_ids", "names", "confidences", "boxes")
+
+
+class EventStore:
+    """
+    Lưu sự kiện cảnh báo vào SQLite (chỉ thêm, không sửa):
+    thời gian, camera, loại, track id, tên, confidence, bbox, đường dẫn ảnh.
+    - add() chỉ đưa vào hàng đợi, 1 thread nền ghi theo lô (1 transaction / lô)
+      -> vòng lặp xử lý frame không bao giờ chờ đĩa.
+    - query() lọc theo thời gian / camera / tên / loại, phân trang theo id (keyset).
+    """
+
+    def __init__(self, path: str = "alerts/events.db", batch_size: int = 100,
+                 flush_interval: float = 1.0, queue_size: int = 10000):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+            # DB tạo từ bản trước chưa có cột clip_path
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(events)")}
+            if "clip_path" not in columns:
+                conn.execute("ALTER TABLE events ADD COLUMN clip_path TEXT")
+                conn.commit()
+        finally:
+            conn.close()
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        # WAL: đọc (API web) không chặn ghi và ngược lại
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # ======== GHI ========
+    def add(self, camera: str = "", kind: str = "", track_ids=(), names=(), confidences=(),
+            boxes=(), image_path: str | None = None, message: str | None = None,
+            ts: float | None = None, clip_path: str | None = None) -> bool:
+        """Thêm 1 sự kiện (không chặn). Hàng đợi đầy -> bỏ, trả về False."""
+        event = {
+            "ts": time.time() if ts is None else ts,
+            "camera": camera or "",
+            "kind": kind or "",
+            "track_ids": [int(t) for t in track_ids],
+            "names": [str(n) for n in names],
+            "confidences": [round(float(c), 3) for c in confidences],
+            "boxes": [[int(v) for v in b] for b in boxes],
+            "image_path": image_path,
+            "clip_path": clip_path,
+            "message": message,
+        }
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            EVENTS_DROPPED.inc()
+            return False
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            events = [e for e in batch if e is not None]
+            try:
+                self._write_batch(conn, events)
+            except sqlite3.Error as e:
+                print("[EventStore] Lỗi ghi sự kiện:", e)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                break
+        conn.close()
+
+    @staticmethod
+    def _write_batch(conn, events):
+        if not events:
+            return
+        with conn:
+            for e in events:
+                cur = conn.execute(
+                    "INSERT INTO events (ts, camera, kind, track_ids, names, confidences, boxes,"
+                    " image_path, clip_path, message) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        e["ts"], e["camera"], e["kind"],
+                        *(json.dumps(e[f]) for f in _JSON_FIELDS),
+                        e["image_path"], e["clip_path"], e["message"],
+                    ),
+                )
+                names = sorted(set(e["names"]))
+                if names:
+                    conn.executemany(
+                        "INSERT INTO event_identities (event_id, name) VALUES (?, ?)",
+                        [(cur.lastrowid, n) for n in names],
+                    )
+        EVENTS_WRITTEN.inc(len(events))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Chờ ghi hết hàng đợi (test / lúc tắt)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.02)
+        return True
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5.0)
+
+    # ======== ĐỌC ========
+    @staticmethod
+    def _row_to_event(row):
+        event = dict(row)
+        for f in _JSON_FIELDS:
+            event[f] = json.loads(event[f])
+        return event
+
+    def query(self, start: float | None = None, end: float | None = None, camera: str | None = None,
+              name: str | None = None, kind: str | None = None, limit: int = 50,
+              before_id: int | None = None):
+        """
+        Sự kiện mới nhất trước, tối đa limit dòng.
+        Trả về (events, next_cursor): next_cursor truyền lại vào before_id để lấy trang sau,
+        None nếu hết.
+        """
+        limit = max(1, min(int(limit), 500))
+        where = []
+        params = []
+        if name:
+            sql = "SELECT e.* FROM events e JOIN event_identities i ON i.event_id = e.id"
+            where.append("i.name = ?")
+            params.append(name)
+        else:
+            sql = "SELECT e.* FROM events e"
+        if start is not None:
+            where.append("e.ts >= ?")
+            params.append(float(start))
+        if end is not None:
+            where.append("e.ts < ?")
+            params.append(float(end))
+        if camera:
+            where.append("e.camera = ?")
+            params.append(camera)
+        if kind:
+            where.append("e.kind = ?")
+            params.append(kind)
+        if before_id is not None:
+            where.append("e.id < ?")
+            params.append(int(before_id))
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY e.id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        events = [self._row_to_event(r) for r in rows[:limit]]
+        next_cursor = events[-1]["id"] if len(rows) > limit else None
+        return events, next_cursor
+
+    def get(self, event_id: int):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM events WHERE id = ?", (int(event_id),)).fetchone()
+        finally:
+            conn.close()
+        return self._row_to_event(row) if row is not None else None
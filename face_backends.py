@@ -0,0 +1,190 @@
+import os
+import json
+import threading
+
+import cv2
+import numpy as np
+
+from face_gallery import FaceGallery, normalize_rows
+
+
+class LBPHBackend:
+    """
+    Backend mặc định: LBPH của OpenCV, dự đoán từng mặt một.
+    confidence là khoảng cách LBPH, nhỏ hơn threshold -> người quen.
+    """
+
+    def __init__(
+        self,
+        model_path: str = "Models/face_lbph.xml",
+        labels_path: str = "Models/face_labels.json",
+        threshold: float = 70.0,
+    ):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Không tìm thấy model: {model_path}")
+        if not os.path.exists(labels_path):
+            raise FileNotFoundError(f"Không tìm thấy labels: {labels_path}")
+
+        self.model_path = model_path
+        self.labels_path = labels_path
+        # train_face_recognizer.py ghi model -> labels -> manifest (cuối cùng)
+        self.manifest_path = os.path.join(os.path.dirname(model_path), "face_manifest.json")
+        self.threshold = threshold
+
+        # (recognizer, id_to_name) gán 1 lần -> thread đang identify không thấy nửa cũ nửa mới
+        self._model = self._load()
+        self._mtimes = self._file_mtimes()
+
+    def _load(self):
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        recognizer.read(self.model_path)
+
+        # map id -> tên
+        with open(self.labels_path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+            id_to_name = {int(k): v for k, v in raw.items()}
+
+        return recognizer, id_to_name
+
+    def _file_mtimes(self):
+        manifest = os.path.getmtime(self.manifest_path) if os.path.exists(self.manifest_path) else None
+        return (os.path.getmtime(self.model_path), os.path.getmtime(self.labels_path), manifest)
+
+    def _changed(self, mtimes) -> bool:
+        """
+        Trainer thay model rồi mới tới labels: nạp giữa 2 lần thay sẽ ghép model mới với labels cũ.
+        Có manifest (ghi sau cùng) -> chỉ nạp khi manifest đổi; không có -> chờ cả model lẫn labels đổi.
+        """
+        if mtimes[2] is not None:
+            return mtimes[2] != self._mtimes[2]
+        return mtimes[0] != self._mtimes[0] and mtimes[1] != self._mtimes[1]
+
+    @property
+    def recognizer(self):
+        return self._model[0]
+
+    @property
+    def id_to_name(self):
+        return self._model[1]
+
+    def reload_if_changed(self) -> bool:
+        """Model / labels trên đĩa đổi (train_face_recognizer.py vừa chạy) -> nạp lại."""
+        try:
+            mtimes = self._file_mtimes()
+        except OSError:
+            return False
+        if not self._changed(mtimes):
+            return False
+
+        try:
+            model = self._load()
+        except Exception as e:
+            print("[LBPHBackend] Lỗi nạp lại model:", e)
+            return False
+
+        self._model = model
+        self._mtimes = mtimes
+        print(f"[LBPHBackend] Đã nạp lại model: {self.model_path}")
+        return True
+
+    def identify(self, faces):
+        """
+        faces: list ảnh xám vùng mặt (kích thước bất kỳ).
+        Trả về list (name, confidence, is_known) theo đúng thứ tự.
+        """
+        recognizer, id_to_name = self._model
+
+        results = []
+        for roi in faces:
+            roi_resized = cv2.resize(roi, (200, 200))
+            label_id, confidence = recognizer.predict(roi_resized)
+
+            if confidence < self.threshold and label_id in id_to_name:
+                results.append((id_to_name[label_id], float(confidence), True))
+            else:
+                results.append(("Unknown", float(confidence), False))
+        return results
+
+
+class EmbeddingBackend:
+    """
+    Backend embedding: model ONNX (vd SFace / ArcFace) chạy bằng cv2.dnn trên CPU,
+    cả batch mặt trong 1 frame đi qua mạng 1 lần rồi so khớp cosine với FaceGallery.
+    confidence = cosine distance (1 - cos), nhỏ hơn threshold -> người quen,
+    cùng chiều với ngưỡng của LBPH.
+    """
+
+    def __init__(
+        self,
+        model_path: str = "Models/face_embedding.onnx",
+        gallery_path: str | None = "Models/face_gallery.npz",
+        threshold: float = 0.45,
+        input_size=(112, 112),
+        mean: float = 127.5,
+        scale: float = 1.0 / 127.5,
+        ann_min_size: int = 5000,
+        nprobe: int = 8,
+    ):
+        """
+        ann_min_size: gallery từ bấy nhiêu embedding trở lên thì search qua IVFIndex.
+        nprobe: số cụm IVF quét mỗi query (tăng -> recall cao hơn, chậm hơn).
+        """
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Không tìm thấy model: {model_path}")
+
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self._net_lock = threading.Lock()   # cv2.dnn.Net không dùng chung giữa thread được
+
+        if gallery_path and os.path.exists(gallery_path):
+            self.gallery = FaceGallery.load(gallery_path)
+        else:
+            self.gallery = FaceGallery()
+
+        if len(self.gallery) >= ann_min_size and self.gallery.index is None:
+            print(f"[EmbeddingBackend] Gallery {len(self.gallery)} embedding, dựng IVF index...")
+            self.gallery.build_index(nprobe=nprobe)
+        if self.gallery.index is not None:
+            self.gallery.index.nprobe = nprobe
+        self.threshold = threshold
+        self.input_size = tuple(input_size)
+        self.mean = mean
+        self.scale = scale
+
+    @property
+    def id_to_name(self):
+        return self.gallery.id_to_name
+
+    def embed(self, faces):
+        """faces: list ảnh xám / BGR -> ma trận embedding (N, D) đã chuẩn hoá."""
+        if not faces:
+            return np.zeros((0, self.gallery.dim or 0), dtype=np.float32)
+
+        images = [cv2.cvtColor(f, cv2.COLOR_GRAY2BGR) if f.ndim == 2 else f for f in faces]
+        blob = cv2.dnn.blobFromImages(
+            images,
+            scalefactor=self.scale,
+            size=self.input_size,
+            mean=(self.mean, self.mean, self.mean),
+            swapRB=True,
+        )
+        with self._net_lock:
+            self.net.setInput(blob)
+            out = self.net.forward()
+        return normalize_rows(out.reshape(len(images), -1))
+
+    def identify(self, faces):
+        if not faces:
+            return []
+
+        label_ids, sims = self.gallery.search(self.embed(faces))
+
+        results = []
+        for label_id, sim in zip(label_ids.tolist(), sims.tolist()):
+            distance = 1.0 - sim
+            if distance < self.threshold and label_id in self.gallery.id_to_name:
+                results.append((self.gallery.id_to_name[label_id], distance, True))
+            else:
+                results.append(("Unknown", distance, False))
+        return results
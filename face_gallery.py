@@ -0,0 +1,342 @@
+import os
+
+import numpy as np
+
+
+def normalize_rows(x):
+    """Chuẩn hoá L2 từng dòng để tích vô hướng = cosine similarity."""
+    x = np.asarray(x, dtype=np.float32)
+    if x.ndim == 1:
+        x = x[None, :]
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+class FaceGallery:
+    """
+    Kho embedding khuôn mặt đã enroll, lưu thành 1 ma trận NumPy (N, D) đã chuẩn hoá.
+    - labels[i]: id người của embedding i, id_to_name: map id -> tên (giống face_labels.json).
+    - search(): cosine similarity cho cả batch mặt bằng 1 phép nhân ma trận.
+    - build_index(): gallery lớn thì search qua IVFIndex (ANN) thay vì quét toàn bộ.
+    Bộ nhớ cấp dư (nhân đôi khi đầy) nên enroll hàng loạt vẫn O(N), không copy lại cả ma trận mỗi lần add.
+    """
+
+    def __init__(self, dim: int | None = None):
+        self.dim = dim
+        self._emb_buf = np.zeros((0, dim or 0), dtype=np.float32)
+        self._label_buf = np.zeros(0, dtype=np.int32)
+        self._size = 0
+        self.id_to_name = {}
+        self.index = None
+
+    def __len__(self):
+        return self._size
+
+    # embeddings / labels là view lên phần đã dùng của buffer; gán trực tiếp (load, bench) vẫn được
+    @property
+    def embeddings(self):
+        return self._emb_buf[:self._size]
+
+    @embeddings.setter
+    def embeddings(self, value):
+        self._emb_buf = np.asarray(value, dtype=np.float32)
+        self._size = len(self._emb_buf)
+        if self._emb_buf.ndim == 2:
+            self.dim = self._emb_buf.shape[1]
+
+    @property
+    def labels(self):
+        return self._label_buf[:self._size]
+
+    @labels.setter
+    def labels(self, value):
+        self._label_buf = np.asarray(value, dtype=np.int32)
+
+    @property
+    def id_to_name(self):
+        return self._id_to_name
+
+    @id_to_name.setter
+    def id_to_name(self, value):
+        self._id_to_name = dict(value)
+        self._name_to_id = {n: k for k, n in self._id_to_name.items()}
+
+    def _label_for(self, name: str) -> int:
+        label_id = self._name_to_id.get(name)
+        if label_id is None:
+            label_id = max(self._id_to_name, default=-1) + 1
+            self._id_to_name[label_id] = name
+            self._name_to_id[name] = label_id
+        return label_id
+
+    def _reserve(self, n: int):
+        """Đảm bảo buffer chứa được thêm n dòng (tăng gấp đôi khi thiếu)."""
+        need = self._size + n
+        capacity = min(len(self._emb_buf), len(self._label_buf))
+        if need <= capacity:
+            return
+        new_cap = max(need, 2 * capacity, 64)
+        emb = np.empty((new_cap, self.dim), dtype=np.float32)
+        emb[:self._size] = self._emb_buf[:self._size]
+        labels = np.empty(new_cap, dtype=np.int32)
+        labels[:self._size] = self._label_buf[:self._size]
+        self._emb_buf, self._label_buf = emb, labels
+
+    def add(self, name: str, embeddings):
+        """Thêm 1 hoặc nhiều embedding cho người tên name."""
+        emb = normalize_rows(embeddings)
+        if emb.size == 0:
+            return self._name_to_id.get(name)
+        return self.add_batch([name] * len(emb), emb)[0]
+
+    def add_batch(self, names, embeddings):
+        """
+        Enroll hàng loạt: names[i] là tên của embeddings[i].
+        Trả về mảng label id tương ứng từng dòng.
+        """
+        emb = normalize_rows(embeddings)
+        if len(names) == 0 and emb.size == 0:
+            return np.zeros(0, dtype=np.int32)
+        if len(names) != len(emb):
+            raise ValueError(f"{len(names)} tên nhưng {len(emb)} embedding")
+        if self.dim is None or len(self) == 0:
+            self.dim = emb.shape[1]
+            self._emb_buf = np.zeros((0, self.dim), dtype=np.float32)
+            self._label_buf = np.zeros(0, dtype=np.int32)
+            self._size = 0
+        elif emb.shape[1] != self.dim:
+            raise ValueError(f"Embedding dim {emb.shape[1]} khác gallery ({self.dim})")
+
+        new_labels = np.array([self._label_for(n) for n in names], dtype=np.int32)
+        self._reserve(len(emb))
+        self._emb_buf[self._size:self._size + len(emb)] = emb
+        self._label_buf[self._size:self._size + len(emb)] = new_labels
+        self._size += len(emb)
+        if self.index is not None:
+            self.index.add(emb, new_labels)
+        return new_labels
+
+    def remove(self, name: str):
+        """Xoá toàn bộ embedding của 1 người. Trả về số embedding đã xoá."""
+        label_id = self._name_to_id.get(name)
+        if label_id is None:
+            return 0
+        label_ids = [label_id]
+        keep = ~np.isin(self.labels, label_ids)
+        removed = int((~keep).sum())
+        labels = self.labels[keep]
+        self.embeddings = self.embeddings[keep]
+        self.labels = labels
+        del self._id_to_name[label_id]
+        del self._name_to_id[name]
+        if self.index is not None:
+            self.index.remove(label_ids)
+        return removed
+
+    def build_index(self, nlist: int | None = None, nprobe: int = 8):
+        """Dựng IVFIndex từ toàn bộ embedding hiện có."""
+        if len(self) == 0:
+            raise RuntimeError("Gallery rỗng, chưa dựng index được")
+        self.index = IVFIndex.train(self.embeddings, nlist=nlist, nprobe=nprobe)
+        self.index.add(self.embeddings, self.labels)
+        return self.index
+
+    def search(self, queries):
+        """
+        Tìm embedding gần nhất cho mỗi query.
+        Trả về (label_ids (M,), similarities (M,)); gallery rỗng -> label -1, sim -1.
+        """
+        q = normalize_rows(queries)
+        if len(self) == 0:
+            return np.full(len(q), -1, dtype=np.int32), np.full(len(q), -1.0, dtype=np.float32)
+        if self.index is not None:
+            return self.index.search(q)
+
+        sims = q @ self.embeddings.T
+        best = np.argmax(sims, axis=1)
+        return self.labels[best], sims[np.arange(len(q)), best]
+
+    def save(self, path: str = "Models/face_gallery.npz"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        ids = np.array(sorted(self.id_to_name), dtype=np.int32)
+        names = np.array([self.id_to_name[int(i)] for i in ids], dtype=object)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, embeddings=self.embeddings, labels=self.labels, ids=ids, names=names)
+        os.replace(tmp_path, path)
+        if self.index is not None:
+            self.index.save(self.index_path(path))
+
+    @staticmethod
+    def index_path(path: str) -> str:
+        """Models/face_gallery.npz -> Models/face_gallery_ivf.npz"""
+        root, ext = os.path.splitext(path)
+        return f"{root}_ivf{ext or '.npz'}"
+
+    @classmethod
+    def load(cls, path: str = "Models/face_gallery.npz"):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Không tìm thấy gallery: {path}")
+        data = np.load(path, allow_pickle=True)
+        gallery = cls(dim=int(data["embeddings"].shape[1]))
+        gallery.embeddings = data["embeddings"].astype(np.float32)
+        gallery.labels = data["labels"].astype(np.int32)
+        gallery.id_to_name = {int(i): str(n) for i, n in zip(data["ids"], data["names"])}
+        if os.path.exists(cls.index_path(path)):
+            gallery.index = IVFIndex.load(cls.index_path(path))
+        return gallery
+
+
+class IVFIndex:
+    """
+    Index ANN kiểu IVF-Flat dựng ngay trong process (không cần thư viện ngoài):
+    k-means chia embedding thành nlist cụm, search chỉ quét nprobe cụm gần query nhất.
+    nprobe là nút chỉnh recall / tốc độ: nhỏ -> nhanh, nprobe = nlist -> như quét toàn bộ.
+    """
+
+    def __init__(self, centroids, nprobe: int = 8):
+        self.centroids = normalize_rows(centroids)
+        self.nlist, self.dim = self.centroids.shape
+        self.nprobe = nprobe
+        # mỗi cụm 1 buffer cấp dư (nhân đôi khi đầy) như FaceGallery, _sizes[i] = số dòng đang dùng
+        self._vec_bufs = [np.zeros((0, self.dim), dtype=np.float32) for _ in range(self.nlist)]
+        self._label_bufs = [np.zeros(0, dtype=np.int32) for _ in range(self.nlist)]
+        self._sizes = [0] * self.nlist
+
+    def __len__(self):
+        return sum(self._sizes)
+
+    @property
+    def list_vecs(self):
+        return [buf[:n] for buf, n in zip(self._vec_bufs, self._sizes)]
+
+    @property
+    def list_labels(self):
+        return [buf[:n] for buf, n in zip(self._label_bufs, self._sizes)]
+
+    def _set_list(self, list_id, vecs, labels):
+        self._vec_bufs[list_id] = np.asarray(vecs, dtype=np.float32)
+        self._label_bufs[list_id] = np.asarray(labels, dtype=np.int32)
+        self._sizes[list_id] = len(labels)
+
+    def _append(self, list_id, vecs, labels):
+        n = self._sizes[list_id]
+        need = n + len(vecs)
+        if need > len(self._vec_bufs[list_id]):
+            cap = max(need, 2 * len(self._vec_bufs[list_id]), 16)
+            grown = np.empty((cap, self.dim), dtype=np.float32)
+            grown[:n] = self._vec_bufs[list_id][:n]
+            grown_labels = np.empty(cap, dtype=np.int32)
+            grown_labels[:n] = self._label_bufs[list_id][:n]
+            self._vec_bufs[list_id], self._label_bufs[list_id] = grown, grown_labels
+        self._vec_bufs[list_id][n:need] = vecs
+        self._label_bufs[list_id][n:need] = labels
+        self._sizes[list_id] = need
+
+    @classmethod
+    def train(cls, vectors, nlist: int | None = None, nprobe: int = 8, iters: int = 10,
+              max_sample: int = 50000, seed: int = 0):
+        """k-means (cosine) trên tối đa max_sample vector để tìm tâm cụm."""
+        x = normalize_rows(vectors)
+        if nlist is None:
+            nlist = int(4 * np.sqrt(len(x)))
+        nlist = max(1, min(nlist, len(x)))
+
+        rng = np.random.default_rng(seed)
+        if len(x) > max_sample:
+            x = x[rng.choice(len(x), max_sample, replace=False)]
+
+        centroids = x[rng.choice(len(x), nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(x @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, x)
+            counts = np.bincount(assign, minlength=nlist)
+            empty = counts == 0
+            # cụm rỗng -> lấy lại 1 điểm ngẫu nhiên
+            sums[empty] = x[rng.choice(len(x), int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        return cls(centroids, nprobe=nprobe)
+
+    def _assign(self, x):
+        return np.argmax(x @ self.centroids.T, axis=1)
+
+    def add(self, vectors, labels):
+        x = normalize_rows(vectors)
+        labels = np.asarray(labels, dtype=np.int32).reshape(-1)
+        if len(labels) == 0:
+            return
+        assign = self._assign(x)
+        for list_id in np.unique(assign).tolist():
+            rows = assign == list_id
+            self._append(list_id, x[rows], labels[rows])
+
+    def remove(self, label_ids):
+        removed = 0
+        for i, (vecs, labels) in enumerate(zip(self.list_vecs, self.list_labels)):
+            keep = ~np.isin(labels, label_ids)
+            removed += int((~keep).sum())
+            self._set_list(i, vecs[keep], labels[keep])
+        return removed
+
+    def search(self, queries, nprobe: int | None = None):
+        """Giống FaceGallery.search: trả về (label_ids, similarities)."""
+        q = normalize_rows(queries)
+        nprobe = max(1, min(nprobe or self.nprobe, self.nlist))
+
+        best_sim = np.full(len(q), -1.0, dtype=np.float32)
+        best_label = np.full(len(q), -1, dtype=np.int32)
+        if len(q) == 0:
+            return best_label, best_sim
+
+        coarse = q @ self.centroids.T
+        if nprobe < self.nlist:
+            probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.broadcast_to(np.arange(self.nlist), (len(q), self.nlist))
+
+        # gom các query cùng quét 1 cụm -> 1 phép nhân ma trận cho mỗi cụm
+        flat_lists = probes.ravel()
+        flat_queries = np.repeat(np.arange(len(q)), probes.shape[1])
+        order = np.argsort(flat_lists, kind="stable")
+        list_ids, starts = np.unique(flat_lists[order], return_index=True)
+        groups = np.split(flat_queries[order], starts[1:])
+
+        for list_id, qs in zip(list_ids.tolist(), groups):
+            n = self._sizes[list_id]
+            vecs = self._vec_bufs[list_id][:n]
+            if len(vecs) == 0:
+                continue
+            sims = q[qs] @ vecs.T
+            idx = np.argmax(sims, axis=1)
+            top = sims[np.arange(len(qs)), idx]
+            better = top > best_sim[qs]
+            best_sim[qs[better]] = top[better]
+            best_label[qs[better]] = self._label_bufs[list_id][idx[better]]
+
+        return best_label, best_sim
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        offsets = np.cumsum([0] + [len(lb) for lb in self.list_labels])
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            centroids=self.centroids,
+            vecs=np.vstack(self.list_vecs),
+            labels=np.concatenate(self.list_labels),
+            offsets=offsets,
+            nprobe=self.nprobe,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        data = np.load(path)
+        index = cls(data["centroids"], nprobe=int(data["nprobe"]))
+        offsets = data["offsets"]
+        vecs = data["vecs"].astype(np.float32)
+        labels = data["labels"].astype(np.int32)
+        for i in range(index.nlist):
+            index._set_list(i, vecs[offsets[i]:offsets[i + 1]], labels[offsets[i]:offsets[i + 1]])
+        return index
@@ -1,11 +1,19 @@
-import os
-import json
+import threading
+import time
+
 import cv2
+import numpy as np
+
+from face_backends import LBPHBackend
+from metrics import FACE_CLASSIFY, HAAR_DETECT
 
 
 class FaceRecognizer:
     """
-    Nhận diện người quen / người lạ bằng LBPH + Haar cascade.
+    Nhận diện người quen / người lạ: Haar cascade tìm mặt + backend nhận diện.
+    - backend mặc định: LBPHBackend(model_path, labels_path, threshold)
+    - có thể truyền backend khác (vd EmbeddingBackend) có hàm identify(faces)
+      trả về list (name, confidence, is_known).
     - model_path: Models/face_lbph.xml (train từ train_face_recognizer.py)
     - labels_path: Models/face_labels.json
     - threshold: ngưỡng confidence, nhỏ hơn -> coi là người quen
@@ -16,28 +24,46 @@ class FaceRecognizer:
         model_path: str = "Models/face_lbph.xml",
         labels_path: str = "Models/face_labels.json",
         threshold: float = 70.0,
+        backend=None,
     ):
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Không tìm thấy model: {model_path}")
-        if not os.path.exists(labels_path):
-            raise FileNotFoundError(f"Không tìm thấy labels: {labels_path}")
-
-        # LBPH
-        self.recognizer = cv2.face.LBPHFaceRecognizer_create()
-        self.recognizer.read(model_path)
-
-        # map id -> tên
-        with open(labels_path, "r", encoding="utf-8") as f:
-            raw = json.load(f)
-            self.id_to_name = {int(k): v for k, v in raw.items()}
-
-        self.threshold = threshold
-
-        # Haar cascade để tìm khuôn mặt
-        frontal_path = cv2.data.haarcascades + "haarcascade_frontalface_alt2.xml"
-        self.face_cascade = cv2.CascadeClassifier(frontal_path)
-        if self.face_cascade.empty():
-            raise RuntimeError(f"Không load được cascade: {frontal_path}")
+        if backend is None:
+            backend = LBPHBackend(model_path, labels_path, threshold)
+        self.backend = backend
+        self._m_classify = FACE_CLASSIFY.labels(type(backend).__name__)
+
+        self.min_face_size = (60, 60)
+
+        # Haar cascade để tìm khuôn mặt.
+        # CascadeClassifier không an toàn khi nhiều thread cùng gọi detectMultiScale
+        # (stage recognize chạy nhiều worker) -> mỗi thread 1 bản riêng.
+        self._cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_alt2.xml"
+        self._local = threading.local()
+        self.face_cascade   # load thử ngay để báo lỗi sớm
+
+    @property
+    def face_cascade(self):
+        cascade = getattr(self._local, "cascade", None)
+        if cascade is None:
+            cascade = cv2.CascadeClassifier(self._cascade_path)
+            if cascade.empty():
+                raise RuntimeError(f"Không load được cascade: {self._cascade_path}")
+            self._local.cascade = cascade
+        return cascade
+
+    def reload_if_changed(self) -> bool:
+        """Nạp lại model nếu file trên đĩa đã đổi (backend có hỗ trợ)."""
+        reload = getattr(self.backend, "reload_if_changed", None)
+        return bool(reload and reload())
+
+    def start_auto_reload(self, interval: float = 5.0):
+        """Thread nền kiểm tra model mỗi interval giây, không cần restart web_app.py."""
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.reload_if_changed()
+
+        threading.Thread(target=loop, daemon=True).start()
 
     def recognize(self, frame):
         """
@@ -51,37 +77,79 @@ class FaceRecognizer:
         }
         """
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = self._detect_faces(gray)
+        rois = [gray[y:y + h, x:x + w] for (x, y, w, h) in faces]
+        return self._classify(rois, faces)
 
-        faces = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=6,
-            minSize=(60, 60),
-        )
-
-        results = []
-        for (x, y, w, h) in faces:
-            roi = gray[y:y + h, x:x + w]
-            roi_resized = cv2.resize(roi, (200, 200))
+    def recognize_in_regions(self, frame, person_boxes, upper_ratio: float = 0.6, margin: float = 0.1):
+        """
+        Chỉ chạy Haar cascade trong phần trên (đầu + vai) của từng bbox người,
+        rồi đổi toạ độ mặt về frame gốc. Không có người -> bỏ qua luôn.
+        person_boxes: mảng DET_DTYPE của personDetector hoặc mảng (N, 4) xyxy.
+        Kết quả giống recognize().
+        """
+        if len(person_boxes) == 0:
+            return []
+        if getattr(person_boxes, "dtype", None) is not None and person_boxes.dtype.names:
+            person_boxes = person_boxes["xyxy"]
+
+        fh, fw = frame.shape[:2]
+        min_w, min_h = self.min_face_size
+        rois = []
+        boxes = []
+        centers = []
+
+        for x1, y1, x2, y2 in np.asarray(person_boxes).tolist():
+            bw, bh = x2 - x1, y2 - y1
+            rx1 = max(0, int(x1 - margin * bw))
+            rx2 = min(fw, int(x2 + margin * bw))
+            ry1 = max(0, int(y1 - margin * bh))
+            ry2 = min(fh, int(y1 + upper_ratio * bh))
+            if rx2 - rx1 < min_w or ry2 - ry1 < min_h:
+                continue
+
+            gray = cv2.cvtColor(frame[ry1:ry2, rx1:rx2], cv2.COLOR_BGR2GRAY)
+            for (x, y, w, h) in self._detect_faces(gray):
+                box = (int(x + rx1), int(y + ry1), int(w), int(h))
+
+                # 2 bbox người chồng nhau -> cùng 1 mặt bị tìm 2 lần
+                cx, cy = box[0] + w // 2, box[1] + h // 2
+                if any(abs(cx - px) < w // 2 and abs(cy - py) < h // 2 for px, py in centers):
+                    continue
+                centers.append((cx, cy))
+
+                rois.append(gray[y:y + h, x:x + w])
+                boxes.append(box)
+
+        return self._classify(rois, boxes)
+
+    def _detect_faces(self, gray):
+        with HAAR_DETECT.time():
+            return self.face_cascade.detectMultiScale(
+                gray,
+                scaleFactor=1.1,
+                minNeighbors=6,
+                minSize=self.min_face_size,
+            )
 
-            label_id, confidence = self.recognizer.predict(roi_resized)
+    def _classify(self, rois, boxes):
+        """Nhận diện cả batch vùng mặt (ảnh xám) của 1 frame bằng backend."""
+        if len(rois) == 0:
+            return []
 
-            if confidence < self.threshold and label_id in self.id_to_name:
-                name = self.id_to_name[label_id]
-                is_known = True
-            else:
-                name = "Unknown"
-                is_known = False
+        with self._m_classify.time():
+            identified = self.backend.identify(rois)
 
+        results = []
+        for box, (name, confidence, is_known) in zip(boxes, identified):
             results.append(
                 {
-                    "box": (x, y, w, h),
+                    "box": tuple(int(v) for v in box),
                     "name": name,
                     "confidence": float(confidence),
                     "is_known": is_known,
                 }
             )
-
         return results
 
     def draw_faces(self, frame, results):
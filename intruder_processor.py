@@ -0,0 +1,439 @@
+import time
+
+import cv2
+import numpy as np
+
+from alert_policy import AlertPolicy
+from detector import TiledDetector, empty_detections
+from metrics import ALERTS, DRAW, JPEG_ENCODE
+from pipeline import Stage, StagePipeline, default_workers
+from tracker import PersonTracker
+
+
+class IntruderProcessor:
+    """
+    Logic nhận diện + cảnh báo dùng chung cho web_app.py và main_face_intruder_telgram.py.
+    Mỗi frame là 1 dict đi qua các stage:
+        detect (YOLO) -> recognize (Haar + LBPH) -> annotate (vẽ) -> alert (AlertPolicy + gửi) -> finish (resize/encode)
+    Có motion_gate thì chỉ chạy YOLO + nhận diện mặt khi MotionGate cho phép,
+    các frame còn lại dùng lại kết quả gần nhất.
+    PersonTracker gán track id cho từng người và cache danh tính, nên mặt chỉ được
+    nhận diện lại khi track mới / danh tính đã cũ; unknown_streak tính riêng từng track.
+    detect, annotate và alert giữ state giữa các frame nên chạy đúng thứ tự;
+    recognize và finish chạy song song nhiều worker.
+    """
+
+    UNKNOWN_STREAK_LIMIT = 10
+
+    ALERT_MESSAGES = {
+        "unknown": "Cảnh báo: phát hiện người lạ trước camera!",
+        "body": "Cảnh báo: phát hiện người (body) nhưng không nhận diện được mặt!",
+        "known": "Thông báo: {} xuất hiện trước camera.",
+    }
+
+    def __init__(
+        self,
+        person_detector,
+        face_recognizer,
+        alerts,
+        notifier=None,
+        digest=None,
+        event_store=None,
+        recorder=None,
+        policy=None,
+        zones=None,
+        motion_gate=None,
+        face_roi: bool = True,
+        tracker=None,
+        detect_every: int = 3,
+        max_width: int = 800,
+        name: str | None = None,
+        conf_threshold: float | None = None,
+        unknown_streak_limit: int | None = None,
+    ):
+        """
+        digest: AlertDigest (notifier.py) – có thì cảnh báo được gom thành album thay vì gửi lẻ.
+        event_store: EventStore – mỗi ảnh cảnh báo được ghi thêm 1 sự kiện (camera, track, tên, bbox...).
+        recorder: ClipRecorder – giữ vài giây frame gần nhất; cảnh báo "photo" bắt đầu ghi clip (kèm lúc
+                  người đó đi vào), leo thang tới mức "clip" thì ghi tiếp.
+        policy: AlertPolicy (mặc định: camera_cooldown = alerts.min_interval, còn lại theo DEFAULT_POLICY).
+        zones: ZoneSet – chỉ detect trong khung bao các vùng, chỉ nhận diện / cảnh báo người
+               có điểm chân trong vùng hoặc đã cắt tripwire.
+        motion_gate: MotionGate quyết định frame nào chạy inference.
+        face_roi: chỉ tìm mặt trong bbox người (recognize_in_regions), không quét cả frame.
+        tracker: PersonTracker (mặc định tạo mới).
+        detect_every: chỉ dùng khi không có motion_gate (YOLO mỗi N frame như cũ).
+        name: tên camera, thêm vào log / tin cảnh báo (chạy nhiều camera).
+        conf_threshold: lọc thêm detection theo camera khi detector dùng chung ngưỡng thấp hơn.
+        unknown_streak_limit: ghi đè UNKNOWN_STREAK_LIMIT cho riêng camera này.
+        """
+        self.person_detector = person_detector
+        self.face_recognizer = face_recognizer
+        self.alerts = alerts
+        self.notifier = notifier
+        self.digest = digest
+        self.event_store = event_store
+        self.recorder = recorder
+        self.policy = policy or AlertPolicy(camera_cooldown=alerts.min_interval, name=name or "")
+        self.zones = zones
+        self.tiled = isinstance(person_detector, TiledDetector)
+        self.motion_gate = motion_gate
+        self.face_roi = face_roi
+        self.tracker = tracker or PersonTracker()
+        self.detect_every = max(1, detect_every)
+        self.max_width = max_width
+        self.name = name
+        self.conf_threshold = conf_threshold
+        if unknown_streak_limit is not None:
+            self.UNKNOWN_STREAK_LIMIT = unknown_streak_limit
+
+        # state dùng chung giữa các frame
+        self.unknown_streak = 0     # chỉ cho mặt lạ không thuộc track nào
+        self.frame_idx = 0
+        self.last_person_dets = empty_detections()
+        self.loose_faces = []
+
+    # ======== CÁC STAGE ========
+    def detect(self, item):
+        """Phát hiện người (body) – YOLO, chỉ chạy khi có chuyển động / tới lượt."""
+        self.frame_idx += 1
+        frame = item["frame"]
+        h, w = frame.shape[:2]
+        # có vùng -> motion gate và YOLO chỉ nhìn khung bao các vùng
+        roi = self.zones.roi(w, h) if self.zones else None
+        view = frame[roi[1]:roi[3], roi[0]:roi[2]] if roi else frame
+
+        if self.motion_gate is not None:
+            occupied = len(self.last_person_dets) > 0
+            run_detect = self.motion_gate.update(view, occupied=occupied)
+            run_faces = run_detect
+        else:
+            run_detect = self.frame_idx % self.detect_every == 0
+            run_faces = True   # như bản cũ: nhận diện mặt mọi frame
+
+        dets = None
+        if run_detect:
+            if self.tiled:
+                # ưu tiên tile có chuyển động
+                regions = self.motion_gate.motion_boxes if self.motion_gate is not None else None
+                dets = self.person_detector.detect(view, regions=regions)
+            else:
+                dets = self.person_detector.detect(view)
+            if roi:
+                dets["xyxy"] += np.array([roi[0], roi[1], roi[0], roi[1]], dtype=np.int32)
+            if self.conf_threshold is not None:
+                dets = dets[dets["conf"] >= self.conf_threshold]
+
+        with self.tracker.lock:
+            if dets is not None:
+                self.last_person_dets = self.tracker.update(dets, self.frame_idx)
+                if self.zones:
+                    self._update_zones(self.last_person_dets, w, h)
+
+            item["frame_no"] = self.frame_idx
+            item["person_dets"] = self.last_person_dets
+            # vị trí track của đúng frame này, annotate dùng lại (tracker có thể đã sang frame sau)
+            item["tracks"] = self.tracker.snapshot()
+            # chỉ nhận diện lại các track chưa có / đã cũ danh tính (và đang ở trong vùng)
+            if run_faces:
+                dets = self.last_person_dets
+                if self.zones:
+                    dets = dets[self._roi_mask(dets)]
+                item["recognize_dets"] = self.tracker.schedule(dets, self.frame_idx)
+            else:
+                item["recognize_dets"] = None
+        return item
+
+    def _update_zones(self, dets, width, height):
+        zone_names, crossed_names = self.zones.update(
+            dets, width, height, alive_ids=[t.id for t in self.tracker.tracks]
+        )
+        for track_id, zones, crossed in zip(dets["track_id"].tolist(), zone_names, crossed_names):
+            t = self.tracker.get(track_id)
+            if t is None:
+                continue
+            t.zones = zones
+            for name in crossed:
+                if name not in t.crossed:
+                    t.crossed.append(name)
+                    print(f"[{self.name or 'zones'}] Track #{t.id} cắt tripwire '{name}'")
+            # không khai báo polygon -> chỉ người đã cắt tripwire mới được xét
+            t.in_roi = bool(t.zones or t.crossed)
+
+    def _roi_mask(self, dets):
+        mask = np.zeros(len(dets), dtype=bool)
+        for i, track_id in enumerate(dets["track_id"].tolist()):
+            t = self.tracker.get(track_id)
+            mask[i] = t is not None and t.in_roi
+        return mask
+
+    def recognize(self, item):
+        """Nhận diện mặt (known / unknown); None = dùng lại kết quả frame trước."""
+        if item["recognize_dets"] is None:
+            item["face_results"] = None
+        elif self.face_roi:
+            item["face_results"] = self.face_recognizer.recognize_in_regions(
+                item["frame"], item["recognize_dets"]
+            )
+        else:
+            item["face_results"] = self.face_recognizer.recognize(item["frame"])
+        return item
+
+    def annotate(self, item):
+        """Vẽ kết quả, cập nhật unknown_streak, đưa ra ứng viên cảnh báo cho stage alert."""
+        frame = item["frame"]
+        person_dets = item["person_dets"]
+
+        snapshot = item["tracks"]
+
+        with self.tracker.lock:
+            if item["face_results"] is not None:
+                scheduled = item["recognize_dets"]["track_id"].tolist()
+                self.loose_faces = self.tracker.assign_faces(
+                    item["face_results"], item["frame_no"], scheduled, snapshot=snapshot
+                )
+                roi = self.zones.roi(frame.shape[1], frame.shape[0]) if self.zones else None
+                if roi:
+                    # mặt không thuộc track nào (không có điểm chân): chỉ giữ mặt nằm trong khung ROI
+                    self.loose_faces = [
+                        f for f in self.loose_faces
+                        if roi[0] <= f["box"][0] + f["box"][2] / 2 <= roi[2] and roi[1] <= f["box"][1] <= roi[3]
+                    ]
+            face_results = self.tracker.face_results(snapshot) + self.loose_faces
+            # track của frame này (đã bị xoá khỏi tracker thì bỏ), người ngoài vùng không được tính
+            visible = [
+                t for t in (self.tracker.get(track_id) for track_id, snap in snapshot.items() if snap["in_roi"])
+                if t is not None
+            ]
+        item["face_results"] = face_results
+
+        with DRAW.time():
+            if self.zones:
+                self.zones.draw(frame)
+            self.person_detector.draw_detections(frame, person_dets)
+            self.face_recognizer.draw_faces(frame, face_results)
+
+        # unknown_streak riêng từng track: người chưa nhận ra là người quen thì tăng dần
+        for t in visible:
+            t.unknown_streak = 0 if t.is_known else t.unknown_streak + 1
+
+        if any(not f["is_known"] for f in self.loose_faces):
+            self.unknown_streak += 1
+        else:
+            self.unknown_streak = 0
+
+        intruder_tracks = [t.id for t in visible if t.unknown_streak >= self.UNKNOWN_STREAK_LIMIT]
+        item["intruder_tracks"] = intruder_tracks
+        loose_intruder = self.unknown_streak >= self.UNKNOWN_STREAK_LIMIT
+        item["alert_candidates"] = self._alert_candidates(visible, snapshot, intruder_tracks, loose_intruder)
+
+        any_known = any(f["is_known"] for f in face_results)
+        any_person = len(visible) > 0
+
+        status_text = "NO PERSON"
+
+        # Unknown nhiều frame liên tiếp -> xâm nhập
+        if intruder_tracks or loose_intruder:
+            status_text = "INTRUDER (Unknown / body)"
+            self.alerts.draw_banner(frame, text="INTRUDER DETECTED")
+
+        # Có ít nhất 1 người quen, không có người lạ đủ lâu
+        elif any_known:
+            known_names = {f["name"] for f in face_results if f["is_known"]}
+            status_text = "KNOWN: " + ", ".join(known_names)
+
+            h, w, _ = frame.shape
+            cv2.rectangle(frame, (0, 0), (w, 40), (0, 150, 0), thickness=-1)
+            cv2.putText(
+                frame,
+                status_text,
+                (10, 28),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.8,
+                (255, 255, 255),
+                2,
+            )
+
+        # Thấy body nhưng không nhận diện được mặt
+        elif any_person:
+            status_text = "INTRUDER (Body only)"
+            self.alerts.draw_banner(frame, text="INTRUDER DETECTED")
+
+        # Trạng thái ở dưới
+        cv2.putText(
+            frame,
+            status_text,
+            (10, frame.shape[0] - 10),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.6,
+            (255, 255, 0),
+            2,
+        )
+
+        item["status_text"] = status_text
+        return item
+
+    def _alert_candidates(self, visible, snapshot, intruder_tracks, loose_intruder):
+        """Mỗi người đang thấy thành 1 ứng viên cảnh báo; báo hay không do AlertPolicy quyết định."""
+        candidates = []
+        for t in visible:
+            if t.id in intruder_tracks:
+                kind = "unknown"
+            elif t.is_known:
+                kind = "known"
+            else:
+                kind = "body"
+            candidates.append(
+                {
+                    "key": t.id,
+                    "kind": kind,
+                    "track_id": t.id,
+                    "name": t.name if t.is_known else None,
+                    "box": snapshot[t.id]["box"].tolist(),
+                    "confidence": float(t.confidence),
+                    "zones": snapshot[t.id]["zones"],
+                }
+            )
+        # mặt không thuộc track nào (YOLO chưa thấy body)
+        for f in self.loose_faces:
+            if f["is_known"]:
+                candidates.append({"key": "face:" + f["name"], "kind": "known", "track_id": None,
+                                   "name": f["name"], "box": None, "confidence": f["confidence"], "zones": []})
+        if loose_intruder:
+            conf = max((f["confidence"] for f in self.loose_faces if not f["is_known"]), default=0.0)
+            candidates.append({"key": "face", "kind": "unknown", "track_id": None,
+                               "name": None, "box": None, "confidence": conf, "zones": []})
+        return candidates
+
+    def alert(self, item):
+        """
+        Stage cảnh báo (thread riêng, sau annotate): AlertPolicy dedup / leo thang,
+        chỉ khi có quyết định mới encode JPEG, ghi đĩa, ghi clip, gửi Telegram.
+        """
+        ts = item.get("timestamp")
+        decision = self.policy.evaluate(item.get("alert_candidates", []), now=ts)
+        if self.recorder is not None:
+            self.recorder.push(item["frame"], ts)
+        if decision is not None:
+            self._dispatch(item["frame"], decision, ts)
+        return item
+
+
+    def finish(self, item, encode: bool = False):
+        """Thu nhỏ cho nhẹ khi hiển thị / stream, encode JPEG nếu cần."""
+        frame = item["frame"]
+        h, w = frame.shape[:2]
+        if w > self.max_width:
+            scale = self.max_width / w
+            new_w = int(w * scale)
+            new_h = int(h * scale)
+            frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        item["output"] = frame
+
+        if encode:
+            with JPEG_ENCODE.labels("stream").time():
+                ok, buffer = cv2.imencode(".jpg", frame)
+            if not ok:
+                return None
+            item["jpeg"] = buffer.tobytes()
+        return item
+
+    def _dispatch(self, frame, decision, ts=None):
+        level = decision["level"]
+        kind = decision["kind"]
+        subjects = decision["subjects"]
+
+        # encode JPEG 1 lần trong RAM, gửi thẳng bytes, ghi đĩa do AlertManager lo
+        captured = self.alerts.capture(frame, ts)
+        if captured is None:
+            return
+
+        jpeg, saved_path = captured
+        ALERTS.labels(self.name or "").inc()
+        clip_path = None
+        if level in ("photo", "clip") and self.recorder is not None:
+            # photo: clip bắt đầu từ pre-roll -> thấy lúc người đó đi vào;
+            # clip (còn ở lại): kéo dài clip đang gom, hoặc ghi tiếp 1 clip mới nếu clip đầu đã xong
+            clip_path = self.recorder.trigger(ts)
+
+        track_ids = [c["track_id"] for c in subjects if c["track_id"] is not None]
+        names = [c["name"] for c in subjects if c["name"]]
+        message = self.ALERT_MESSAGES.get(kind, self.ALERT_MESSAGES["body"])
+        if kind == "known":
+            message = message.format(", ".join(names))
+        if level == "clip":
+            message += f" Vẫn còn sau {self.policy.clip_after:.0f}s" + (", đã ghi clip." if clip_path else ".")
+        zones = sorted({z for c in subjects for z in c.get("zones", ())})
+        if zones:
+            message += " Khu vực: " + ", ".join(zones) + "."
+        if self.event_store is not None:
+            self.event_store.add(
+                camera=self.name or "",
+                kind=kind,
+                track_ids=track_ids,
+                names=names,
+                confidences=[c["confidence"] for c in subjects],
+                boxes=[c["box"] for c in subjects if c["box"] is not None],
+                image_path=saved_path,
+                clip_path=clip_path,
+                message=message,
+                ts=ts,
+            )
+
+        prefix = f"[{self.name}] " if self.name else ""
+        print(f"{prefix}[ALERT:{level}] {kind}, track {track_ids or '-'}: {saved_path or '(không lưu đĩa)'}")
+        if not decision["notify"]:
+            return      # giờ yên lặng: chỉ lưu, không gửi
+        message = prefix + message
+        notifier = self.notifier or (self.digest.notifier if self.digest is not None else None)
+        if level == "digest" and self.digest is not None:
+            # người đã báo rồi vẫn còn đó -> gom thành album Telegram
+            self.digest.add(message, jpeg, track_ids=track_ids, names=names)
+        elif notifier is not None:
+            # đưa vào hàng đợi của notifier, worker riêng gửi -> khỏi giật
+            notifier.send_alert_async(message, jpeg)
+
+    # ======== CHẠY ========
+    def process_frame(self, frame, encode: bool = False):
+        """Chạy tuần tự đủ các stage cho 1 frame (không dùng thread)."""
+        item = {"frame": frame}
+        for fn in (self.detect, self.recognize, self.annotate, self.alert):
+            item = fn(item)
+        return self.finish(item, encode=encode)
+
+    def build_pipeline(self, workers: int | None = None, encode: bool = False, queue_size: int = 4):
+        """
+        Tạo StagePipeline cho processor này.
+        workers: tổng số core muốn dùng (mặc định: toàn bộ core của máy).
+        """
+        workers = workers or default_workers()
+        return StagePipeline(
+            [
+                Stage("detect", self.detect, ordered=True),
+                Stage("recognize", self.recognize, workers=max(1, workers // 2)),
+                Stage("annotate", self.annotate, ordered=True),
+                Stage("alert", self.alert, ordered=True),
+                Stage("finish", lambda item: self.finish(item, encode=encode), workers=max(1, workers // 4)),
+            ],
+            queue_size=queue_size,
+            name=self.name or "main",
+        )
+
+
+def camera_frames(camera, stop_on_fail: bool = False):
+    """
+    Generator đọc frame từ camera_Stream thành item cho pipeline.
+    stop_on_fail=True: dừng khi camera lỗi (CLI), False: bỏ qua và đọc tiếp (web)
+    cho tới khi camera bị release / hết file.
+    """
+    while True:
+        ok, frame, ts, frame_id = camera.read_with_meta()
+        if not ok:
+            if stop_on_fail:
+                print("Không đọc được frame từ camera, dừng.")
+                return
+            if not getattr(camera, "running", True):
+                return
+            time.sleep(0.05)
+            continue
+        yield {"frame": frame, "timestamp": ts, "frame_id": frame_id}
@@ -0,0 +1,178 @@
+import argparse
+import asyncio
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from asgi_app import create_app
+from broadcaster import FrameBroadcaster
+
+# Load test cho chế độ ASGI: nguồn frame giả (không cần camera / model),
+# mở N client MJPEG cùng lúc và đo fps mỗi client, băng thông, số thread, CPU.
+#   python load_test_stream.py --clients 50 --duration 20
+# Có uvicorn -> test qua HTTP thật; không có -> gọi thẳng app ASGI trong process.
+
+
+def synthetic_source(width=1280, height=720, fps=15.0):
+    """Frame giả: ô vuông chạy ngang + số frame, nhịp fps."""
+    interval = 1.0 / fps
+    base = np.zeros((height, width, 3), dtype=np.uint8)
+    base[:] = (40, 30, 20)
+    i = 0
+    next_time = time.monotonic()
+    while True:
+        frame = base.copy()
+        x = (i * 15) % (width - 120)
+        cv2.rectangle(frame, (x, height // 3), (x + 120, height // 3 + 240), (0, 0, 255), -1)
+        cv2.putText(frame, f"frame {i}", (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 3)
+        output = cv2.resize(frame, (800, int(height * 800 / width)), interpolation=cv2.INTER_AREA)
+        yield {"frame": frame, "output": output, "status_text": "SYNTHETIC", "frame_id": i}
+
+        i += 1
+        next_time += interval
+        delay = next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+BOUNDARY = b"--frame\r\n"
+
+
+class ClientStats:
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.first = None
+        self.last = None
+
+    def on_data(self, data: bytes, carry: bytes) -> bytes:
+        now = time.monotonic()
+        if self.first is None:
+            self.first = now
+        self.last = now
+        self.bytes += len(data)
+        buf = carry + data
+        self.frames += buf.count(BOUNDARY)
+        # giữ đuôi để không đếm sót boundary bị cắt ngang giữa 2 lần đọc; chỉ len - 1 byte,
+        # giữ đủ cả boundary thì lần sau đếm lại nó lần nữa
+        return buf[-(len(BOUNDARY) - 1):]
+
+
+async def http_client(host, port, path, stats: ClientStats, stop_at: float):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    await reader.readuntil(b"\r\n\r\n")
+
+    carry = b""
+    try:
+        while time.monotonic() < stop_at:
+            try:
+                data = await asyncio.wait_for(reader.read(65536), stop_at - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+            if not data:
+                break
+            carry = stats.on_data(data, carry)
+    finally:
+        writer.close()
+
+
+async def inprocess_client(app, path, stats: ClientStats, stop_at: float):
+    """Gọi thẳng app ASGI, không qua socket."""
+    route, _, query = path.partition("?")
+    scope = {"type": "http", "method": "GET", "path": route, "query_string": query.encode(),
+             "headers": [], "client": ("127.0.0.1", 0)}
+    disconnected = asyncio.Event()
+    carry = b""
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal carry
+        if message["type"] == "http.response.body":
+            carry = stats.on_data(message.get("body", b""), carry)
+
+    task = asyncio.create_task(app(scope, receive, send))
+    await asyncio.sleep(max(0.0, stop_at - time.monotonic()))
+    disconnected.set()
+    try:
+        await asyncio.wait_for(task, 6.0)
+    except asyncio.TimeoutError:
+        task.cancel()
+
+
+async def run_clients(args, app, port):
+    stop_at = time.monotonic() + args.duration
+    stats = [ClientStats() for _ in range(args.clients)]
+    path = f"/video_feed?size={args.size}&fps={args.fps}"
+    if port is None:
+        tasks = [inprocess_client(app, path, s, stop_at) for s in stats]
+    else:
+        tasks = [http_client("127.0.0.1", port, path, s, stop_at) for s in stats]
+
+    peak_threads = 0
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while time.monotonic() < stop_at:
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.5)
+
+    await asyncio.gather(sample_threads(), *tasks)
+    return stats, peak_threads
+
+
+def start_uvicorn(app, port):
+    try:
+        import uvicorn
+    except ImportError:
+        return None
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test MJPEG (ASGI) với nguồn frame giả")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--source-fps", type=float, default=15.0)
+    parser.add_argument("--fps", type=float, default=15.0, help="fps tối đa mỗi client")
+    parser.add_argument("--size", default="medium", help="full | medium | thumb | số px")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--inprocess", action="store_true", help="không dùng uvicorn / socket")
+    args = parser.parse_args()
+
+    broadcaster = FrameBroadcaster(lambda: synthetic_source(fps=args.source_fps))
+    app = create_app(broadcaster)
+
+    server = None if args.inprocess else start_uvicorn(app, args.port)
+    port = args.port if server is not None else None
+    print("Chế độ:", "HTTP qua uvicorn" if port else "in-process (gọi thẳng ASGI)")
+
+    cpu0 = time.process_time()
+    t0 = time.monotonic()
+    stats, peak_threads = asyncio.run(run_clients(args, app, port))
+    wall = time.monotonic() - t0
+    cpu = time.process_time() - cpu0
+    if server is not None:
+        server.should_exit = True
+
+    fps = [s.frames / (s.last - s.first) if s.frames > 1 and s.last > s.first else 0.0 for s in stats]
+    total_bytes = sum(s.bytes for s in stats)
+    print(f"Clients: {args.clients}, thời gian: {wall:.1f}s, frame nguồn: {broadcaster.frames_published}")
+    print(f"fps mỗi client: min {min(fps):.1f} / TB {sum(fps) / len(fps):.1f} / max {max(fps):.1f}")
+    print(f"Băng thông: {total_bytes / wall / 1e6:.2f} MB/s tổng")
+    print(f"Thread tối đa: {peak_threads}, CPU: {cpu / wall * 100:.0f}% của 1 core")
+
+
+if __name__ == "__main__":
+    main()
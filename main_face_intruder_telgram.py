@@ -1,16 +1,18 @@
 import cv2
-import threading
-import numpy as np  # thêm để xử lý ảnh
 
 from camera_stream import camera_Stream
 from detector import personDetector
 from alert_manager import AlertManager
 from face_recognizer import FaceRecognizer
+from intruder_processor import IntruderProcessor, camera_frames
+from metrics import start_log_thread
+from motion import MotionGate
 
 try:
-    from notifier import TelegramNotifier
+    from notifier import TelegramNotifier, AlertDigest
 except ImportError:
     TelegramNotifier = None
+    AlertDigest = None
 
 
 def create_notifier():
@@ -50,131 +52,40 @@ def main():
 
     # Notifier (Telegram)
     notifier = create_notifier()
+    # gom cảnh báo trong 30s thành 1 album (tối đa 10 ảnh) thay vì mỗi ảnh 1 tin
+    digest = AlertDigest(notifier, window=30.0) if notifier is not None else None
+
+    processor = IntruderProcessor(
+        person_detector,
+        face_recognizer,
+        alerts,
+        notifier=notifier,
+        digest=digest,
+        motion_gate=MotionGate(),   # chỉ chạy YOLO + nhận diện mặt khi có chuyển động
+        max_width=800,    # muốn nhỏ nữa thì giảm xuống 700, 640,...
+    )
+    pipeline = processor.build_pipeline()
 
-
-    unknown_streak = 0
-    UNKNOWN_STREAK_LIMIT = 10
-
-    # Đếm frame để skip YOLO
-    frame_idx = 0
-    last_person_dets = []
+    # 30s in 1 dòng thời gian từng bước (YOLO, Haar, LBPH, vẽ, encode, Telegram)
+    start_log_thread(interval=30.0)
 
     print("=== Hệ thống nhận diện người quen / người lạ + cảnh báo ===")
     print("Nhấn 'q' để thoát.")
 
+    results = pipeline.run(camera_frames(camera, stop_on_fail=True))
     try:
-        while True:
-            ok, frame = camera.read()
-            if not ok:
-                print("Không đọc được frame từ camera, dừng.")
-                break
-
-            frame_idx += 1
-
-            # 1. Phát hiện người (body) -> CHỈ CHẠY YOLO MỖI 3 FRAME
-            if frame_idx % 3 == 0:
-                person_dets = person_detector.detect(frame)
-                last_person_dets = person_dets
-            else:
-                person_dets = last_person_dets
-
-            person_detector.draw_detections(frame, person_dets)
-
-            # 2. Nhận diện mặt (known/unknown)
-            face_results = face_recognizer.recognize(frame)
-            face_recognizer.draw_faces(frame, face_results)
-
-            # 3. Quyết định trạng thái
-            any_known = any(f["is_known"] for f in face_results)
-            any_unknown = any(not f["is_known"] for f in face_results)
-            any_person = len(person_dets) > 0
-
-            # cập nhật chuỗi frame unknown
-            if any_unknown or (any_person and not any_known):
-                unknown_streak += 1
-            else:
-                unknown_streak = 0
-
-            status_text = "NO PERSON"
-
-            # 3.1. Nếu unknown nhiều frame liên tiếp -> chắc chắn xâm nhập
-            if unknown_streak >= UNKNOWN_STREAK_LIMIT:
-                status_text = "INTRUDER (Unknown / body)"
-                alerts.draw_banner(frame, text="INTRUDER DETECTED")
-
-                saved_path = alerts.maybe_save_frame(frame)
-                if saved_path is not None:
-                    print(f"[ALERT] Đã lưu ảnh cảnh báo: {saved_path}")
-                    if notifier is not None:
-                        # GỬI TELEGRAM Ở THREAD RIÊNG ĐỂ KHỎI GIẬT
-                        threading.Thread(
-                            target=notifier.send_alert,
-                            args=("Cảnh báo: phát hiện người lạ trước camera!", saved_path),
-                            daemon=True,
-                        ).start()
-
-            # 3.2. Có ít nhất một người quen, không có unknown
-            elif any_known:
-                known_names = {f["name"] for f in face_results if f["is_known"]}
-                status_text = "KNOWN: " + ", ".join(known_names)
-
-                # Vẽ dải xanh báo an toàn
-                h, w, _ = frame.shape
-                cv2.rectangle(frame, (0, 0), (w, 40), (0, 150, 0), thickness=-1)
-                cv2.putText(
-                    frame,
-                    status_text,
-                    (10, 28),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.8,
-                    (255, 255, 255),
-                    2,
-                )
-
-            # 3.3. Thấy body nhưng không thấy mặt rõ
-            elif any_person:
-                status_text = "INTRUDER (Body only)"
-                alerts.draw_banner(frame, text="INTRUDER DETECTED")
-
-                saved_path = alerts.maybe_save_frame(frame)
-                if saved_path is not None:
-                    print(f"[ALERT] Body detected, đã lưu ảnh: {saved_path}")
-                    if notifier is not None:
-                        threading.Thread(
-                            target=notifier.send_alert,
-                            args=("Cảnh báo: phát hiện người (body) nhưng không nhận diện được mặt!", saved_path),
-                            daemon=True,
-                        ).start()
-
-            # 4. Hiển thị trạng thái ở góc màn hình (trên frame gốc)
-            cv2.putText(
-                frame,
-                status_text,
-                (10, frame.shape[0] - 10),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.6,
-                (255, 255, 0),
-                2,
-            )
-
-
-            # ===== THU NHỎ BỀ RỘNG CỬA SỔ HIỂN THỊ =====
-            display = frame.copy()
-            h, w = display.shape[:2]
-
-            max_width = 800  # muốn nhỏ nữa thì giảm xuống 700, 640,...
-            if w > max_width:
-                scale = max_width / w
-                new_w = int(w * scale)
-                new_h = int(h * scale)
-                display = cv2.resize(display, (new_w, new_h), interpolation=cv2.INTER_AREA)
-
-            cv2.imshow("Face-based Intruder System", display)
+        for item in results:
+            cv2.imshow("Face-based Intruder System", item["output"])
 
             if cv2.waitKey(1) & 0xFF == ord("q"):
                 break
 
     finally:
+        results.close()
+        if digest is not None:
+            # gửi nốt các cảnh báo còn đang gom
+            digest.flush()
+            notifier.flush(timeout=10)
         camera.release()
         cv2.destroyAllWindows()
         print("Đã tắt camera & cửa sổ hiển thị.")
@@ -0,0 +1,266 @@
+import bisect
+import threading
+import time
+
+# Metrics nhẹ kiểu Prometheus (không cần prometheus_client):
+# Counter / Gauge / Histogram có label, REGISTRY.render() ra text format cho /metrics,
+# start_log_thread() in 1 dòng tóm tắt định kỳ cho bản CLI.
+# Mỗi lần ghi chỉ là 1 lần bisect + cộng số dưới lock (~1 µs), không đáng kể so với 1 frame.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _label_str(names, values, extra=()):
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames=(), registry=None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values, **kwargs):
+        """Metric con theo giá trị label, vd hist.labels(camera="gate")."""
+        if kwargs:
+            values = tuple(kwargs[n] for n in self.labelnames)
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels(*[""] * len(self.labelnames)) if self.labelnames else self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, key))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, key):
+        return [f"{name}{_label_str(labelnames, key)} {self.value:g}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.fn = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, fn):
+        """Giá trị lấy lúc render (vd độ dài hàng đợi), không tốn gì trên hot path."""
+        self.fn = fn
+
+    def get(self) -> float:
+        if self.fn is not None:
+            try:
+                return float(self.fn())
+            except Exception:
+                return float("nan")
+        return self.value
+
+    def render(self, name, labelnames, key):
+        return [f"{name}{_label_str(labelnames, key)} {self.get():g}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def set_function(self, fn):
+        self._default().set_function(fn)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def quantile(self, q: float) -> float:
+        """Ước lượng quantile từ bucket (cận trên của bucket chứa quantile)."""
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+        if total == 0:
+            return 0.0
+        rank = q * total
+        acc = 0
+        for i, c in enumerate(counts):
+            acc += c
+            if acc >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def render(self, name, labelnames, key):
+        with self._lock:
+            counts = list(self.counts)
+            total, s = self.count, self.sum
+        lines = []
+        acc = 0
+        for bound, c in zip(self.buckets, counts):
+            acc += c
+            le = 'le="%g"' % bound
+            lines.append(f"{name}_bucket{_label_str(labelnames, key, [le])} {acc}")
+        inf = 'le="+Inf"'
+        lines.append(f"{name}_bucket{_label_str(labelnames, key, [inf])} {total}")
+        lines.append(f"{name}_sum{_label_str(labelnames, key)} {s:.6f}")
+        lines.append(f"{name}_count{_label_str(labelnames, key)} {total}")
+        return lines
+
+
+class _Timer:
+    """with hist.time(): ... -> ghi thời gian chạy (giây)."""
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.t0)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric trùng tên: {metric.name}")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Text format Prometheus (text/plain; version=0.0.4)."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """1 dòng ngắn: histogram -> số lần / trung bình ms / p90, counter + gauge -> giá trị."""
+        parts = []
+        for metric in self.metrics.values():
+            for key, child in sorted(metric._children.items()):
+                label = f"{metric.name}[{','.join(key)}]" if key else metric.name
+                if isinstance(child, _HistogramChild):
+                    if not child.count:
+                        continue
+                    if metric.name.endswith("_seconds"):
+                        mean_ms = 1000.0 * child.sum / child.count
+                        p90_ms = child.quantile(0.9) * 1000
+                        parts.append(f"{label}: n={child.count} avg={mean_ms:.1f}ms p90<={p90_ms:g}ms")
+                    else:
+                        parts.append(f"{label}: n={child.count} avg={child.sum / child.count:.2f}")
+                elif isinstance(child, _GaugeChild):
+                    parts.append(f"{label}={child.get():g}")
+                elif child.value:
+                    parts.append(f"{label}={child.value:g}")
+        return " | ".join(parts)
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def start_log_thread(interval: float = 30.0, registry: Registry = REGISTRY):
+    """Thread nền in REGISTRY.summary() mỗi interval giây (cho các bản chạy CLI)."""
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            line = registry.summary()
+            if line:
+                print("[metrics]", line)
+
+    threading.Thread(target=loop, daemon=True).start()
+
+
+# ======== METRICS CỦA HỆ THỐNG ========
+CAMERA_READ = Histogram("camera_read_seconds", "Thời gian cap.read() 1 frame", ["camera"])
+CAMERA_FRAMES = Counter("camera_frames_total", "Số frame đã grab", ["camera"])
+CAMERA_DROPPED = Counter("camera_frames_dropped_total", "Số frame bị bỏ (buffer đầy / lấy frame mới nhất)", ["camera"])
+
+YOLO_DETECT = Histogram("yolo_detect_seconds", "Thời gian 1 lần forward YOLO (cả batch)")
+YOLO_BATCH = Histogram("yolo_batch_size", "Số frame mỗi lần forward YOLO", buckets=(1, 2, 4, 8, 16))
+YOLO_TILES = Histogram("yolo_tiles_per_frame", "Số ô (kể cả lượt cả frame) mỗi lần detect_tiled", buckets=(1, 2, 3, 5, 9, 17))
+HAAR_DETECT = Histogram("haar_detect_seconds", "Thời gian Haar cascade tìm mặt (1 vùng ảnh)")
+FACE_CLASSIFY = Histogram("face_classify_seconds", "Thời gian backend nhận diện (LBPH / embedding) cho 1 batch mặt", ["backend"])
+DRAW = Histogram("draw_seconds", "Thời gian vẽ kết quả lên frame")
+JPEG_ENCODE = Histogram("jpeg_encode_seconds", "Thời gian cv2.imencode", ["kind"])
+
+PIPELINE_QUEUE = Gauge("pipeline_queue_depth", "Số item đang chờ trước mỗi stage", ["pipeline", "stage"])
+PIPELINE_DROPPED = Counter("pipeline_items_dropped_total", "Item bị bỏ (fn trả None / lỗi)", ["pipeline", "stage"])
+
+ALERTS = Counter("alerts_total", "Số ảnh cảnh báo đã chụp", ["camera"])
+TELEGRAM_REQUEST = Histogram("telegram_request_seconds", "Thời gian 1 request Telegram", ["method"])
+TELEGRAM_RESULT = Counter("telegram_messages_total", "Tin Telegram theo kết quả", ["result"])
+TELEGRAM_QUEUE = Gauge("telegram_queue_depth", "Số tin đang chờ gửi")
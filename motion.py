@@ -0,0 +1,102 @@
+import cv2
+
+
+class MotionGate:
+    """
+    Quyết định frame nào cần chạy YOLO + nhận diện mặt, dựa trên độ thay đổi
+    giữa các frame đã thu nhỏ (frame differencing, rất rẻ so với YOLO).
+    - Có chuyển động: chạy mỗi active_every frame.
+    - Đang có người trong khung (occupied): chạy ít nhất mỗi occupied_every frame.
+    - Cảnh tĩnh, không người: giãn dần (x2) tới idle_max_every frame.
+    """
+
+    def __init__(
+        self,
+        width: int = 160,
+        diff_threshold: int = 25,
+        min_area_ratio: float = 0.002,
+        active_every: int = 1,
+        occupied_every: int = 3,
+        idle_max_every: int = 30,
+        cooldown: int = 15,
+    ):
+        """
+        width: bề rộng ảnh thu nhỏ để so sánh.
+        diff_threshold: chênh lệch mức xám tối thiểu để tính là pixel thay đổi.
+        min_area_ratio: tỉ lệ pixel thay đổi tối thiểu để coi là có chuyển động.
+        cooldown: sau khi hết chuyển động, giữ nhịp active thêm bấy nhiêu frame.
+        """
+        self.width = width
+        self.diff_threshold = diff_threshold
+        self.min_area_ratio = min_area_ratio
+        self.active_every = max(1, active_every)
+        self.occupied_every = max(1, occupied_every)
+        self.idle_max_every = max(1, idle_max_every)
+        self.cooldown = cooldown
+
+        self.motion_ratio = 0.0
+        self.motion_boxes = []   # [(x1, y1, x2, y2), ...] theo toạ độ frame gốc
+        self.interval = self.active_every
+
+        self._prev = None
+        self._scale = 1.0
+        self._cooldown_left = 0
+        self._since_run = 0
+
+    def _prepare(self, frame):
+        h, w = frame.shape[:2]
+        self._scale = w / self.width if w > self.width else 1.0
+        small_w = int(w / self._scale)
+        small_h = int(h / self._scale)
+        small = cv2.resize(frame, (small_w, small_h), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def _measure(self, gray):
+        if self._prev is None or self._prev.shape != gray.shape:
+            self._prev = gray
+            self.motion_ratio = 1.0
+            self.motion_boxes = []
+            return True
+
+        diff = cv2.absdiff(self._prev, gray)
+        self._prev = gray
+        _, mask = cv2.threshold(diff, self.diff_threshold, 255, cv2.THRESH_BINARY)
+        self.motion_ratio = cv2.countNonZero(mask) / mask.size
+
+        if self.motion_ratio < self.min_area_ratio:
+            self.motion_boxes = []
+            return False
+
+        mask = cv2.dilate(mask, None, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        s = self._scale
+        self.motion_boxes = []
+        for c in contours:
+            x, y, w, h = cv2.boundingRect(c)
+            self.motion_boxes.append((int(x * s), int(y * s), int((x + w) * s), int((y + h) * s)))
+        return True
+
+    def update(self, frame, occupied: bool = False):
+        """
+        Gọi mỗi frame. Trả về True nếu frame này nên chạy detect + nhận diện mặt.
+        occupied: frame trước đó có người hay không.
+        """
+        moving = self._measure(self._prepare(frame))
+
+        if moving:
+            self._cooldown_left = self.cooldown
+            self.interval = self.active_every
+        elif self._cooldown_left > 0:
+            self._cooldown_left -= 1
+            self.interval = self.active_every
+        elif occupied:
+            self.interval = self.occupied_every
+        else:
+            self.interval = min(max(self.interval, 1) * 2, self.idle_max_every)
+
+        self._since_run += 1
+        if moving or self._since_run >= self.interval:
+            self._since_run = 0
+            return True
+        return False
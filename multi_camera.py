@@ -0,0 +1,264 @@
+import json
+import os
+import sys
+import time
+
+from alert_manager import AlertManager
+from alert_policy import AlertPolicy
+from broadcaster import FrameBroadcaster
+from camera_stream import camera_Stream
+from clip_recorder import ClipRecorder
+from detector import DetectBatcher, TiledDetector, personDetector
+from event_store import EventStore
+from face_recognizer import FaceRecognizer
+from intruder_processor import IntruderProcessor, camera_frames
+from metrics import start_log_thread
+from motion import MotionGate
+from pipeline import default_workers
+from replay_source import ReplaySource
+from zones import ZoneSet
+
+# Chạy nhiều camera trong 1 process theo file cấu hình (mặc định cameras.json):
+# 1 YOLO + 1 bộ nhận diện mặt dùng chung, mỗi camera có state riêng
+# (tracker, motion gate, unknown_streak, thư mục ảnh cảnh báo).
+
+DEFAULT_CONFIG = {
+    "detector": {"model_path": "yolov8n.pt", "conf_threshold": 0.5, "img_size": 320},
+    "recognizer": {
+        "model_path": "Models/face_lbph.xml",
+        "labels_path": "Models/face_labels.json",
+        "threshold": 80.0,
+        "auto_reload": 5.0,
+    },
+    "events": {"path": "alerts/events.db"},   # path null -> không lưu sự kiện
+    "cameras": [{"id": "cam0", "source": 0}],
+}
+
+CAMERA_DEFAULTS = {
+    "width": 1280,
+    "height": 720,
+    "motion": True,
+    "max_width": 800,
+    "conf_threshold": None,
+    "unknown_streak_limit": None,
+    "alert_min_interval": 8.0,   # = camera_cooldown của AlertPolicy
+    "alert_policy": {},          # ghi đè DEFAULT_POLICY (alert_policy.py): clip_after, quiet_hours...
+    "zones": [],        # polygon / tripwire, xem zones.py
+    "tiles": None,      # {"tile_size": 320, "overlap": 0.25, "max_tiles": 4} -> TiledDetector cho người ở xa
+    "replay": None,     # số = phát lại file / thư mục ảnh bằng ReplaySource với speed này
+    "clip_pre": 5.0,    # giây trước / sau sự kiện ghi vào clip; cả 2 = 0 -> không ghi clip
+    "clip_post": 5.0,
+    "clip_max_mb": 16,  # trần RAM cho JPEG của clip: ring buffer + clip đang gom / chờ ghi
+}
+
+
+def load_camera_config(path: str | None = None):
+    """
+    Đọc file cấu hình JSON; không có file -> DEFAULT_CONFIG (1 camera index 0, như bản cũ).
+    Mỗi camera: id, source (index / đường dẫn file / thư mục ảnh / URL RTSP) + các khoá trong CAMERA_DEFAULTS.
+    """
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            user = json.load(f)
+        for key in ("detector", "recognizer", "events"):
+            config[key].update(user.get(key, {}))
+        config["cameras"] = user.get("cameras", config["cameras"])
+
+    cameras = []
+    seen = set()
+    for i, cam in enumerate(config["cameras"]):
+        cam = {**CAMERA_DEFAULTS, **cam}
+        cam.setdefault("id", f"cam{i}")
+        cam["id"] = str(cam["id"])
+        if "source" not in cam:
+            raise ValueError(f"Camera '{cam['id']}' thiếu 'source'")
+        if cam["id"] in seen:
+            raise ValueError(f"Trùng id camera: {cam['id']}")
+        seen.add(cam["id"])
+        cameras.append(cam)
+    if not cameras:
+        raise ValueError("Cấu hình không có camera nào")
+    config["cameras"] = cameras
+    return config
+
+
+class CameraUnit:
+    """State riêng của 1 camera: camera_Stream, processor (tracker, motion gate...), pipeline, broadcaster."""
+
+    def __init__(self, config, detector, face_recognizer, notifier=None, digest=None, event_store=None,
+                 workers=None):
+        self.id = config["id"]
+        self.config = config
+        self.zones = ZoneSet(config["zones"])
+        if config["tiles"]:
+            detector = TiledDetector(detector, **config["tiles"])
+
+        source = config["source"]
+        # thư mục ảnh / file video thường -> phát lại lặp; còn lại (index webcam, rtsp://...) là camera thật
+        if config["replay"] is not None or (isinstance(source, str) and os.path.exists(source)):
+            self.camera = ReplaySource(
+                source,
+                speed=1.0 if config["replay"] is None else config["replay"],
+                loop=True,
+                width=config["width"],
+                height=config["height"],
+            )
+        else:
+            self.camera = camera_Stream(
+                device_index=source,
+                width=config["width"],
+                height=config["height"],
+                name=self.id,
+            )
+        self.alerts = AlertManager(
+            output_dir=os.path.join("alerts", self.id),
+            min_interval=config["alert_min_interval"],
+        )
+        self.recorder = None
+        if config["clip_pre"] or config["clip_post"]:
+            self.recorder = ClipRecorder(
+                output_dir=os.path.join("alerts", self.id, "clips"),
+                pre_seconds=config["clip_pre"],
+                post_seconds=config["clip_post"],
+                max_bytes=int(config["clip_max_mb"] * 1024 * 1024),
+                name=self.id,
+            )
+        self.processor = IntruderProcessor(
+            detector,
+            face_recognizer,
+            self.alerts,
+            notifier=notifier,
+            digest=digest,
+            event_store=event_store,
+            recorder=self.recorder,
+            zones=self.zones,
+            policy=AlertPolicy.from_config(
+                {"camera_cooldown": config["alert_min_interval"], **config["alert_policy"]}, name=self.id
+            ),
+            motion_gate=MotionGate() if config["motion"] else None,
+            max_width=config["max_width"],
+            name=self.id,
+            conf_threshold=config["conf_threshold"],
+            unknown_streak_limit=config["unknown_streak_limit"],
+        )
+        self.pipeline = self.processor.build_pipeline(workers=workers)
+        self.broadcaster = FrameBroadcaster(lambda: self.pipeline.run(camera_frames(self.camera)))
+
+    def release(self):
+        # thứ tự: dừng pipeline (join các stage) + producer trước, rồi mới đóng camera / batcher;
+        # camera.stop() đánh thức feeder đang chờ frame (camera mất kết nối) để join không phải đợi
+        self.pipeline.stop()
+        self.camera.stop()
+        self.broadcaster.stop()
+        self.camera.release()
+        if self.recorder is not None:
+            self.recorder.flush()
+
+
+class MultiCameraRunner:
+    """
+    Chạy nhiều CameraUnit dùng chung 1 detector + 1 face recognizer -> RAM gần như
+    không tăng theo số camera (chỉ thêm buffer frame + state tracker).
+    Lập lịch công bằng:
+    - YOLO đi qua DetectBatcher (FIFO). Stage detect của mỗi camera chạy tuần tự nên mỗi camera
+      chỉ có tối đa 1 frame trong hàng chờ -> mỗi batch lấy lần lượt từ các camera, không camera nào chiếm hết.
+    - camera_Stream mode="latest" bỏ frame cũ, camera chậm lượt không bị dồn trễ.
+    - Số worker nhận diện mặt chia đều số core cho các camera.
+    """
+
+    def __init__(self, config, notifier=None, digest=None):
+        self.config = config
+        det_cfg = config["detector"]
+        rec_cfg = config["recognizer"]
+        cameras = config["cameras"]
+
+        # detector chạy với ngưỡng thấp nhất, mỗi camera lọc lại theo ngưỡng riêng
+        per_camera = [c["conf_threshold"] for c in cameras if c["conf_threshold"] is not None]
+        conf = min([det_cfg["conf_threshold"], *per_camera])
+        self.detector = personDetector(
+            model_path=det_cfg["model_path"],
+            conf_threshold=conf,
+            img_size=det_cfg["img_size"],
+        )
+        # camera chạy tile gửi 1 + max_tiles ảnh mỗi frame
+        max_batch = sum(1 + (c["tiles"].get("max_tiles", 4) if c["tiles"] else 0) for c in cameras)
+        self.batcher = DetectBatcher(self.detector, max_batch=min(max_batch, 16))
+
+        self.face_recognizer = FaceRecognizer(
+            model_path=rec_cfg["model_path"],
+            labels_path=rec_cfg["labels_path"],
+            threshold=rec_cfg["threshold"],
+        )
+        if rec_cfg.get("auto_reload"):
+            self.face_recognizer.start_auto_reload(interval=rec_cfg["auto_reload"])
+
+        # 1 kho sự kiện chung, cột camera phân biệt
+        events_path = config["events"].get("path")
+        self.event_store = EventStore(events_path) if events_path else None
+
+        workers = max(2, default_workers() // len(cameras))
+        self.units = {}
+        for cam in cameras:
+            self.units[cam["id"]] = CameraUnit(
+                cam, self.batcher, self.face_recognizer, notifier=notifier, digest=digest,
+                event_store=self.event_store, workers=workers,
+            )
+
+    @classmethod
+    def from_file(cls, path: str | None, notifier=None, digest=None):
+        return cls(load_camera_config(path), notifier=notifier, digest=digest)
+
+    @property
+    def default_id(self) -> str:
+        return next(iter(self.units))
+
+    def get(self, camera_id: str | None = None):
+        """CameraUnit theo id (None -> camera đầu tiên), không có -> None."""
+        return self.units.get(camera_id or self.default_id)
+
+    def start(self):
+        """Chạy pipeline của mọi camera ngay (không đợi có người xem) để cảnh báo luôn hoạt động."""
+        for unit in self.units.values():
+            unit.broadcaster.start()
+
+    def stats(self):
+        return {
+            cid: {
+                **unit.camera.stats(),
+                "frames_processed": unit.broadcaster.frames_published,
+                "viewers": unit.broadcaster.subscribers,
+            }
+            for cid, unit in self.units.items()
+        }
+
+    def release(self):
+        for unit in self.units.values():
+            unit.release()
+        # mọi stage detect đã dừng -> không còn ai submit vào batcher
+        self.batcher.close()
+        if self.event_store is not None:
+            self.event_store.close()
+
+
+def main():
+    """python multi_camera.py [cameras.json] – chạy không giao diện, in thống kê mỗi 10s."""
+    path = sys.argv[1] if len(sys.argv) > 1 else "cameras.json"
+    runner = MultiCameraRunner.from_file(path)
+    runner.start()
+    start_log_thread(interval=30.0)
+    print(f"=== Đang chạy {len(runner.units)} camera: {', '.join(runner.units)} ===")
+    print("Nhấn Ctrl+C để thoát.")
+    try:
+        while True:
+            time.sleep(10)
+            for cid, st in runner.stats().items():
+                print(f"[{cid}] {st}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        runner.release()
+
+
+if __name__ == "__main__":
+    main()
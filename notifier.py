@@ -1,5 +1,48 @@
 import os
+import json
+import datetime
+import email.utils
+import queue
+import random
+import threading
+import time
+import itertools
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import TELEGRAM_QUEUE, TELEGRAM_REQUEST, TELEGRAM_RESULT
+
+# độ ưu tiên trong hàng đợi: số nhỏ gửi trước
+PRIORITY_ALERT = 0
+PRIORITY_INFO = 10
+
+MEDIA_GROUP_MAX = 10        # giới hạn của sendMediaGroup
+CAPTION_MAX = 1024
+
+
+class _RateLimiter:
+    """Token bucket cho từng chat: tối đa burst tin liền nhau, sau đó rate tin / giây."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}   # chat_id -> (tokens, last_time)
+        self._lock = threading.Lock()
+
+    def acquire(self, chat_id):
+        """Chặn tới khi được phép gửi thêm 1 request cho chat_id."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(chat_id, (float(self.burst), now))
+                tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+                if tokens >= 1.0:
+                    self._buckets[chat_id] = (tokens - 1.0, now)
+                    return
+                self._buckets[chat_id] = (tokens, now)
+                wait = (1.0 - tokens) / self.rate
+            time.sleep(wait)
 
 
 class TelegramNotifier:
@@ -8,48 +51,370 @@ class TelegramNotifier:
     - send_text: gửi tin nhắn chữ
     - send_photo: gửi ảnh kèm caption
     - send_alert: tiện dùng cho cảnh báo (có thể kèm ảnh)
+    - send_alert_async: đưa vào hàng đợi, 1 worker duy nhất gửi dần
+      (session keep-alive, retry có backoff, tôn trọng retry_after, giới hạn tốc độ mỗi chat)
     """
 
-    def __init__(self, bot_token: str, chat_id: str):
+    def __init__(
+        self,
+        bot_token: str,
+        chat_id: str,
+        api_url: str = "https://api.telegram.org",
+        queue_size: int = 100,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        rate_per_chat: float = 1.0,
+        burst_per_chat: int = 3,
+    ):
+        """
+        api_url: đổi sang server giả (vd http://127.0.0.1:8081) để test.
+        queue_size: số tin tối đa đang chờ, đầy thì tin mới bị bỏ.
+        rate_per_chat / burst_per_chat: giới hạn gửi cho mỗi chat (Telegram ~1 tin/giây).
+        """
         self.bot_token = bot_token
         self.chat_id = chat_id
-        self.base_url = f"https://api.telegram.org/bot{self.bot_token}"
+        self.base_url = f"{api_url.rstrip('/')}/bot{self.bot_token}"
 
-    def send_text(self, text: str):
-        """Gửi tin nhắn text đơn giản."""
-        try:
-            url = f"{self.base_url}/sendMessage"
-            data = {"chat_id": self.chat_id, "text": text}
-            resp = requests.post(url, data=data, timeout=5)
-            if not resp.ok:
-                print("[TelegramNotifier] send_text lỗi:", resp.status_code, resp.text)
-        except Exception as e:
-            print("[TelegramNotifier] Lỗi gửi text:", e)
-
-    def send_photo(self, photo_path: str, caption: str = ""):
-        """Gửi ảnh kèm caption."""
-        if not os.path.exists(photo_path):
-            print("[TelegramNotifier] Không tìm thấy file ảnh:", photo_path)
-            return
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        # 1 session dùng lại kết nối TLS cho mọi request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+        self._queue = queue.PriorityQueue(maxsize=queue_size)
+        TELEGRAM_QUEUE.set_function(self._queue.qsize)
+        self._seq = itertools.count()
+        self._limiter = _RateLimiter(rate_per_chat, burst_per_chat)
+        self._worker = None
+        self._lock = threading.Lock()
+
+    # ======== GỬI TRỰC TIẾP (ĐỒNG BỘ) ========
+    def _post(self, method: str, data: dict, files_factory=None) -> bool:
+        """
+        POST tới Bot API, retry khi lỗi mạng / 5xx / 429.
+        Mỗi lần thử đều qua giới hạn tốc độ của chat tương ứng.
+        files_factory: hàm trả về dict files mới cho mỗi lần thử (file đã đọc thì phải mở lại).
+        """
+        url = f"{self.base_url}/{method}"
+        for attempt in range(self.max_retries + 1):
+            delay = None
+            self._limiter.acquire(data.get("chat_id"))
+            try:
+                files = files_factory() if files_factory else None
+                try:
+                    with TELEGRAM_REQUEST.labels(method).time():
+                        resp = self.session.post(url, data=data, files=files, timeout=10)
+                finally:
+                    for f in (files or {}).values():
+                        if hasattr(f, "close"):   # file mở từ đĩa, tuple bytes thì bỏ qua
+                            f.close()
+
+                if resp.ok:
+                    return True
+
+                if resp.status_code == 429:
+                    delay = self._retry_after(resp)
+                elif resp.status_code < 500:
+                    print(f"[TelegramNotifier] {method} lỗi:", resp.status_code, resp.text)
+                    return False
+                else:
+                    print(f"[TelegramNotifier] {method} lỗi server:", resp.status_code)
+            except OSError as e:
+                print(f"[TelegramNotifier] Lỗi kết nối khi {method}:", e)
+
+            if attempt == self.max_retries:
+                break
+            if delay is None:
+                # exponential backoff + jitter
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                delay *= random.uniform(0.8, 1.2)
+            time.sleep(delay)
+
+        print(f"[TelegramNotifier] {method} thất bại sau {self.max_retries + 1} lần thử")
+        return False
+
+    def _retry_after(self, resp) -> float | None:
+        """
+        Lấy retry_after từ body JSON của Telegram, hoặc header Retry-After (số giây hoặc HTTP-date).
+        Không đọc được -> None, _post dùng backoff thường.
+        """
+        retry_after = None
+        try:
+            body = resp.json()
+        except ValueError:
+            body = None
+        if isinstance(body, dict):
+            retry_after = body.get("parameters", {}).get("retry_after")
+        if retry_after is None:
+            retry_after = resp.headers.get("Retry-After")
+        if retry_after is None:
+            return None
         try:
-            url = f"{self.base_url}/sendPhoto"
-            with open(photo_path, "rb") as f:
-                files = {"photo": f}
-                data = {"chat_id": self.chat_id, "caption": caption}
-                resp = requests.post(url, data=data, files=files, timeout=10)
-                if not resp.ok:
-                    print("[TelegramNotifier] send_photo lỗi:", resp.status_code, resp.text)
-        except Exception as e:
-            print("[TelegramNotifier] Lỗi gửi ảnh:", e)
-
-    def send_alert(self, message: str, image_path: str | None = None):
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            try:
+                when = email.utils.parsedate_to_datetime(str(retry_after))
+            except (TypeError, ValueError):
+                print("[TelegramNotifier] Retry-After không hợp lệ:", retry_after)
+                return None
+            if when.tzinfo is None:
+                when = when.replace(tzinfo=datetime.timezone.utc)
+            delay = (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+        delay = max(0.0, delay)
+        print(f"[TelegramNotifier] Bị giới hạn (429), chờ {delay:.1f}s")
+        return delay
+
+    def send_text(self, text: str, chat_id: str | None = None) -> bool:
+        """Gửi tin nhắn text đơn giản."""
+        data = {"chat_id": chat_id or self.chat_id, "text": text}
+        return self._post("sendMessage", data)
+
+    def send_photo(self, photo, caption: str = "", chat_id: str | None = None) -> bool:
+        """
+        Gửi ảnh kèm caption.
+        photo: đường dẫn file ảnh, hoặc bytes JPEG đã encode sẵn trong RAM (không cần ghi đĩa).
+        """
+        data = {"chat_id": chat_id or self.chat_id, "caption": caption}
+
+        if isinstance(photo, (bytes, bytearray, memoryview)):
+            payload = bytes(photo)
+            return self._post("sendPhoto", data, lambda: {"photo": ("alert.jpg", payload, "image/jpeg")})
+
+        if not os.path.exists(photo):
+            print("[TelegramNotifier] Không tìm thấy file ảnh:", photo)
+            return False
+        return self._post("sendPhoto", data, lambda: {"photo": open(photo, "rb")})
+
+    def send_media_group(self, photos, caption: str = "", chat_id: str | None = None) -> bool:
+        """
+        Gửi tối đa 10 ảnh (bytes JPEG hoặc đường dẫn) thành 1 album, caption gắn vào ảnh đầu.
+        1 ảnh (kể cả sau khi bỏ file không tồn tại) thì gửi bằng sendPhoto, không còn ảnh nào thì gửi text.
+        """
+        photos = list(photos)[:MEDIA_GROUP_MAX]
+        if not photos:
+            return self.send_text(caption, chat_id=chat_id) if caption else True
+        if len(photos) == 1:
+            return self.send_photo(photos[0], caption=caption, chat_id=chat_id)
+
+        payloads = []
+        for photo in photos:
+            if isinstance(photo, (bytes, bytearray, memoryview)):
+                payloads.append(bytes(photo))
+            elif os.path.exists(photo):
+                with open(photo, "rb") as f:
+                    payloads.append(f.read())
+            else:
+                print("[TelegramNotifier] Không tìm thấy file ảnh:", photo)
+
+        # sendMediaGroup cần 2..10 ảnh: lọc xong còn ít hơn thì đổi sang sendPhoto / sendMessage
+        if not payloads:
+            return self.send_text(caption, chat_id=chat_id) if caption else False
+        if len(payloads) == 1:
+            return self.send_photo(payloads[0], caption=caption, chat_id=chat_id)
+
+        media = []
+        for i in range(len(payloads)):
+            item = {"type": "photo", "media": f"attach://photo{i}"}
+            if i == 0 and caption:
+                item["caption"] = caption[:CAPTION_MAX]
+            media.append(item)
+
+        data = {"chat_id": chat_id or self.chat_id, "media": json.dumps(media, ensure_ascii=False)}
+        return self._post(
+            "sendMediaGroup",
+            data,
+            lambda: {f"photo{i}": (f"photo{i}.jpg", p, "image/jpeg") for i, p in enumerate(payloads)},
+        )
+
+    def send_alert(self, message: str, image_path=None):
         """
         Hàm tiện dụng:
-        - nếu có image_path -> gửi ảnh kèm message
+        - nếu có image_path (đường dẫn hoặc bytes JPEG) -> gửi ảnh kèm message
         - nếu không -> gửi mỗi text
         """
         if image_path:
-            self.send_photo(image_path, caption=message)
-        else:
-            self.send_text(message)
+            return self.send_photo(image_path, caption=message)
+        return self.send_text(message)
+
+    # ======== HÀNG ĐỢI + WORKER ========
+    def start(self):
+        """Chạy worker gửi tin (gọi nhiều lần cũng chỉ có 1 worker)."""
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._work, daemon=True)
+            self._worker.start()
+
+    def enqueue(self, message: str, image=None, priority: int = PRIORITY_ALERT,
+                chat_id: str | None = None, media=None) -> bool:
+        """
+        Đưa 1 tin vào hàng đợi. Hàng đợi đầy -> bỏ tin, trả về False.
+        image: đường dẫn ảnh hoặc bytes JPEG.
+        media: list ảnh -> gửi thành album (sendMediaGroup), message là caption.
+        """
+        self.start()
+        job = {"message": message, "image": image, "media": media, "chat_id": chat_id or self.chat_id}
+        try:
+            self._queue.put_nowait((priority, next(self._seq), job))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            TELEGRAM_RESULT.labels("dropped").inc()
+            print("[TelegramNotifier] Hàng đợi đầy, bỏ tin:", message)
+            return False
+
+    def send_alert_async(self, message: str, image=None, priority: int = PRIORITY_ALERT) -> bool:
+        """Giống send_alert nhưng không chặn thread gọi."""
+        return self.enqueue(message, image, priority=priority)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _work(self):
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                break
+
+            # 1 job lỗi (ảnh hỏng, bug khi dựng request...) không được làm chết worker / treo flush()
+            try:
+                chat_id = job["chat_id"]
+                if job["media"]:
+                    ok = self.send_media_group(job["media"], caption=job["message"], chat_id=chat_id)
+                elif job["image"]:
+                    ok = self.send_photo(job["image"], caption=job["message"], chat_id=chat_id)
+                else:
+                    ok = self.send_text(job["message"], chat_id=chat_id)
+            except Exception as e:
+                print("[TelegramNotifier] Lỗi khi gửi tin:", repr(e))
+                ok = False
+
+            if ok:
+                self.sent += 1
+                TELEGRAM_RESULT.labels("sent").inc()
+            else:
+                self.failed += 1
+                TELEGRAM_RESULT.labels("failed").inc()
+            self._queue.task_done()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Chờ gửi hết hàng đợi (dùng khi tắt chương trình / test)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def close(self, timeout: float = 5.0):
+        self.flush(timeout)
+        if self._worker is not None:
+            # sentinel ưu tiên thấp nhất -> chạy sau các tin còn lại
+            self._queue.put((float("inf"), next(self._seq), None))
+            self._worker.join(timeout)
+        self.session.close()
+
+
+class AlertDigest:
+    """
+    Gom các cảnh báo liên tiếp thành 1 album Telegram (sendMediaGroup, tối đa 10 ảnh)
+    với caption chung: số lần, khoảng thời gian, track id, tên.
+    - max_items: đủ bấy nhiêu ảnh thì gửi luôn (flush theo số lượng).
+    - window: ảnh đầu tiên trong digest chờ tối đa bấy nhiêu giây (flush theo thời gian).
+    - send_first: cảnh báo đầu tiên của 1 đợt gửi ngay, các cảnh báo sau mới gom lại.
+    """
+
+    def __init__(self, notifier: TelegramNotifier, window: float = 30.0,
+                 max_items: int = MEDIA_GROUP_MAX, send_first: bool = True):
+        self.notifier = notifier
+        self.window = window
+        self.max_items = max(1, min(max_items, MEDIA_GROUP_MAX))
+        self.send_first = send_first
+
+        self._items = []
+        self._opened_at = None       # lúc ảnh đầu tiên của digest được thêm
+        self._last_alert_at = 0.0
+        self._lock = threading.Condition()
+        threading.Thread(target=self._timer_loop, daemon=True).start()
+
+    def add(self, message: str, image=None, track_ids=(), names=(),
+            priority: int = PRIORITY_ALERT) -> bool:
+        """Thêm 1 cảnh báo (image: bytes JPEG hoặc đường dẫn). Trả về False nếu hàng đợi đầy."""
+        now = time.time()
+        with self._lock:
+            quiet = now - self._last_alert_at > self.window
+            self._last_alert_at = now
+            if self.send_first and quiet and not self._items:
+                # đầu 1 đợt mới -> báo ngay cho nhanh
+                return self.notifier.send_alert_async(message, image, priority=priority)
+
+            self._items.append(
+                {"time": now, "message": message, "image": image,
+                 "track_ids": list(track_ids), "names": list(names)}
+            )
+            if self._opened_at is None:
+                self._opened_at = now
+                self._lock.notify_all()
+            if len(self._items) >= self.max_items:
+                batch = self._take()
+            else:
+                return True
+        return self._send(batch)
+
+    def _take(self):
+        batch, self._items = self._items, []
+        self._opened_at = None
+        return batch
+
+    def flush(self) -> bool:
+        with self._lock:
+            batch = self._take()
+        return self._send(batch)
+
+    def _timer_loop(self):
+        while True:
+            with self._lock:
+                while self._opened_at is None:
+                    self._lock.wait()
+                remaining = self._opened_at + self.window - time.time()
+                if remaining > 0:
+                    self._lock.wait(remaining)
+                    continue
+                batch = self._take()
+            self._send(batch)
+
+    @staticmethod
+    def caption_for(batch) -> str:
+        start = time.strftime("%H:%M:%S", time.localtime(batch[0]["time"]))
+        end = time.strftime("%H:%M:%S", time.localtime(batch[-1]["time"]))
+        track_ids = sorted({t for item in batch for t in item["track_ids"]})
+        names = sorted({n for item in batch for n in item["names"]})
+
+        lines = [f"Cảnh báo: {len(batch)} lần phát hiện ({start} – {end})"]
+        if track_ids:
+            lines.append("Track: " + ", ".join(f"#{t}" for t in track_ids))
+        if names:
+            lines.append("Tên: " + ", ".join(names))
+        # giữ nội dung từng cảnh báo, không trùng lặp
+        seen = []
+        for item in batch:
+            if item["message"] not in seen:
+                seen.append(item["message"])
+        lines.extend(seen)
+        return "\n".join(lines)[:CAPTION_MAX]
+
+    def _send(self, batch) -> bool:
+        if not batch:
+            return True
+        photos = [item["image"] for item in batch if item["image"]]
+        return self.notifier.enqueue(self.caption_for(batch), media=photos or None)
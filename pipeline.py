@@ -0,0 +1,186 @@
+import os
+import queue
+import threading
+import time
+
+from metrics import PIPELINE_DROPPED, PIPELINE_QUEUE
+
+_STOP = object()
+
+
+class Stage:
+    """
+    Một bước xử lý trong pipeline.
+    - fn(item) -> item mới (hoặc None để bỏ frame).
+    - workers: số thread chạy song song cho stage này.
+    - ordered=True: stage có state (vd đếm unknown_streak) -> 1 worker, nhận frame đúng thứ tự.
+    """
+
+    def __init__(self, name: str, fn, workers: int = 1, ordered: bool = False):
+        self.name = name
+        self.fn = fn
+        self.ordered = ordered
+        self.workers = 1 if ordered else max(1, int(workers))
+
+
+class StagePipeline:
+    """
+    Chạy các Stage nối tiếp nhau, giữa 2 stage là queue có giới hạn.
+    Các stage chạy chồng lên nhau trên các frame khác nhau, nên throughput
+    bị giới hạn bởi stage chậm nhất chứ không phải tổng thời gian các stage.
+    Kết quả trả ra luôn đúng thứ tự frame đưa vào.
+    """
+
+    def __init__(self, stages, queue_size: int = 4, name: str = "main"):
+        if not stages:
+            raise ValueError("Pipeline cần ít nhất 1 stage")
+        self.stages = list(stages)
+        self.queue_size = max(1, queue_size)
+        self.name = name
+        self._active = set()    # stop event của các lần run() đang chạy
+        self._active_lock = threading.Lock()
+
+    def run(self, source):
+        """
+        source: iterable sinh ra item (vd dict chứa frame).
+        Trả về generator các item đã xử lý xong, đúng thứ tự.
+        Đóng generator (client ngắt kết nối...) hoặc gọi stop() sẽ dừng và join toàn bộ thread.
+        """
+        stop = threading.Event()
+        with self._active_lock:
+            self._active.add(stop)
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = []
+        for stage, q in zip(self.stages, queues):
+            PIPELINE_QUEUE.labels(self.name, stage.name).set_function(q.qsize)
+
+        feeder = threading.Thread(
+            target=self._feed, args=(source, queues[0], self.stages[0].workers, stop), daemon=True
+        )
+        threads.append(feeder)
+
+        for i, stage in enumerate(self.stages):
+            next_workers = self.stages[i + 1].workers if i + 1 < len(self.stages) else 1
+            alive = [stage.workers]
+            lock = threading.Lock()
+            for _ in range(stage.workers):
+                threads.append(
+                    threading.Thread(
+                        target=self._work,
+                        args=(stage, queues[i], queues[i + 1], next_workers, alive, lock, stop),
+                        daemon=True,
+                    )
+                )
+
+        for t in threads:
+            t.start()
+
+        return self._collect(queues[-1], stop, threads)
+
+    def stop(self):
+        """Dừng mọi lần run() đang chạy (gọi từ thread khác): generator kết thúc ở lần chờ kế tiếp."""
+        with self._active_lock:
+            for stop in self._active:
+                stop.set()
+
+    @staticmethod
+    def _put(q, entry, stop):
+        # put có timeout để không kẹt thread khi bên nhận đã dừng
+        while not stop.is_set():
+            try:
+                q.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _feed(self, source, out_q, n_workers, stop):
+        try:
+            for seq, item in enumerate(source):
+                if stop.is_set():
+                    break
+                if not self._put(out_q, (seq, item), stop):
+                    break
+        except Exception as e:
+            print("[StagePipeline] Lỗi đọc nguồn frame:", e)
+        finally:
+            for _ in range(n_workers):
+                self._put(out_q, _STOP, stop)
+
+    def _work(self, stage, in_q, out_q, next_workers, alive, lock, stop):
+        pending = {}
+        next_seq = 0
+        m_dropped = PIPELINE_DROPPED.labels(self.name, stage.name)
+
+        def handle(seq, item):
+            if item is not None:
+                try:
+                    item = stage.fn(item)
+                except Exception as e:
+                    print(f"[StagePipeline] Stage '{stage.name}' lỗi:", e)
+                    item = None
+                if item is None:
+                    m_dropped.inc()
+            # vẫn chuyển tiếp None để stage ordered phía sau không chờ mãi seq này
+            return self._put(out_q, (seq, item), stop)
+
+        while not stop.is_set():
+            try:
+                entry = in_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if entry is _STOP:
+                break
+
+            seq, item = entry
+            if not stage.ordered:
+                if not handle(seq, item):
+                    break
+                continue
+
+            pending[seq] = item
+            while next_seq in pending:
+                if not handle(next_seq, pending.pop(next_seq)):
+                    break
+                next_seq += 1
+
+        with lock:
+            alive[0] -= 1
+            last = alive[0] == 0
+        if last:
+            for _ in range(next_workers):
+                self._put(out_q, _STOP, stop)
+
+    def _collect(self, in_q, stop, threads, join_timeout: float = 5.0):
+        pending = {}
+        next_seq = 0
+        try:
+            while True:
+                try:
+                    entry = in_q.get(timeout=0.1)
+                except queue.Empty:
+                    if stop.is_set():
+                        break
+                    continue
+                if entry is _STOP:
+                    break
+                seq, item = entry
+                pending[seq] = item
+                while next_seq in pending:
+                    item = pending.pop(next_seq)
+                    next_seq += 1
+                    if item is not None:
+                        yield item
+        finally:
+            stop.set()
+            # chờ các stage chạy xong frame đang dở, để bên gọi đóng tiếp detector / camera an toàn
+            deadline = time.monotonic() + join_timeout
+            for t in threads:
+                t.join(max(0.0, deadline - time.monotonic()))
+            with self._active_lock:
+                self._active.discard(stop)
+
+
+def default_workers():
+    """Số worker mặc định cho stage nặng: dùng hết core của máy."""
+    return os.cpu_count() or 1
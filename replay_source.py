@@ -0,0 +1,159 @@
+import os
+import time
+
+import cv2
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class ReplaySource:
+    """
+    Phát lại video / thư mục ảnh với cùng interface như camera_Stream
+    (read, read_with_meta, stats, start, stop, release) -> chạy pipeline, benchmark
+    mà không cần webcam.
+    - speed=1.0: đúng tốc độ gốc (fps của file), đọc chậm thì bỏ frame trễ giống camera thật.
+    - speed=2.0: nhanh gấp đôi...; speed=0: không giới hạn, trả lần lượt mọi frame (benchmark).
+    - loop=True: hết file thì phát lại từ đầu.
+    timestamp trả về là thời điểm "danh nghĩa" của frame (start + frame_id / fps),
+    nên cùng 1 file luôn cho cùng kết quả.
+    """
+
+    def __init__(self, source, speed: float = 1.0, loop: bool = False, fps: float | None = None,
+                 width: int | None = None, height: int | None = None):
+        """
+        source: đường dẫn video, thư mục ảnh, hoặc list frame (numpy) có sẵn trong RAM.
+        fps: fps khi phát thư mục ảnh / list frame (video thì lấy từ file nếu không truyền).
+        width, height: resize frame về kích thước này (giống camera_Stream đặt độ phân giải).
+        """
+        self.source = source
+        self.speed = max(0.0, float(speed))
+        self.loop = loop
+        self.size = (width, height) if width and height else None
+
+        self._cap = None
+        self._paths = None
+        self._frames = None
+        if isinstance(source, (list, tuple)):
+            self._frames = list(source)
+            if not self._frames:
+                raise RuntimeError("List frame rỗng")
+            native_fps = None
+        elif os.path.isdir(source):
+            self._paths = sorted(
+                os.path.join(source, f) for f in os.listdir(source) if f.lower().endswith(IMAGE_EXTS)
+            )
+            if not self._paths:
+                raise RuntimeError(f"Thư mục không có ảnh: {source}")
+            native_fps = None
+        else:
+            self._cap = cv2.VideoCapture(source)
+            if not self._cap.isOpened():
+                raise RuntimeError(f"Không mở được video: {source}")
+            native_fps = self._cap.get(cv2.CAP_PROP_FPS) or None
+
+        self.fps = fps or native_fps or 15.0
+
+        # bộ đếm (cùng tên với camera_Stream)
+        self.frames_grabbed = 0
+        self.frames_dropped = 0
+        self._pos = 0            # vị trí trong file, tính cả vòng lặp
+        self._start_time = None
+        self._ended = False      # hết file (không loop) hoặc đã release
+
+    # ======== ĐỌC FRAME ========
+    def _next_raw(self):
+        """Frame kế tiếp trong file (None nếu hết và không loop)."""
+        while True:
+            if self._frames is not None:
+                idx = self._pos % len(self._frames) if self.loop else self._pos
+                frame = self._frames[idx].copy() if idx < len(self._frames) else None
+            elif self._paths is not None:
+                idx = self._pos % len(self._paths) if self.loop else self._pos
+                frame = cv2.imread(self._paths[idx]) if idx < len(self._paths) else None
+            else:
+                ok, frame = self._cap.read()
+                if not ok:
+                    frame = None
+                    if self.loop and self._pos > 0:
+                        self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        ok, frame = self._cap.read()
+                        frame = frame if ok else None
+
+            if frame is None:
+                self._ended = True
+                return None
+            self._pos += 1
+            if self.size is not None and (frame.shape[1], frame.shape[0]) != self.size:
+                frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+            return frame
+
+    def _skip_raw(self) -> bool:
+        """Bỏ qua 1 frame mà không decode (video: grab(), thư mục / list: chỉ tăng vị trí)."""
+        if self._cap is None:
+            n = len(self._frames) if self._frames is not None else len(self._paths)
+            if not self.loop and self._pos >= n:
+                self._ended = True
+                return False
+        else:
+            ok = self._cap.grab()
+            if not ok and self.loop and self._pos > 0:
+                self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok = self._cap.grab()
+            if not ok:
+                self._ended = True
+                return False
+        self._pos += 1
+        return True
+
+    def read_with_meta(self, timeout: float = 1.0):
+        """Trả về (ok, frame, timestamp, frame_id) giống camera_Stream."""
+        if self._start_time is None:
+            self._start_time = time.time()
+
+        if self.speed > 0:
+            # tới giờ của frame nào thì phát frame đó, các frame đã trễ bị bỏ
+            elapsed = (time.time() - self._start_time) * self.speed
+            due = int(elapsed * self.fps)
+            while self._pos < due:
+                if not self._skip_raw():
+                    return False, None, 0.0, -1
+                self.frames_dropped += 1
+            wait = (self._pos / self.fps) / self.speed - (time.time() - self._start_time)
+            if wait > 0:
+                time.sleep(wait)
+
+        frame_id = self._pos
+        frame = self._next_raw()
+        if frame is None:
+            return False, None, 0.0, -1
+        self.frames_grabbed += 1
+        return True, frame, self._start_time + frame_id / self.fps, frame_id
+
+    def read(self):
+        ok, frame, _, _ = self.read_with_meta()
+        return ok, frame
+
+    @property
+    def running(self) -> bool:
+        """Còn frame để đọc không (False sau khi hết file / release)."""
+        return not self._ended
+
+    def stats(self):
+        return {
+            "grabbed": self.frames_grabbed,
+            "dropped": self.frames_dropped,
+            "buffered": 0,
+        }
+
+    # ======== ĐIỀU KHIỂN ========
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def release(self):
+        self._ended = True
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
@@ -2,7 +2,7 @@ import os
 import json
 import cv2
 
-MODELS_DIR = "models"
+MODELS_DIR = "Models"
 MODEL_PATH = os.path.join(MODELS_DIR, "face_lbph.xml")
 LABELS_PATH = os.path.join(MODELS_DIR, "face_labels.json")
 
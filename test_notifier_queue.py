@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from notifier import TelegramNotifier, PRIORITY_ALERT, PRIORITY_INFO
+
+# Server giả lập Telegram Bot API chạy local, không cần mạng / token thật.
+# Kịch bản: request đầu tiên bị 429 (retry_after=1), request thứ 2 bị 500, còn lại OK.
+
+
+class FakeTelegram(BaseHTTPRequestHandler):
+    calls = []          # (time, method, status, chat_id)
+    plan = [429, 500]   # status trả về cho các request đầu
+    lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        method = self.path.rsplit("/", 1)[-1]
+        chat_id = "?"
+        marker = b'name="chat_id"'
+        if marker in body:
+            chat_id = body.split(marker, 1)[1].split(b"\r\n")[2].decode()
+        elif b"chat_id=" in body:
+            chat_id = body.split(b"chat_id=", 1)[1].split(b"&")[0].decode()
+
+        with self.lock:
+            status = self.plan.pop(0) if self.plan else 200
+            self.calls.append((time.monotonic(), method, status, chat_id))
+
+        if status == 429:
+            payload = {"ok": False, "error_code": 429, "parameters": {"retry_after": 1}}
+        elif status == 200:
+            payload = {"ok": True, "result": {}}
+        else:
+            payload = {"ok": False, "error_code": status}
+
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTelegram)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print("Server giả:", api_url)
+
+    noti = TelegramNotifier(
+        "TEST_TOKEN",
+        "111",
+        api_url=api_url,
+        queue_size=8,
+        backoff_base=0.2,
+        rate_per_chat=5.0,
+        burst_per_chat=1,
+    )
+
+    # 1 tin chat khác + 1 info + 10 cảnh báo: hàng đợi 8 -> có tin bị bỏ, cảnh báo gửi trước info
+    noti.enqueue("chat khác", chat_id="222")
+    noti.enqueue("info", priority=PRIORITY_INFO)
+    for i in range(10):
+        noti.enqueue(f"alert {i}", priority=PRIORITY_ALERT)
+
+    t0 = time.monotonic()
+    noti.flush(timeout=30)
+    elapsed = time.monotonic() - t0
+    noti.close()
+    server.shutdown()
+
+    calls = FakeTelegram.calls
+    statuses = [c[2] for c in calls]
+    print(f"Xong trong {elapsed:.2f}s: sent={noti.sent} failed={noti.failed} dropped={noti.dropped}")
+    print("Status server trả:", statuses)
+
+    # khoảng cách giữa 2 request liên tiếp của chat 111 >= 1 / rate
+    ok_times = [c[0] for c in calls if c[3] == "111"]
+    gaps = [b - a for a, b in zip(ok_times, ok_times[1:])]
+    print("Khoảng cách nhỏ nhất giữa 2 tin chat 111: %.3fs" % (min(gaps) if gaps else 0))
+
+    assert statuses[:2] == [429, 500], "server phải thấy 429 rồi 500 trước"
+    assert calls[1][0] - calls[0][0] >= 0.95, "phải chờ retry_after sau 429"
+    assert noti.failed == 0, "mọi tin trong hàng đợi phải gửi được sau retry"
+    assert noti.sent + noti.dropped == 12
+    assert all(g >= 0.18 for g in gaps), "vượt giới hạn tốc độ mỗi chat"
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
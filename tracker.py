@@ -0,0 +1,294 @@
+import threading
+
+import numpy as np
+
+
+def iou_matrix(a, b):
+    """IoU giữa 2 tập bbox xyxy: a (N, 4), b (M, 4) -> (N, M)."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+class Track:
+    """
+    1 người đang được theo dõi: vị trí + vận tốc, kèm danh tính đã nhận diện (cache).
+    """
+
+    def __init__(self, track_id: int, box, frame_idx: int):
+        self.id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.velocity = np.zeros(4, dtype=np.float32)   # px / frame
+        self.last_frame = frame_idx
+        self.hits = 1
+        self.misses = 0
+
+        # danh tính (cache kết quả nhận diện mặt)
+        self.name = None
+        self.confidence = 0.0
+        self.is_known = False
+        self.face_rel = None        # bbox mặt theo tỉ lệ bbox người (rx, ry, rw, rh)
+        self.last_recognized = None
+        self.pending_since = None   # đã lên lịch nhận diện, chờ kết quả
+
+        self.unknown_streak = 0
+
+        # vùng / tripwire (ZoneSet): in_roi = False -> không nhận diện mặt, không cảnh báo
+        self.zones = []             # tên các vùng đang đứng trong
+        self.crossed = []           # tên các tripwire đã cắt qua (giữ suốt đời track)
+        self.in_roi = True
+
+    def predict(self, frame_idx: int):
+        dt = max(0, frame_idx - self.last_frame)
+        return self.box + self.velocity * dt
+
+    def face_box(self, box=None):
+        """bbox mặt (x, y, w, h) theo vị trí hiện tại của người (hoặc theo box cho trước)."""
+        if self.face_rel is None:
+            return None
+        x1, y1, x2, y2 = (self.box if box is None else box).tolist()
+        bw, bh = x2 - x1, y2 - y1
+        rx, ry, rw, rh = self.face_rel
+        return (int(x1 + rx * bw), int(y1 + ry * bh), int(rw * bw), int(rh * bh))
+
+
+class PersonTracker:
+    """
+    Tracker nhẹ cho bbox người:
+    - dự đoán vị trí bằng vận tốc không đổi, cập nhật kiểu alpha-beta (Kalman rút gọn);
+    - ghép detection mới với track bằng IoU, còn lại thì ghép theo khoảng cách tâm;
+    - mỗi track giữ tên / confidence đã nhận diện, chỉ nhận diện lại khi cũ hoặc chưa chắc.
+    """
+
+    def __init__(
+        self,
+        iou_threshold: float = 0.3,
+        center_gate: float = 0.5,
+        max_misses: int = 10,
+        alpha: float = 0.6,
+        beta: float = 0.2,
+        known_ttl: int = 60,
+        unknown_ttl: int = 5,
+    ):
+        """
+        center_gate: khoảng cách tâm tối đa (tính theo đường chéo bbox) để ghép khi IoU thấp.
+        max_misses: số lần detect liên tiếp không thấy thì xoá track.
+        known_ttl / unknown_ttl: số frame trước khi nhận diện lại người quen / chưa rõ.
+        """
+        self.iou_threshold = iou_threshold
+        self.center_gate = center_gate
+        self.max_misses = max_misses
+        self.alpha = alpha
+        self.beta = beta
+        self.known_ttl = known_ttl
+        self.unknown_ttl = unknown_ttl
+
+        self.tracks = []
+        self._next_id = 1
+        # stage detect (update / schedule) và annotate (assign_faces) chạy ở 2 thread khác nhau
+        self.lock = threading.RLock()
+
+    def _match(self, predicted, boxes):
+        """Ghép greedy: IoU cao nhất trước, sau đó theo tâm gần nhất."""
+        matches = []
+        if len(predicted) == 0 or len(boxes) == 0:
+            return matches
+
+        iou = iou_matrix(predicted, boxes)
+        used_t, used_d = set(), set()
+        for flat in np.argsort(-iou, axis=None):
+            ti, di = np.unravel_index(flat, iou.shape)
+            if iou[ti, di] < self.iou_threshold:
+                break
+            if ti in used_t or di in used_d:
+                continue
+            used_t.add(ti)
+            used_d.add(di)
+            matches.append((int(ti), int(di)))
+
+        # IoU không đủ (người đi nhanh / detect thưa) -> thử theo tâm
+        pc = (predicted[:, :2] + predicted[:, 2:]) / 2
+        dc = (boxes[:, :2] + boxes[:, 2:]) / 2
+        diag = np.hypot(predicted[:, 2] - predicted[:, 0], predicted[:, 3] - predicted[:, 1])
+        dist = np.linalg.norm(pc[:, None, :] - dc[None, :, :], axis=2) / np.maximum(diag[:, None], 1.0)
+        for flat in np.argsort(dist, axis=None):
+            ti, di = np.unravel_index(flat, dist.shape)
+            if dist[ti, di] > self.center_gate:
+                break
+            if ti in used_t or di in used_d:
+                continue
+            used_t.add(ti)
+            used_d.add(di)
+            matches.append((int(ti), int(di)))
+
+        return matches
+
+    def update(self, detections, frame_idx: int):
+        """
+        Cập nhật tracker với detections (mảng DET_DTYPE) của frame frame_idx.
+        Trả về bản sao detections đã điền track_id.
+        """
+        detections = detections.copy()
+        boxes = detections["xyxy"].astype(np.float32)
+
+        predicted = np.array([t.predict(frame_idx) for t in self.tracks], dtype=np.float32).reshape(-1, 4)
+        matches = self._match(predicted, boxes)
+
+        matched_t = set()
+        matched_d = set()
+        for ti, di in matches:
+            t = self.tracks[ti]
+            dt = max(1, frame_idx - t.last_frame)
+            residual = boxes[di] - predicted[ti]
+            t.velocity = t.velocity + self.beta * residual / dt
+            t.box = predicted[ti] + self.alpha * residual
+            t.last_frame = frame_idx
+            t.hits += 1
+            t.misses = 0
+            detections["track_id"][di] = t.id
+            matched_t.add(ti)
+            matched_d.add(di)
+
+        for ti, t in enumerate(self.tracks):
+            if ti not in matched_t:
+                t.misses += 1
+
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        for di in range(len(boxes)):
+            if di in matched_d:
+                continue
+            t = Track(self._next_id, boxes[di], frame_idx)
+            self._next_id += 1
+            self.tracks.append(t)
+            detections["track_id"][di] = t.id
+
+        return detections
+
+    def visible(self):
+        """Các track đang thấy trong lần detect gần nhất."""
+        return [t for t in self.tracks if t.misses == 0]
+
+    def snapshot(self):
+        """
+        Vị trí + vùng của các track đang thấy ở thời điểm gọi: {track_id: {"box", "in_roi", "zones"}}.
+        Stage detect chụp lại cho từng frame để annotate (chạy sau, khi tracker đã sang frame khác)
+        vẫn ghép mặt / tính streak theo đúng vị trí của frame đó.
+        """
+        return {
+            t.id: {"box": t.box.copy(), "in_roi": t.in_roi, "zones": t.zones + t.crossed}
+            for t in self.visible()
+        }
+
+    def get(self, track_id: int):
+        for t in self.tracks:
+            if t.id == track_id:
+                return t
+        return None
+
+    def needs_recognition(self, track: Track, frame_idx: int) -> bool:
+        """Danh tính đã cũ / chưa chắc / chưa từng nhận diện -> cần chạy lại."""
+        if track.pending_since is not None and frame_idx - track.pending_since < self.unknown_ttl:
+            return False
+        if track.last_recognized is None:
+            return True
+        ttl = self.known_ttl if track.is_known else self.unknown_ttl
+        return frame_idx - track.last_recognized >= ttl
+
+    def schedule(self, detections, frame_idx: int):
+        """
+        Chọn các detection (đã có track_id) cần nhận diện mặt ở frame này,
+        đánh dấu pending để các frame sau không lên lịch trùng.
+        """
+        keep = np.zeros(len(detections), dtype=bool)
+        for i, track_id in enumerate(detections["track_id"].tolist()):
+            t = self.get(track_id)
+            if t is not None and self.needs_recognition(t, frame_idx):
+                t.pending_since = frame_idx
+                keep[i] = True
+        return detections[keep]
+
+    def _visible_boxes(self, snapshot=None):
+        """[(track, box)]: box theo snapshot của frame (nếu có), không thì vị trí hiện tại."""
+        if snapshot is None:
+            return [(t, t.box) for t in self.visible()]
+        pairs = []
+        for track_id, snap in snapshot.items():
+            t = self.get(track_id)
+            if t is not None:
+                pairs.append((t, snap["box"]))
+        return pairs
+
+    def assign_faces(self, face_results, frame_idx: int, scheduled_ids=(), snapshot=None):
+        """
+        Gán kết quả nhận diện mặt cho track chứa tâm khuôn mặt.
+        scheduled_ids: các track đã lên lịch nhận diện ở frame này.
+        snapshot: snapshot() của đúng frame chứa các mặt này.
+        Trả về các kết quả không thuộc track nào.
+        """
+        loose = []
+        assigned = set()
+        visible = self._visible_boxes(snapshot)
+        for r in face_results:
+            x, y, w, h = r["box"]
+            cx, cy = x + w / 2, y + h / 2
+
+            owner = None
+            owner_box = None
+            best_area = None
+            for t, box in visible:
+                x1, y1, x2, y2 = box.tolist()
+                if x1 <= cx <= x2 and y1 <= cy <= y2:
+                    area = (x2 - x1) * (y2 - y1)
+                    if best_area is None or area < best_area:
+                        owner, owner_box, best_area = t, box, area
+            if owner is None:
+                loose.append(r)
+                continue
+
+            x1, y1, x2, y2 = owner_box.tolist()
+            bw, bh = max(x2 - x1, 1.0), max(y2 - y1, 1.0)
+            owner.face_rel = ((x - x1) / bw, (y - y1) / bh, w / bw, h / bh)
+            owner.name = r["name"]
+            owner.confidence = r["confidence"]
+            owner.is_known = r["is_known"]
+            owner.last_recognized = frame_idx
+            owner.pending_since = None
+            assigned.add(owner.id)
+
+        # đã thử nhưng không thấy mặt -> giữ danh tính cũ, chờ hết ttl rồi thử lại
+        for track_id in scheduled_ids:
+            t = self.get(track_id)
+            if t is not None and track_id not in assigned:
+                t.last_recognized = frame_idx
+                t.pending_since = None
+
+        return loose
+
+    def face_results(self, snapshot=None):
+        """Kết quả nhận diện (đã cache) của các track đang thấy, cùng format recognize()."""
+        results = []
+        for t, person_box in self._visible_boxes(snapshot):
+            box = t.face_box(person_box)
+            if box is None or t.name is None:
+                continue
+            results.append(
+                {
+                    "box": box,
+                    "name": t.name,
+                    "confidence": float(t.confidence),
+                    "is_known": t.is_known,
+                    "track_id": t.id,
+                }
+            )
+        return results
@@ -0,0 +1,39 @@
+import os
+
+from face_backends import EmbeddingBackend
+from face_gallery import FaceGallery
+from train_face_recognizer import load_face_dataset, MODELS_DIR
+
+EMBEDDING_MODEL_PATH = os.path.join(MODELS_DIR, "face_embedding.onnx")
+GALLERY_PATH = os.path.join(MODELS_DIR, "face_gallery.npz")
+BATCH_SIZE = 64
+ANN_MIN_SIZE = 5000   # gallery lớn hơn thì dựng sẵn IVF index
+
+
+def main():
+    """Tạo gallery embedding từ thư mục faces/ (dùng cho EmbeddingBackend)."""
+    os.makedirs(MODELS_DIR, exist_ok=True)
+
+    images, labels, id_to_name = load_face_dataset()
+    print(f"Tổng ảnh: {len(images)}, số người: {len(id_to_name)}")
+
+    backend = EmbeddingBackend(model_path=EMBEDDING_MODEL_PATH, gallery_path=None)
+    gallery = FaceGallery()
+
+    print("Tính embedding...")
+    for start in range(0, len(images), BATCH_SIZE):
+        batch = list(images[start:start + BATCH_SIZE])
+        batch_labels = labels[start:start + BATCH_SIZE]
+        embeddings = backend.embed(batch)
+        gallery.add_batch([id_to_name[label_id] for label_id in batch_labels], embeddings)
+
+    if len(gallery) >= ANN_MIN_SIZE:
+        print("Dựng IVF index...")
+        gallery.build_index()
+
+    gallery.save(GALLERY_PATH)
+    print(f"Đã lưu gallery: {GALLERY_PATH} ({len(gallery)} embedding, {len(gallery.id_to_name)} người)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,77 +1,321 @@
 import os
+import sys
 import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
 import cv2
 import numpy as np
 
 FACES_DIR = "faces"
-MODELS_DIR = "models"
+MODELS_DIR = "Models"
 MODEL_PATH = os.path.join(MODELS_DIR, "face_lbph.xml")
 LABELS_PATH = os.path.join(MODELS_DIR, "face_labels.json")
+MANIFEST_PATH = os.path.join(MODELS_DIR, "face_manifest.json")
+CACHE_DIR = os.path.join(MODELS_DIR, "face_cache")
+FACE_SIZE = 200
+CHUNK_SIZE = 256   # số ảnh mỗi task decode
 
 
-def load_face_dataset():
-    images = []
-    labels = []
-    id_to_name = {}
-    current_id = 0
+def read_face(path):
+    """Đọc 1 ảnh mặt, chuẩn về ảnh xám 200x200. Lỗi -> None."""
+    img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None
+    return cv2.resize(img, (FACE_SIZE, FACE_SIZE))
 
+
+def scan_faces_dir():
+    """Trả về {tên người: [đường dẫn ảnh, ...]} theo thứ tự sắp xếp."""
     if not os.path.isdir(FACES_DIR):
         raise RuntimeError(f"Thư mục '{FACES_DIR}' không tồn tại.")
 
+    people = {}
     for name in sorted(os.listdir(FACES_DIR)):
         person_dir = os.path.join(FACES_DIR, name)
         if not os.path.isdir(person_dir):
             continue
+        people[name] = [os.path.join(person_dir, f) for f in sorted(os.listdir(person_dir))]
+    return people
+
+
+def _decode_chunk(shard_path, start, paths):
+    """
+    Chạy trong process con: decode 1 nhóm ảnh, ghi thẳng vào file .npy memmap
+    của shard từ dòng start. Trả về list True/False (đọc được hay không).
+    """
+    cv2.setNumThreads(1)
+    shard = np.load(shard_path, mmap_mode="r+")
+    ok = []
+    for i, path in enumerate(paths):
+        img = read_face(path)
+        if img is None:
+            ok.append(False)
+            continue
+        shard[start + i] = img
+        ok.append(True)
+    shard.flush()
+    del shard
+    return ok
+
+
+def _file_stamps(paths):
+    stamps = []
+    for path in paths:
+        st = os.stat(path)
+        stamps.append([path, st.st_mtime, st.st_size])
+    return stamps
+
+
+def _load_cache_meta(name):
+    meta_path = os.path.join(CACHE_DIR, f"{name}.json")
+    shard_path = os.path.join(CACHE_DIR, f"{name}.npy")
+    if not os.path.exists(meta_path) or not os.path.exists(shard_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _build_shards(stale, workers=None):
+    """Decode song song các người có cache cũ, mỗi người 1 shard .npy."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    jobs = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for name, stamps in stale.items():
+            tmp_path = os.path.join(CACHE_DIR, f"{name}.tmp.npy")
+            # cấp phát file memmap trước, các process con ghi thẳng vào
+            shard = np.lib.format.open_memmap(
+                tmp_path, mode="w+", dtype=np.uint8, shape=(len(stamps), FACE_SIZE, FACE_SIZE)
+            )
+            del shard
+
+            paths = [p for p, _, _ in stamps]
+            futures = [
+                pool.submit(_decode_chunk, tmp_path, start, paths[start:start + CHUNK_SIZE])
+                for start in range(0, len(paths), CHUNK_SIZE)
+            ]
+            jobs.append((name, stamps, tmp_path, futures))
 
-        print(f"Đọc dữ liệu của: {name}")
-        id_to_name[current_id] = name
+        for name, stamps, tmp_path, futures in jobs:
+            ok = [flag for fut in futures for flag in fut.result()]
+            for (path, _, _), flag in zip(stamps, ok):
+                if not flag:
+                    print(f"  Bỏ qua file (không đọc được): {path}")
 
-        for filename in os.listdir(person_dir):
-            path = os.path.join(person_dir, filename)
-            img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
-            if img is None:
-                print(f"  Bỏ qua file (không đọc được): {path}")
-                continue
+            os.replace(tmp_path, os.path.join(CACHE_DIR, f"{name}.npy"))
+            write_json_atomic(os.path.join(CACHE_DIR, f"{name}.json"), {"files": stamps, "ok": ok})
 
-            # chuẩn về 200x200
-            img_resized = cv2.resize(img, (200, 200))
-            images.append(img_resized)
-            labels.append(current_id)
 
-        current_id += 1
+def load_face_dataset(workers=None):
+    """
+    Đọc toàn bộ faces/ thành (images (N, 200, 200) uint8, labels (N,) int32, id_to_name).
+    Mỗi người có 1 shard cache Models/face_cache/<tên>.npy, chỉ decode lại khi
+    danh sách file / mtime / size thay đổi; phần decode chạy song song nhiều process.
+    """
+    people = scan_faces_dir()
 
-    if not images:
+    stale = {}
+    metas = {}
+    for name, paths in people.items():
+        stamps = _file_stamps(paths)
+        meta = _load_cache_meta(name)
+        if meta is not None and meta["files"] == stamps:
+            metas[name] = meta
+        else:
+            print(f"Đọc dữ liệu của: {name} ({len(paths)} ảnh)")
+            stale[name] = stamps
+
+    if stale:
+        _build_shards(stale, workers=workers)
+        for name in stale:
+            metas[name] = _load_cache_meta(name)
+
+    id_to_name = {}
+    total = 0
+    for label_id, name in enumerate(people):
+        id_to_name[label_id] = name
+        total += sum(metas[name]["ok"])
+
+    if total == 0:
         raise RuntimeError("Không có ảnh nào trong 'faces/'.")
 
+    # cấp phát 1 lần, copy từng shard (mmap) vào đúng chỗ
+    images = np.empty((total, FACE_SIZE, FACE_SIZE), dtype=np.uint8)
+    labels = np.empty(total, dtype=np.int32)
+    pos = 0
+    for label_id, name in id_to_name.items():
+        ok = np.array(metas[name]["ok"], dtype=bool)
+        n = int(ok.sum())
+        if n == 0:
+            continue
+        shard = np.load(os.path.join(CACHE_DIR, f"{name}.npy"), mmap_mode="r")
+        images[pos:pos + n] = shard[ok] if not ok.all() else shard
+        labels[pos:pos + n] = label_id
+        pos += n
+        del shard
+
     return images, labels, id_to_name
 
 
-def main():
-    os.makedirs(MODELS_DIR, exist_ok=True)
+# ======== MANIFEST / GHI FILE AN TOÀN ========
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
 
-    images, labels, id_to_name = load_face_dataset()
 
-    print(f"Tổng ảnh: {len(images)}, số người: {len(id_to_name)}")
+def write_json_atomic(path, data):
+    """Ghi ra file tạm rồi os.replace -> bên đọc không bao giờ thấy file dở dang."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def save_model_atomic(recognizer, path):
+    # giữ đuôi .xml để OpenCV chọn đúng định dạng
+    tmp_path = path[:-4] + ".tmp.xml" if path.endswith(".xml") else path + ".tmp"
+    recognizer.save(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def file_entry(path, label_id, old_entry=None):
+    """Thông tin 1 file trong manifest; chỉ hash lại khi mtime/size đổi."""
+    st = os.stat(path)
+    if old_entry and old_entry["mtime"] == st.st_mtime and old_entry["size"] == st.st_size:
+        sha1 = old_entry["sha1"]
+    else:
+        sha1 = file_sha1(path)
+    return {"mtime": st.st_mtime, "size": st.st_size, "sha1": sha1, "label": label_id}
 
-    images_np = np.array(images, dtype=np.uint8)
-    labels_np = np.array(labels, dtype=np.int32)
 
-    recognizer = cv2.face.LBPHFaceRecognizer_create(
+def create_recognizer():
+    return cv2.face.LBPHFaceRecognizer_create(
         radius=1,
         neighbors=8,
         grid_x=8,
         grid_y=8,
     )
 
-    print("Train LBPH...")
-    recognizer.train(images_np, labels_np)
-    recognizer.save(MODEL_PATH)
+
+def save_outputs(recognizer, id_to_name, files):
+    save_model_atomic(recognizer, MODEL_PATH)
     print(f"Đã lưu model: {MODEL_PATH}")
 
-    with open(LABELS_PATH, "w", encoding="utf-8") as f:
-        json.dump(id_to_name, f, ensure_ascii=False, indent=2)
+    write_json_atomic(LABELS_PATH, {str(k): v for k, v in id_to_name.items()})
     print(f"Đã lưu label map: {LABELS_PATH}")
 
+    write_json_atomic(MANIFEST_PATH, {"files": files})
+
+
+# ======== TRAIN ========
+def train_full():
+    """Train lại LBPH từ đầu trên toàn bộ faces/."""
+    images, labels, id_to_name = load_face_dataset()
+
+    print(f"Tổng ảnh: {len(images)}, số người: {len(id_to_name)}")
+
+    recognizer = create_recognizer()
+
+    print("Train LBPH...")
+    recognizer.train(images, labels)
+
+    # manifest cũ (nếu có) giúp bỏ qua hash lại các file không đổi mtime/size
+    old_files = (load_manifest() or {}).get("files", {})
+    name_to_id = {v: k for k, v in id_to_name.items()}
+    files = {}
+    for name, paths in scan_faces_dir().items():
+        for path in paths:
+            files[path] = file_entry(path, name_to_id[name], old_files.get(path))
+
+    save_outputs(recognizer, id_to_name, files)
+
+
+def train_incremental():
+    """
+    Chỉ train thêm ảnh mới bằng LBPH.update().
+    LBPH không "quên" được ảnh cũ, nên nếu có ảnh bị sửa / xoá thì train lại từ đầu.
+    Trả về False nếu phải train full.
+    """
+    manifest = load_manifest()
+    if manifest is None or not os.path.exists(MODEL_PATH) or not os.path.exists(LABELS_PATH):
+        print("Chưa có model / manifest, train từ đầu.")
+        return False
+
+    with open(LABELS_PATH, "r", encoding="utf-8") as f:
+        id_to_name = {int(k): v for k, v in json.load(f).items()}
+    name_to_id = {v: k for k, v in id_to_name.items()}
+
+    old_files = manifest["files"]
+    files = {}
+    new_paths = []
+
+    for name, paths in scan_faces_dir().items():
+        if name not in name_to_id:
+            label_id = max(id_to_name, default=-1) + 1
+            id_to_name[label_id] = name
+            name_to_id[name] = label_id
+            print(f"Người mới: {name} (id {label_id})")
+
+        for path in paths:
+            old = old_files.get(path)
+            entry = file_entry(path, name_to_id[name], old)
+            if old is None:
+                new_paths.append(path)
+            elif old["sha1"] != entry["sha1"] or old["label"] != entry["label"]:
+                print(f"Ảnh đã thay đổi: {path}")
+                return False
+            files[path] = entry
+
+    removed = set(old_files) - set(files)
+    if removed:
+        print(f"Có {len(removed)} ảnh bị xoá.")
+        return False
+
+    if not new_paths:
+        print("Không có ảnh mới, giữ nguyên model.")
+        return True
+
+    images = []
+    labels = []
+    for path in new_paths:
+        img = read_face(path)
+        if img is None:
+            print(f"  Bỏ qua file (không đọc được): {path}")
+            continue
+        images.append(img)
+        labels.append(files[path]["label"])
+
+    print(f"Train thêm {len(images)} ảnh mới...")
+    recognizer = create_recognizer()
+    recognizer.read(MODEL_PATH)
+    if images:
+        recognizer.update(np.array(images, dtype=np.uint8), np.array(labels, dtype=np.int32))
+
+    save_outputs(recognizer, id_to_name, files)
+    return True
+
+
+def main():
+    """
+    python train_face_recognizer.py          -> chỉ train thêm ảnh mới (nếu được)
+    python train_face_recognizer.py --full   -> train lại từ đầu
+    """
+    os.makedirs(MODELS_DIR, exist_ok=True)
+
+    if "--full" in sys.argv[1:] or not train_incremental():
+        train_full()
+
 
 if __name__ == "__main__":
     main()
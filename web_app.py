@@ -1,17 +1,19 @@
 # web_app.py
-import cv2
-import threading
-from flask import Flask, Response, render_template
+import os
+import time
+from datetime import datetime
 
-from camera_stream import camera_Stream
-from detector import personDetector
-from alert_manager import AlertManager
-from face_recognizer import FaceRecognizer
+from flask import Flask, Response, abort, jsonify, render_template, request, send_file
+
+from broadcaster import AdaptiveQuality, encode_variant, parse_stream_args
+from metrics import CONTENT_TYPE, REGISTRY
+from multi_camera import MultiCameraRunner
 
 try:
-    from notifier import TelegramNotifier
+    from notifier import TelegramNotifier, AlertDigest
 except ImportError:
     TelegramNotifier = None
+    AlertDigest = None
 
 
 app = Flask(__name__)
@@ -34,27 +36,20 @@ def create_notifier():
 
 
 # ======== KHỞI TẠO CÁC MODULE GIỐNG main() ========
-person_detector = personDetector(
-    model_path="yolov8n.pt",
-    conf_threshold=0.5,
-    img_size=320,
-)
-
-face_recognizer = FaceRecognizer(
-    model_path="Models/face_lbph.xml",
-    labels_path="Models/face_labels.json",
-    threshold=80.0,
-)
-
-alerts = AlertManager(output_dir="alerts", min_interval=8.0)
-camera = camera_Stream(device_index=0)
+# danh sách camera + ngưỡng đọc từ cameras.json (không có file -> 1 camera index 0 như cũ)
+CAMERA_CONFIG = os.environ.get("CAMERA_CONFIG", "cameras.json")
+
 notifier = create_notifier()
+# gom cảnh báo trong 30s thành 1 album (tối đa 10 ảnh) thay vì mỗi ảnh 1 tin
+digest = AlertDigest(notifier, window=30.0) if notifier is not None else None
 
-# state dùng chung giữa các frame
-UNKNOWN_STREAK_LIMIT = 10
-unknown_streak = 0
-frame_idx = 0
-last_person_dets = []
+# 1 YOLO + 1 bộ nhận diện mặt dùng chung cho mọi camera,
+# mỗi camera 1 pipeline + 1 broadcaster (xử lý 1 lần cho mọi người xem)
+runner = MultiCameraRunner.from_file(CAMERA_CONFIG, notifier=notifier, digest=digest)
+# phát hiện + cảnh báo chạy ngay cho mọi camera, không phụ thuộc có người đang xem stream
+runner.start()
+processor = runner.get().processor
+broadcaster = runner.get().broadcaster
 
 
 def process_frame(frame):
@@ -62,124 +57,31 @@ def process_frame(frame):
     Toàn bộ logic nhận diện + cảnh báo của bạn,
     chỉ bỏ phần imshow/waitKey đi.
     """
-    global unknown_streak, frame_idx, last_person_dets
-
-    frame_idx += 1
-
-    # 1. Phát hiện người (body) – YOLO, skip mỗi 3 frame
-    if frame_idx % 3 == 0:
-        person_dets = person_detector.detect(frame)
-        last_person_dets = person_dets
-    else:
-        person_dets = last_person_dets
-
-    person_detector.draw_detections(frame, person_dets)
-
-    # 2. Nhận diện mặt (known / unknown)
-    face_results = face_recognizer.recognize(frame)
-    face_recognizer.draw_faces(frame, face_results)
-
-    # 3. Quyết định trạng thái
-    any_known = any(f["is_known"] for f in face_results)
-    any_unknown = any(not f["is_known"] for f in face_results)
-    any_person = len(person_dets) > 0
-
-    if any_unknown or (any_person and not any_known):
-        unknown_streak += 1
-    else:
-        unknown_streak = 0
-
-    status_text = "NO PERSON"
-
-    # 3.1. Unknown nhiều frame liên tiếp → xâm nhập
-    if unknown_streak >= UNKNOWN_STREAK_LIMIT:
-        status_text = "INTRUDER (Unknown / body)"
-        alerts.draw_banner(frame, text="INTRUDER DETECTED")
-
-        saved_path = alerts.maybe_save_frame(frame)
-        if saved_path is not None:
-            print(f"[ALERT] Đã lưu ảnh cảnh báo: {saved_path}")
-            if notifier is not None:
-                threading.Thread(
-                    target=notifier.send_alert,
-                    args=("Cảnh báo: phát hiện người lạ trước camera!", saved_path),
-                    daemon=True,
-                ).start()
-
-    # 3.2. Có ít nhất 1 người quen, không có unknown
-    elif any_known:
-        known_names = {f["name"] for f in face_results if f["is_known"]}
-        status_text = "KNOWN: " + ", ".join(known_names)
-
-        h, w, _ = frame.shape
-        cv2.rectangle(frame, (0, 0), (w, 40), (0, 150, 0), thickness=-1)
-        cv2.putText(
-            frame,
-            status_text,
-            (10, 28),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.8,
-            (255, 255, 255),
-            2,
-        )
-
-    # 3.3. Thấy body nhưng không nhận diện được mặt
-    elif any_person:
-        status_text = "INTRUDER (Body only)"
-        alerts.draw_banner(frame, text="INTRUDER DETECTED")
-
-        saved_path = alerts.maybe_save_frame(frame)
-        if saved_path is not None:
-            print(f"[ALERT] Body detected, đã lưu ảnh: {saved_path}")
-            if notifier is not None:
-                threading.Thread(
-                    target=notifier.send_alert,
-                    args=(
-                        "Cảnh báo: phát hiện người (body) nhưng không nhận diện được mặt!",
-                        saved_path,
-                    ),
-                    daemon=True,
-                ).start()
-
-    # 4. Vẽ trạng thái ở dưới
-    cv2.putText(
-        frame,
-        status_text,
-        (10, frame.shape[0] - 10),
-        cv2.FONT_HERSHEY_SIMPLEX,
-        0.6,
-        (255, 255, 0),
-        2,
-    )
-
-    # 5. Thu nhỏ cho nhẹ khi stream
-    h, w = frame.shape[:2]
-    max_width = 800
-    if w > max_width:
-        scale = max_width / w
-        new_w = int(w * scale)
-        new_h = int(h * scale)
-        frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_AREA)
-
-    return frame
+    return processor.process_frame(frame)["output"]
 
 
-def gen_frames():
-    """Đọc camera_Stream + xử lý + trả về MJPEG cho <img>."""
-    while True:
-        ok, frame = camera.read()
-        if not ok:
+def gen_frames(broadcaster, width=800, quality=None, max_fps=15.0):
+    """
+    Lấy frame từ broadcaster, trả về MJPEG cho <img>.
+    Chất lượng JPEG / fps tự giảm khi client nhận chậm (trừ khi cố định quality).
+    """
+    rate = AdaptiveQuality(quality=quality, max_fps=max_fps)
+    next_time = 0.0
+    for item in broadcaster.subscribe():
+        if time.monotonic() < next_time:
+            continue   # chưa tới lượt client này -> bỏ frame
+        jpeg = encode_variant(item, width, rate.quality)
+        if jpeg is None:
             continue
 
-        frame = process_frame(frame)
-
-        ret, buffer = cv2.imencode(".jpg", frame)
-        frame_bytes = buffer.tobytes()
-
+        start = time.monotonic()
         yield (
             b"--frame\r\n"
-            b"Content-Type: image/jpeg\r\n\r\n" + frame_bytes + b"\r\n"
+            b"Content-Type: image/jpeg\r\n\r\n" + jpeg + b"\r\n"
         )
+        # generator chạy tiếp khi server đã ghi xong chunk -> đo được backpressure
+        rate.record(time.monotonic() - start)
+        next_time = start + rate.interval
 
 
 @app.route("/")
@@ -188,12 +90,86 @@ def index():
 
 
 @app.route("/video_feed")
-def video_feed():
+@app.route("/video_feed/<camera_id>")
+def video_feed(camera_id=None):
+    # vd /video_feed/cam1?size=thumb&fps=5 cho điện thoại dùng 4G
+    unit = runner.get(camera_id)
+    if unit is None:
+        abort(404)
     return Response(
-        gen_frames(),
+        gen_frames(unit.broadcaster, *parse_stream_args(request.args.to_dict())),
         mimetype="multipart/x-mixed-replace; boundary=frame",
     )
 
 
+def parse_time(value):
+    """'1760000000' (epoch) hoặc ISO '2026-10-13' / '2026-10-13T08:30' (giờ máy) -> epoch giây."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+@app.route("/api/events")
+def api_events():
+    """
+    Tra cứu sự kiện cảnh báo, mới nhất trước, phân trang bằng cursor:
+    /api/events?camera=gate&kind=unknown&start=2026-10-13&end=2026-10-14&limit=50
+    -> {"events": [...], "next_cursor": 123}; trang sau: thêm &cursor=123
+    kind: unknown (mặt lạ) / body (chỉ thấy người); name=<tên> lọc theo người quen đã nhận ra
+    (người lạ không có tên trong sự kiện, lọc bằng kind=unknown).
+    """
+    if runner.event_store is None:
+        abort(404)
+    args = request.args
+    try:
+        events, next_cursor = runner.event_store.query(
+            start=parse_time(args.get("start")),
+            end=parse_time(args.get("end")),
+            camera=args.get("camera"),
+            name=args.get("name"),
+            kind=args.get("kind"),
+            limit=args.get("limit", 50, type=int),
+            before_id=args.get("cursor", type=int),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    for e in events:
+        e["image_url"] = f"/api/events/{e['id']}/image" if e["image_path"] else None
+        e["clip_url"] = f"/api/events/{e['id']}/clip" if e["clip_path"] else None
+    return jsonify({"events": events, "next_cursor": next_cursor})
+
+
+def _event_file(event_id, field, mimetype):
+    if runner.event_store is None:
+        abort(404)
+    event = runner.event_store.get(event_id)
+    if event is None or not event[field] or not os.path.exists(event[field]):
+        abort(404)   # clip có thể chưa ghi xong (còn đang gom phần sau sự kiện)
+    return send_file(os.path.abspath(event[field]), mimetype=mimetype)
+
+
+@app.route("/api/events/<int:event_id>/image")
+def api_event_image(event_id):
+    return _event_file(event_id, "image_path", "image/jpeg")
+
+
+@app.route("/api/events/<int:event_id>/clip")
+def api_event_clip(event_id):
+    return _event_file(event_id, "clip_path", "video/mp4")
+
+
+@app.route("/metrics")
+def metrics():
+    # text format Prometheus, cho Prometheus / Grafana scrape
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    try:
+        app.run(host="0.0.0.0", port=5000, debug=False)
+    finally:
+        runner.release()
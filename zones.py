@@ -0,0 +1,225 @@
+import cv2
+import numpy as np
+
+# Vùng (polygon) và tripwire (đoạn thẳng) cho từng camera, khai báo trong cameras.json:
+#   "zones": [
+#     {"name": "san", "points": [[100, 400], [900, 380], [1200, 720], [0, 720]]},
+#     {"name": "cong", "type": "tripwire", "points": [[600, 300], [600, 700]], "direction": "right"}
+#   ]
+# Toạ độ theo pixel của frame camera, hoặc tỉ lệ 0..1 nếu mọi giá trị <= 1.
+# Người được xét theo điểm chân (giữa cạnh dưới bbox).
+
+DIRECTIONS = ("any", "left", "right")
+
+
+def foot_points(detections):
+    """Điểm chân (giữa cạnh dưới bbox) của mảng DET_DTYPE hoặc (N, 4) xyxy -> (N, 2) float32."""
+    if getattr(detections, "dtype", None) is not None and detections.dtype.names:
+        detections = detections["xyxy"]
+    boxes = np.asarray(detections, dtype=np.float32).reshape(-1, 4)
+    return np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, boxes[:, 3]], axis=1)
+
+
+def points_in_polygon(points, polygon):
+    """
+    Ray casting cho N điểm cùng lúc: points (N, 2), polygon (M, 2) -> bool (N,).
+    Mỗi cạnh được xét cho mọi điểm bằng broadcasting (N, M), không có vòng lặp Python.
+    """
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+    poly = np.asarray(polygon, dtype=np.float32)
+    x, y = points[:, 0:1], points[:, 1:2]
+    x1, y1 = poly[:, 0], poly[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+
+    straddle = (y1 > y) != (y2 > y)
+    dy = np.where(y2 == y1, 1e-6, y2 - y1)
+    x_cross = x1 + (y - y1) * (x2 - x1) / dy
+    return np.count_nonzero(straddle & (x < x_cross), axis=1) % 2 == 1
+
+
+def _cross(o, a, b):
+    """Tích có hướng (a - o) x (b - o), broadcast theo mọi chiều đầu."""
+    return (a[..., 0] - o[..., 0]) * (b[..., 1] - o[..., 1]) - (a[..., 1] - o[..., 1]) * (b[..., 0] - o[..., 0])
+
+
+def segment_crossings(starts, ends, lines):
+    """
+    N đoạn di chuyển (starts -> ends, (N, 2)) cắt L tripwire (lines (L, 2, 2)) không.
+    Trả về (crossed bool (N, L), side (N, L)): side >= 0 = sau khi cắt người ở bên phải
+    của hướng a -> b trên ảnh (trục y hướng xuống), < 0 = bên trái.
+    """
+    p = np.asarray(starts, dtype=np.float32)[:, None, :]
+    q = np.asarray(ends, dtype=np.float32)[:, None, :]
+    a = np.asarray(lines, dtype=np.float32)[None, :, 0, :]
+    b = np.asarray(lines, dtype=np.float32)[None, :, 1, :]
+
+    side_p = _cross(a, b, p)
+    side_q = _cross(a, b, q)
+    d1 = _cross(p, q, a)
+    d2 = _cross(p, q, b)
+    # điểm nằm đúng trên tripwire tính là bên phải, để đi qua nó vẫn bắt được đúng 1 lần
+    crossed = ((side_p >= 0) != (side_q >= 0)) & (d1 * d2 <= 0)
+    return crossed, side_q
+
+
+class ZoneSet:
+    """
+    Các vùng + tripwire của 1 camera:
+    - update(dets): điểm chân trong vùng nào, track nào vừa cắt tripwire nào (dựa vào điểm chân
+      lần detect trước của cùng track), tính vector hoá cho cả mảng detection;
+    - roi(): khung bao các vùng -> chỉ đưa phần ảnh này vào YOLO / motion gate;
+    - contains(): điểm bất kỳ có nằm trong vùng nào không.
+    Không khai báo gì -> mọi người đều được xét như bản cũ.
+    """
+
+    def __init__(self, zones=(), roi_margin: float = 0.05, roi_headroom: float = 0.5,
+                 tripwire_margin: float = 0.2):
+        """
+        roi_margin: nới khung ROI mỗi bên (tỉ lệ kích thước frame).
+        tripwire_margin: như roi_margin nhưng cho tripwire – phải thấy người ở cả 2 phía mới biết cắt qua.
+        roi_headroom: nới thêm lên trên (tỉ lệ chiều cao frame) vì vùng vẽ trên mặt đất
+                      còn thân người nằm phía trên điểm chân.
+        """
+        # toạ độ như khai báo (pixel hoặc tỉ lệ); polygons / tripwires là bản pixel theo frame hiện tại
+        self._polygons_cfg = []     # (name, points)
+        self._tripwires_cfg = []    # (name, points (2, 2), direction)
+        for i, z in enumerate(zones or ()):
+            kind = z.get("type", "zone")
+            name = str(z.get("name", f"{kind}{i}"))
+            points = np.asarray(z["points"], dtype=np.float32).reshape(-1, 2)
+            if kind == "tripwire":
+                direction = z.get("direction", "any")
+                if len(points) != 2 or direction not in DIRECTIONS:
+                    raise ValueError(f"Tripwire '{name}' cần 2 điểm, direction thuộc {DIRECTIONS}")
+                self._tripwires_cfg.append((name, points, direction))
+            elif kind == "zone":
+                if len(points) < 3:
+                    raise ValueError(f"Vùng '{name}' cần ít nhất 3 điểm")
+                self._polygons_cfg.append((name, points))
+            else:
+                raise ValueError(f"Loại vùng không hợp lệ: {kind}")
+
+        self.roi_margin = roi_margin
+        self.roi_headroom = roi_headroom
+        self.tripwire_margin = tripwire_margin
+        self.polygons = list(self._polygons_cfg)
+        self.tripwires = list(self._tripwires_cfg)
+        self._size = None
+        self._roi = None
+        self._lines = None
+        self._last_foot = {}   # track_id -> điểm chân lần detect trước
+
+    def __bool__(self):
+        return bool(self.polygons or self.tripwires)
+
+    def _resolve(self, width: int, height: int):
+        """
+        Đổi toạ độ tỉ lệ (0..1) ra pixel theo kích thước frame thật (1 lần / kích thước).
+        Luôn tính từ toạ độ khai báo, nên đổi độ phân giải giữa chừng vẫn đúng.
+        """
+        if self._size == (width, height):
+            return
+        scale = np.array([width, height], dtype=np.float32)
+
+        def to_px(points):
+            return points * scale if points.max() <= 1.0 else points
+
+        self.polygons = [(n, to_px(p)) for n, p in self._polygons_cfg]
+        self.tripwires = [(n, to_px(p), d) for n, p, d in self._tripwires_cfg]
+        self._lines = np.stack([p for _, p, _ in self.tripwires]) if self.tripwires else None
+        self._size = (width, height)
+        self._roi = self._compute_roi(width, height)
+
+    def _compute_roi(self, width, height):
+        boxes = []
+        for points, margin in [(p, self.roi_margin) for _, p in self.polygons] + \
+                              [(p, self.tripwire_margin) for _, p, _ in self.tripwires]:
+            mx, my = margin * width, margin * height
+            x1, y1 = points.min(axis=0)
+            x2, y2 = points.max(axis=0)
+            boxes.append((x1 - mx, y1 - my - self.roi_headroom * height, x2 + mx, y2 + my))
+        boxes = np.array(boxes)
+        roi = (
+            int(max(0, boxes[:, 0].min())),
+            int(max(0, boxes[:, 1].min())),
+            int(min(width, boxes[:, 2].max())),
+            int(min(height, boxes[:, 3].max())),
+        )
+        # gần cả frame thì cắt cũng không lợi gì
+        if (roi[2] - roi[0]) * (roi[3] - roi[1]) > 0.9 * width * height:
+            return None
+        return roi
+
+    def roi(self, width: int, height: int):
+        """(x1, y1, x2, y2) phần frame cần đưa vào inference, None = cả frame."""
+        if not self:
+            return None
+        self._resolve(width, height)
+        return self._roi
+
+    def contains(self, points, width: int, height: int):
+        """bool (N,): điểm nằm trong ít nhất 1 vùng (không có polygon -> tất cả True)."""
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        if not self.polygons:
+            return np.ones(len(points), dtype=bool)
+        self._resolve(width, height)
+        inside = np.zeros(len(points), dtype=bool)
+        for _, poly in self.polygons:
+            inside |= points_in_polygon(points, poly)
+        return inside
+
+    def update(self, detections, width: int, height: int, alive_ids=None):
+        """
+        detections: mảng DET_DTYPE đã có track_id.
+        alive_ids: id các track tracker còn giữ (kể cả lần này detect hụt) -> giữ điểm chân cũ của
+        chúng, người lỡ 1 frame mà cắt tripwire đúng lúc đó vẫn bắt được. None = chỉ track trong detections.
+        Trả về (zone_names, crossed_names): 2 list dài N, mỗi phần tử là list tên vùng chứa
+        điểm chân / tên tripwire vừa bị cắt (theo đúng direction) ở lần detect này.
+        """
+        n = len(detections)
+        self._resolve(width, height)
+        feet = foot_points(detections)
+        track_ids = detections["track_id"].tolist()
+
+        zone_names = [[] for _ in range(n)]
+        for name, poly in self.polygons:
+            for i in np.flatnonzero(points_in_polygon(feet, poly)).tolist():
+                zone_names[i].append(name)
+
+        crossed_names = [[] for _ in range(n)]
+        if self._lines is not None and n:
+            has_prev = np.array([t in self._last_foot for t in track_ids], dtype=bool)
+            if has_prev.any():
+                idx = np.flatnonzero(has_prev)
+                starts = np.array([self._last_foot[track_ids[i]] for i in idx.tolist()], dtype=np.float32)
+                crossed, side = segment_crossings(starts, feet[idx], self._lines)
+                for j, (_, _, direction) in enumerate(self.tripwires):
+                    hit = crossed[:, j]
+                    if direction == "right":
+                        hit &= side[:, j] >= 0
+                    elif direction == "left":
+                        hit &= side[:, j] < 0
+                    for k in np.flatnonzero(hit).tolist():
+                        crossed_names[int(idx[k])].append(self.tripwires[j][0])
+
+        # điểm chân mới của track vừa thấy; track tạm mất giữ điểm cũ tới khi tracker xoá
+        alive = set(track_ids) if alive_ids is None else set(alive_ids)
+        last_foot = {t: p for t, p in self._last_foot.items() if t in alive}
+        last_foot.update((t, tuple(p)) for t, p in zip(track_ids, feet.tolist()) if t >= 0)
+        self._last_foot = last_foot
+        return zone_names, crossed_names
+
+    def draw(self, frame):
+        """Vẽ vùng (vàng) và tripwire (tím) lên frame."""
+        if not self:
+            return
+        h, w = frame.shape[:2]
+        self._resolve(w, h)
+        for name, poly in self.polygons:
+            pts = poly.astype(np.int32)
+            cv2.polylines(frame, [pts], True, (0, 200, 255), 2)
+            cv2.putText(frame, name, tuple(pts[0].tolist()), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 200, 255), 1)
+        for name, line, _ in self.tripwires:
+            a, b = (tuple(p) for p in line.astype(np.int32).tolist())
+            cv2.line(frame, a, b, (255, 0, 200), 2)
+            cv2.putText(frame, name, a, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 200), 1)